@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+u"""
+library api of the converters, to convert the annotations in process
+without the command line, eg: thousands of small annotations in one worker
+
+    from api import gtf2gff, gff2gtf, gtf2bed12
+
+    with open("sample.gff3", "w+") as w:
+        w.writelines(gtf2gff("sample.gtf", generate_genes=True))
+
+    lines = ["1\\tensembl\\texon\\t11869\\t12227\\t.\\t+\\t.\\tgene_id \\"G1\\"; transcript_id \\"T1\\";\\n"]
+    for line in gtf2bed12(lines):
+        print(line, end="")
+
+the source of every converter is a path (gtf, gff3, gzip or store), an
+iterable of lines, or an iterable of records (columns, Attributes) from
+store.open_records. the converters are generators of the output lines,
+nothing is written and no progressbar is shown
+
+the file to file conversions with all the options (threads, sort, bgzip
+...) are the classes of the scripts, eg:
+
+    Gtf2Gff("in.gtf", "out.gff3.gz", generate_genes=True, sort=True).convert()
+"""
+import os
+from itertools import chain, islice
+
+from attributes import iter_records
+from dialect import SAMPLE_SIZE, detect_dialect
+from gff2gtf import Gff2Gtf, ParentIndex
+from gtf2bed12 import Gtf2Bed12, TranscriptModel
+from gtf2gff import Gtf2Gff
+from projection import Projection
+from store import open_records
+
+__author__ = "Zhang Yiming"
+__since__ = "2026.10.17"
+
+
+__all__ = ["Gff2Gtf", "Gtf2Bed12", "Gtf2Gff", "records", "gff2gtf", "gtf2bed12", "gtf2gff"]
+
+
+def records(source, strip_prefix=False, dialect=None, keep=None):
+    u"""
+    :param source: path, iterable of lines or iterable of (columns, Attributes)
+    :param strip_prefix: remove the ensembl style 'type:' prefix of values, see Attributes
+    :param dialect: Dialect of source, detected from the first records if None
+    :param keep: function of feature type -> bool, the records of other types are skipped
+    :return: (generator of (columns, Attributes), Dialect)
+    """
+    if isinstance(source, (str, os.PathLike)):
+        if dialect is None:
+            sample = open_records(source)
+            try:
+                dialect = detect_dialect(sample, SAMPLE_SIZE)
+            finally:
+                sample.close()
+        return open_records(source, strip_prefix=strip_prefix, fmt=dialect.format, keep=keep), dialect
+
+    iterator = iter(source)
+    first = next(iterator, None)
+    if first is None:
+        iterator = iter(())
+    elif isinstance(first, str):
+        iterator = iter_records(chain([first], iterator), fmt=dialect.format if dialect else None,
+                                strip_prefix=strip_prefix, keep=keep)
+    else:
+        # the columns are copied, the converters write the 9th column back
+        iterator = (
+            (list(lines), attrs.view(strip_prefix)) if attrs is not None else (lines, None)
+            for lines, attrs in chain([first], iterator) if attrs is None or keep is None or keep(lines[2])
+        )
+
+    if dialect is None:
+        sample = list(islice(iterator, SAMPLE_SIZE))
+        dialect = detect_dialect(sample, SAMPLE_SIZE)
+        iterator = chain(sample, iterator)
+    return iterator, dialect
+
+
+def gtf2gff(source, generate_genes=False, dialect=None, header=True, feature_types=None, keep_attrs=None):
+    u"""
+    gtf to gff3, same as gtf2gff.py
+    :param source: path, iterable of lines or iterable of (columns, Attributes)
+    :param generate_genes: create the missing genes, see gtf2gff.py --gene
+    :param dialect: Dialect of source, detected from the first records if None
+    :param header: yield the ##gff-version line first
+    :param feature_types: list of the feature types to convert, None for all, see projection.py
+    :param keep_attrs: list of the attributes to write besides ID, Name and Parent, None for all
+    :return: generator of gff3 lines
+    """
+    projection = Projection(feature_types, keep_attrs, lower=True)
+    items, dialect = records(source, dialect=dialect, keep=projection.narrow())
+    if header:
+        yield "#gff-version 3\n"
+    items = Gtf2Gff.__format_lines__(items, generate_genes, dialect, projection)
+    yield from Gtf2Gff.__resolve_events__(items, set())
+
+
+def gff2gtf(source, dialect=None, feature_types=None, keep_attrs=None, header=True):
+    u"""
+    gff3 to gtf, same as gff2gtf.py
+    the children could appear before their parents, so the records of an
+    iterable source are kept in memory, and a path is read twice
+    :param source: path, iterable of lines or iterable of (columns, Attributes)
+    :param dialect: Dialect of source, detected from the first records if None
+    :param feature_types: list of the feature types to convert, None for all, see projection.py
+    :param keep_attrs: list of the attributes to write besides gene_id and transcript_id, None for all
+    :param header: yield the #gtf-version line first, as gff2gtf.py writes it
+    :return: generator of gtf lines, the comments are kept as they are
+    """
+    projection = Projection(feature_types, keep_attrs)
+    if isinstance(source, (str, os.PathLike)):
+        items, dialect = records(source, strip_prefix=True, dialect=dialect, keep=Gff2Gtf.__keep_index__)
+    else:
+        items, dialect = records(source, strip_prefix=True, dialect=dialect)
+        items = list(items)
+
+    index = ParentIndex()
+    Gff2Gtf.build_index(index, items)
+
+    if isinstance(source, (str, os.PathLike)):
+        items, _ = records(source, strip_prefix=True, dialect=dialect, keep=projection.narrow(Gff2Gtf.__keep__))
+    else:
+        items = projection.filter(items)
+
+    if header:
+        yield "#gtf-version 2.2\n"
+    yield from Gff2Gtf.__format_lines__(index, items, projection)
+
+
+def gtf2bed12(source, dialect=None, feature_types=None):
+    u"""
+    gtf or gff3 to bed12, same as gtf2bed12.py
+    :param source: path, iterable of lines or iterable of (columns, Attributes)
+    :param dialect: Dialect of source, detected from the first records if None
+    :param feature_types: list of the feature types to read, None for all, see projection.py
+    :return: generator of bed12 lines, in order of the transcripts
+    """
+    items, dialect = records(source, strip_prefix=True, dialect=dialect, keep=Projection(feature_types).narrow())
+
+    model = TranscriptModel(dialect)
+    add = model.add
+    for lines, data in items:
+        if data is not None:
+            add(lines, data)
+    yield from model.bed12()
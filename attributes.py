@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+u"""
+shared parser of the 9th column (attributes) of gtf and gff3
+
+gtf:  gene_id "G1"; transcript_id "T1"; tag "basic"; tag "CCDS";
+gff3: ID=transcript:T1;Parent=gene:G1;Name=A%3BB;Dbxref=GeneID:1,HGNC:2
+
+Attributes works on bytes as well as str. Nothing is tokenized when it is
+created, get() only searches for the requested key in the raw column and
+decodes that single value, the whole column is split only when all the
+attributes are needed (items, to_dict).
+"""
+from urllib.parse import unquote
+
+__author__ = "Zhang Yiming"
+__since__ = "2026.10.17"
+
+
+GTF = "gtf"
+GFF3 = "gff3"
+
+# separators for str and bytes columns: ; = space " , % :
+__TOKENS__ = {
+    str: (";", "=", " ", "\"", ",", "%", ":"),
+    bytes: (b";", b"=", b" ", b"\"", b",", b"%", b":"),
+}
+
+
+def detect_format(raw):
+    u"""
+    guess the attributes style from the first key value pair
+    :param raw: the 9th column, str or bytes
+    :return: GTF or GFF3
+    """
+    semi, equal, space = __TOKENS__[type(raw)][:3]
+    first = raw.lstrip().split(semi, 1)[0]
+    eq = first.find(equal)
+    if eq < 0:
+        return GTF
+    sp = first.find(space)
+    return GFF3 if sp < 0 or eq < sp else GTF
+
+
+def strip_type_prefix(value):
+    u"""
+    ensembl gff3 prefix the ids with feature type, eg: gene:ENSG00000223972
+    keep the same part as the original scripts did, value.split(":")[1]
+    """
+    colon = __TOKENS__[type(value)][6]
+    return value.split(colon)[1] if colon in value else value
+
+
+class Attributes(object):
+    u"""
+    lazy view over the attributes column of a single gtf or gff3 record
+    """
+
+    __slots__ = ("raw", "format", "strip_prefix", "__cache__", "__pairs__", "__raw_pairs__")
+
+    def __init__(self, raw, fmt=None, strip_prefix=False):
+        u"""
+        :param raw: the 9th column, str or bytes, tailing newline is fine
+        :param fmt: GTF or GFF3, None to detect from the column itself
+        :param strip_prefix: remove the ensembl style 'type:' prefix of values
+        """
+        self.raw = raw
+        self.format = fmt or detect_format(raw)
+        self.strip_prefix = strip_prefix
+        self.__cache__ = {}
+        self.__pairs__ = None
+        self.__raw_pairs__ = None
+
+    @classmethod
+    def from_pairs(cls, pairs, fmt, strip_prefix=False):
+        u"""
+        build from the key value pairs already split, eg: from store.py
+        :param pairs: list of (key, value), the values are not decoded, as raw_items()
+        :param fmt: GTF or GFF3
+        :param strip_prefix: remove the ensembl style 'type:' prefix of values
+        """
+        attrs = cls("", fmt=fmt, strip_prefix=strip_prefix)
+        attrs.raw = None
+        attrs.__raw_pairs__ = pairs
+        return attrs
+
+    def view(self, strip_prefix):
+        u"""
+        the same column with another strip_prefix, nothing is parsed again
+        but the decoded values, eg: for the converters sharing one record
+        """
+        if strip_prefix == self.strip_prefix:
+            return self
+        attrs = Attributes(self.raw, fmt=self.format, strip_prefix=strip_prefix)
+        attrs.__raw_pairs__ = self.__raw_pairs__
+        return attrs
+
+    def __find__(self, key):
+        u"""
+        locate the raw value of key without splitting the whole column
+        :param key: str or bytes with the same type of raw
+        :return: (start, end) of the value inside raw, or None
+        """
+        raw = self.raw
+        semi, equal, space, quote = __TOKENS__[type(raw)][:4]
+        sep = equal if self.format == GFF3 else space
+        size = len(key)
+        pos = raw.find(key)
+        while pos >= 0:
+            end = pos + size
+            # the key must be a whole token: start of column or after ;
+            before = pos - 1
+            while before >= 0 and raw[before:before + 1].isspace():
+                before -= 1
+            if (before < 0 or raw[before:before + 1] == semi) and raw[end:end + 1] == sep:
+                start = end + 1
+                if sep == space:
+                    while raw[start:start + 1] == space:
+                        start += 1
+                if raw[start:start + 1] == quote:
+                    start += 1
+                    stop = raw.find(quote, start)
+                else:
+                    stop = raw.find(semi, start)
+                if stop < 0:
+                    stop = len(raw.rstrip())
+                return start, stop
+            pos = raw.find(key, end)
+        return None
+
+    def __decode__(self, value):
+        u"""
+        convert the raw value into str
+        """
+        if isinstance(value, bytes):
+            value = value.decode("utf-8")
+        value = value.strip().strip("\"")
+        if self.strip_prefix:
+            value = strip_type_prefix(value)
+        if self.format == GFF3 and "%" in value:
+            value = unquote(value)
+        return value
+
+    def get(self, key, default=None):
+        u"""
+        value of a single key, only this value is decoded
+        :param key: attribute name, str
+        :param default: returned if the key is missing
+        :return: str
+        """
+        if key in self.__cache__:
+            return self.__cache__[key]
+
+        if self.__pairs__ is not None:
+            for k, v in self.__pairs__:
+                if k == key:
+                    self.__cache__[key] = v
+                    return v
+            return default
+
+        if self.raw is None:
+            value = self.__raw_value__(key)
+            if value is None:
+                return default
+            value = self.__decode__(value)
+            self.__cache__[key] = value
+            return value
+
+        raw_key = key.encode("utf-8") if isinstance(self.raw, bytes) else key
+        span = self.__find__(raw_key)
+        if span is None:
+            return default
+
+        value = self.__decode__(self.raw[span[0]:span[1]])
+        self.__cache__[key] = value
+        return value
+
+    def __raw_value__(self, key):
+        u"""
+        undecoded value from the pairs given to from_pairs
+        """
+        for k, v in self.__raw_pairs__:
+            if k == key:
+                return v
+        return None
+
+    def get_list(self, key):
+        u"""
+        gff3 multi-value attributes, eg: Parent=T1,T2 or Dbxref=GeneID:1,HGNC:2
+        the commas are split before percent decoding, so %2C stays inside a value
+        :return: list of str, empty if key is missing
+        """
+        if self.raw is None:
+            value = self.__raw_value__(key)
+            return [self.__decode__(x) for x in value.split(",")] if value is not None else []
+
+        raw_key = key.encode("utf-8") if isinstance(self.raw, bytes) else key
+        span = self.__find__(raw_key)
+        if span is None:
+            return []
+        comma = __TOKENS__[type(self.raw)][4]
+        return [self.__decode__(x) for x in self.raw[span[0]:span[1]].split(comma)]
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def items(self):
+        u"""
+        all the key value pairs in the original order
+        repeated gtf keys (eg: tag "basic"; tag "CCDS") are kept as they are
+        :return: list of (str, str)
+        """
+        if self.__pairs__ is None:
+            gff = self.format == GFF3
+            strip_prefix = self.strip_prefix
+
+            pairs = []
+            for key, value in self.raw_items():
+                if strip_prefix and ":" in value:
+                    value = value.split(":")[1]
+                if gff and "%" in value:
+                    value = unquote(value)
+                pairs.append((key, value))
+            self.__pairs__ = pairs
+        return self.__pairs__
+
+    def raw_items(self):
+        u"""
+        all the key value pairs without quotes, but not decoded
+        :return: list of (str, str)
+        """
+        if self.__raw_pairs__ is None:
+            # every value is needed, decoding the column once is cheaper
+            raw = self.raw.decode("utf-8") if isinstance(self.raw, bytes) else self.raw
+            sep = "=" if self.format == GFF3 else " "
+
+            pairs = []
+            for message in raw.split(";"):
+                key, _, value = message.strip().partition(sep)
+                if key:
+                    pairs.append((key, value.strip(" \"")))
+            self.__raw_pairs__ = pairs
+        return self.__raw_pairs__
+
+    def keys(self):
+        return [x[0] for x in self.items()]
+
+    def to_dict(self, lower=False, keys=None):
+        u"""
+        :param lower: lower case the keys, as gtf2gff and gtf2bed12 did
+        :param keys: set of the keys to keep (lower case if lower), only their values
+                     are decoded, None to keep all, see projection.py
+        :return: dict, the last value wins for repeated keys
+        """
+        if keys is None:
+            if lower:
+                return {k.lower(): v for k, v in self.items()}
+            return dict(self.items())
+
+        # the column is still split, but the other values are never decoded
+        pairs = self.__pairs__
+        res = {}
+        for key, value in pairs if pairs is not None else self.raw_items():
+            if lower:
+                key = key.lower()
+            if key in keys:
+                res[key] = value if pairs is not None else self.__decode_item__(value)
+        return res
+
+    def __decode_item__(self, value):
+        u"""
+        decode a value of raw_items, same as items()
+        """
+        if self.strip_prefix and ":" in value:
+            value = value.split(":")[1]
+        if self.format == GFF3 and "%" in value:
+            value = unquote(value)
+        return value
+
+
+def parse_attributes(raw, fmt=None, strip_prefix=False, lower=False):
+    u"""
+    shortcut of Attributes(raw).to_dict()
+    """
+    return Attributes(raw, fmt=fmt, strip_prefix=strip_prefix).to_dict(lower=lower)
+
+
+def iter_records(reader, fmt=None, strip_prefix=False, keep=None):
+    u"""
+    split the lines of gtf or gff3 into records
+    :param reader: iterable of lines
+    :param fmt: GTF or GFF3, None to detect from every record
+    :param strip_prefix: see Attributes
+    :param keep: function of feature type -> bool, the records of other types are skipped
+                 before their Attributes are created, None to keep all
+    :return: generator of (columns, Attributes), the 9th column is kept as it is,
+             comment lines are yielded as (line, None)
+    """
+    if keep is None:
+        for line in reader:
+            if line.startswith("#"):
+                yield line, None
+                continue
+
+            lines = line.split("\t")
+            yield lines, Attributes(lines[8], fmt=fmt, strip_prefix=strip_prefix)
+        return
+
+    # feature type -> kept or not, keep is called once per type
+    labels = {}
+    for line in reader:
+        if line.startswith("#"):
+            yield line, None
+            continue
+
+        lines = line.split("\t")
+        kept = labels.get(lines[2])
+        if kept is None:
+            kept = labels[lines[2]] = keep(lines[2])
+        if kept:
+            yield lines, Attributes(lines[8], fmt=fmt, strip_prefix=strip_prefix)
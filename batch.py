@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+u"""
+convert many annotation files in one process pool
+
+python batch.py -i "samples/*.gtf" -o out --to bed12
+python batch.py -m manifest.txt -o out --to gff3,bed12 -p 8 --memory 16000
+
+the inputs are globs (-i) or a manifest (-m), one input per line, with an
+optional prefix of outputs in the second column (tab separated). every
+input is converted by convert.Converter in the worker processes, which are
+started once, so the interpreter and the modules are loaded once per worker
+instead of once per file
+
+memory: the memory of a file is estimated from its size, a file is started
+only if the estimated memory of the running files is within the budget, a
+file larger than the budget is converted alone
+
+the errors of a file are reported in the summary, the outputs of a failed
+file are removed and the other files go on. if a worker is killed by the
+system (eg: out of memory), the pool is restarted and the files it was
+running are retried one at a time, the file killed again fails
+"""
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from convert import TARGETS, Converter
+from fileio import is_gzip
+from profiling import peak_rss
+
+__author__ = "Zhang Yiming"
+__since__ = "2026.10.17"
+
+
+# estimated peak memory per MB of uncompressed input, by target
+MEMORY_FACTOR = {"gff3": 0.5, "gtf": 1.0, "bed12": 2.5, "genes": 2.5, "introns": 2.5, "metaexons": 2.5}
+
+# memory of a worker process without any input, in MB
+WORKER_MEMORY = 80
+
+# ratio of uncompressed to gzip size, used to estimate the gzip inputs
+GZIP_RATIO = 8
+
+# the last characters of the messages of a failed file kept in the summary
+LOG_SIZE = 4096
+
+
+def available_cores():
+    u"""
+    number of cores this process could run on
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def output_prefix(path, outdir):
+    u"""
+    out/sample for sample.gtf, sample.gff3.gz and so on
+    """
+    name = os.path.basename(path)
+    for suffix in (".gz", ".bgz", ".store", ".gtf", ".gff3", ".gff"):
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+    return os.path.join(outdir, name)
+
+
+def collect_inputs(patterns=(), manifest=None, outdir="."):
+    u"""
+    :param patterns: list of globs
+    :param manifest: path to the list of inputs, and optional prefix of outputs
+    :param outdir: directory of the outputs without prefix
+    :return: list of (input, prefix of outputs)
+    """
+    jobs = []
+    for pattern in patterns:
+        paths = sorted(glob.glob(pattern))
+        if not paths:
+            print("%s matches no file" % pattern, file=sys.stderr)
+        jobs.extend((x, output_prefix(x, outdir)) for x in paths)
+
+    if manifest:
+        with open(manifest) as r:
+            for line in r:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                columns = line.split("\t")
+                jobs.append((columns[0], columns[1] if len(columns) > 1 else output_prefix(columns[0], outdir)))
+
+    # the same prefix would be overwritten by another input
+    seen = {}
+    for path, prefix in jobs:
+        if prefix in seen and seen[prefix] != path:
+            raise ValueError("%s and %s have the same output %s" % (seen[prefix], path, prefix))
+        seen[prefix] = path
+    return jobs
+
+
+def estimate_memory(path, targets):
+    u"""
+    :return: estimated peak memory of converting path in MB
+    """
+    size = os.path.getsize(path) / 1024 / 1024
+    if is_gzip(path):
+        size *= GZIP_RATIO
+    return WORKER_MEMORY + size * max(MEMORY_FACTOR.get(x, 1.0) for x in targets)
+
+
+def __convert_file__(args):
+    u"""
+    convert a file in the worker process, the errors are returned instead of raised
+    :param args: (input, prefix of outputs, targets, generate genes, bgzip)
+    :return: dict of the result
+    """
+    path, prefix, targets, generate_genes, bgzip = args
+    result = {"input": path, "prefix": prefix, "ok": False, "outputs": [], "error": None}
+    begin = time.time()
+
+    # the progressbars and messages of a file are dropped, unless it fails
+    log = io.StringIO()
+    converter = None
+    try:
+        with contextlib.redirect_stderr(log):
+            converter = Converter(path, prefix, targets, generate_genes, bgzip)
+            result["outputs"] = converter.convert()
+        result["ok"] = True
+    except Exception as err:
+        result["error"] = "%s: %s" % (type(err).__name__, err)
+        result["traceback"] = traceback.format_exc()
+        result["log"] = log.getvalue()[-LOG_SIZE:]
+        if converter is not None:
+            for target in targets:
+                for output in (converter.path(target), converter.path(target) + ".tbi"):
+                    if os.path.exists(output):
+                        os.remove(output)
+
+    result["seconds"] = time.time() - begin
+    result["size"] = os.path.getsize(path) if os.path.exists(path) else 0
+    result["worker_peak_rss_mb"] = round(peak_rss(), 1)
+    return result
+
+
+class Batch(object):
+    u"""
+    convert the inputs by a process pool within the memory budget
+    """
+
+    def __init__(self, jobs, targets, generate_genes=False, bgzip=False, processes=None, memory=None):
+        u"""
+        :param jobs: list of (input, prefix of outputs), see collect_inputs
+        :param targets: list of convert.TARGETS
+        :param generate_genes: create the missing genes of gff3, see gtf2gff.py
+        :param bgzip: compress the outputs by BGZF
+        :param processes: number of workers, default the available cores
+        :param memory: total memory budget in MB, None for no limit
+        """
+        for target in targets:
+            if target not in TARGETS:
+                raise ValueError("unknown target %s, choose from %s" % (target, ",".join(TARGETS.keys())))
+
+        self.jobs = jobs
+        self.targets = targets
+        self.generate_genes = generate_genes
+        self.bgzip = bgzip
+        self.processes = max(processes or available_cores(), 1)
+        self.memory = memory
+        self.results = []
+
+    def __fits__(self, used, job, running):
+        u"""
+        whether the job could be started now
+        :param used: estimated memory of the running jobs
+        :param job: (input, prefix, estimated memory, retried)
+        :param running: the running jobs
+        """
+        if not running:
+            return True
+        # the files retried after a killed worker run alone, to find out which one was killed
+        if job[3] or any(x[3] for x in running.values()):
+            return False
+        return self.memory is None or used + job[2] <= self.memory
+
+    def run(self):
+        u"""
+        :return: list of results in the order of jobs
+        """
+        pending = []
+        for path, prefix in self.jobs:
+            if not os.path.isfile(path):
+                self.__finish__({
+                    "input": path, "prefix": prefix, "ok": False, "outputs": [],
+                    "error": "FileNotFoundError: %s not found" % path, "seconds": 0, "size": 0,
+                })
+                continue
+            out_dir = os.path.dirname(os.path.abspath(prefix))
+            if not os.path.exists(out_dir):
+                os.makedirs(out_dir)
+            pending.append((path, prefix, estimate_memory(path, self.targets), False))
+
+        # start the large files first, the small ones fill the gaps at the end
+        pending.sort(key=lambda x: -x[2])
+        running = {}
+        used = 0
+
+        executor = ProcessPoolExecutor(self.processes)
+        try:
+            while pending or running:
+                # the smaller files could start while a large one waits for memory
+                for job in list(pending):
+                    if len(running) >= self.processes:
+                        break
+                    if self.__fits__(used, job, running):
+                        pending.remove(job)
+                        args = (job[0], job[1], self.targets, self.generate_genes, self.bgzip)
+                        running[executor.submit(__convert_file__, args)] = job
+                        used += job[2]
+
+                done, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+                broken = False
+                for future in done:
+                    job = running.pop(future)
+                    used -= job[2]
+                    try:
+                        self.__finish__(future.result())
+                    except BrokenProcessPool:
+                        broken = True
+                        if job[3]:
+                            self.__finish__({
+                                "input": job[0], "prefix": job[1], "ok": False, "outputs": [],
+                                "error": "the worker was killed, eg: out of memory", "seconds": 0,
+                                "size": os.path.getsize(job[0]),
+                            })
+                        else:
+                            pending.insert(0, job[:3] + (True,))
+
+                if broken:
+                    # the other running files are lost with the pool, they are retried one by one
+                    for job in running.values():
+                        pending.insert(0, job[:3] + (True,))
+                    running.clear()
+                    used = 0
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    executor = ProcessPoolExecutor(self.processes)
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+        order = {x[0]: i for i, x in enumerate(self.jobs)}
+        self.results.sort(key=lambda x: order.get(x["input"], 0))
+        return self.results
+
+    def __finish__(self, result):
+        self.results.append(result)
+        finished = len(self.results)
+        print("[%d/%d] %s %s %.2fs%s" % (
+            finished, len(self.jobs), "done" if result["ok"] else "failed",
+            result["input"], result["seconds"], "" if result["ok"] else " " + result["error"]
+        ), file=sys.stderr)
+
+
+def summary(results, seconds):
+    u"""
+    :param results: from Batch.run
+    :param seconds: the wall time
+    :return: dict of throughput and failures
+    """
+    ok = [x for x in results if x["ok"]]
+    size = sum(x["size"] for x in ok) / 1024 / 1024
+    return {
+        "files": len(results),
+        "succeeded": len(ok),
+        "failed": len(results) - len(ok),
+        "seconds": round(seconds, 3),
+        "input_mb": round(size, 2),
+        "files_per_second": round(len(ok) / seconds, 2) if seconds else 0,
+        "mb_per_second": round(size / seconds, 2) if seconds else 0,
+        "failures": [
+            {"input": x["input"], "error": x["error"], "log": x.get("log", "")} for x in results if not x["ok"]
+        ],
+    }
+
+
+def argument_parser():
+    u"""
+    argument_parser
+    """
+    parser = argparse.ArgumentParser(
+        description="Convert many gtf|gff3 files by a process pool"
+    )
+
+    parser.add_argument(
+        "-i",
+        "--input",
+        nargs="*",
+        default=[],
+        help="Globs of the input files, quote them to avoid the expansion of shell, eg: \"samples/*.gtf\""
+    )
+
+    parser.add_argument(
+        "-m",
+        "--manifest",
+        default=None,
+        help="Path to the list of input files, one per line, optional prefix of outputs in the second column"
+    )
+
+    parser.add_argument(
+        "-o",
+        "--output",
+        default=".",
+        help="Directory of output files, out/sample.bed for sample.gtf"
+    )
+
+    parser.add_argument(
+        "--to",
+        default="bed12",
+        help="Comma separated targets, %s" % ",".join(TARGETS.keys())
+    )
+
+    parser.add_argument(
+        "-g",
+        "--gene",
+        action="store_true",
+        default=False,
+        help="Create the missing genes while converting gtf to gff3, see gtf2gff.py"
+    )
+
+    parser.add_argument(
+        "-z",
+        "--bgzip",
+        action="store_true",
+        default=False,
+        help="Compress the outputs by BGZF, with tabix index if sorted"
+    )
+
+    parser.add_argument(
+        "-p",
+        "--processes",
+        type=int,
+        default=None,
+        help="Number of processes, default the available cores"
+    )
+
+    parser.add_argument(
+        "--memory",
+        type=int,
+        default=None,
+        help="Total memory budget in MB, the files are started only if their estimated memory fits"
+    )
+
+    parser.add_argument(
+        "-s",
+        "--summary",
+        default=None,
+        help="Path to the json summary of the throughput and failures"
+    )
+
+    if len(sys.argv[1:]) <= 0:
+        parser.print_help()
+        exit(0)
+
+    return parser.parse_args(sys.argv[1:])
+
+
+def main():
+    args = argument_parser()
+
+    jobs = collect_inputs(args.input, args.manifest, args.output)
+    if not jobs:
+        print("no input files", file=sys.stderr)
+        exit(1)
+
+    targets = [x.strip() for x in args.to.split(",") if x.strip()]
+    begin = time.time()
+    results = Batch(jobs, targets, args.gene, args.bgzip, args.processes, args.memory).run()
+    res = summary(results, time.time() - begin)
+
+    print("%d files converted, %d failed, %.1f MB in %.2fs, %.2f files/s, %.2f MB/s" % (
+        res["succeeded"], res["failed"], res["input_mb"], res["seconds"],
+        res["files_per_second"], res["mb_per_second"]
+    ), file=sys.stderr)
+    for failure in res["failures"]:
+        print("failed: %s %s" % (failure["input"], failure["error"]), file=sys.stderr)
+        # the progressbars are overwritten by \r, only their last state is kept
+        lines = [x.split("\r")[-1] for x in failure["log"].split("\n")]
+        for line in [x for x in lines if x.strip()][-10:]:
+            print("    %s" % line, file=sys.stderr)
+
+    if args.summary:
+        with open(args.summary, "w+") as w:
+            json.dump(res, w, indent=4)
+
+    if res["failed"]:
+        exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+u"""
+benchmarks of the converters
+
+attributes: the shared attributes parser against the per-script parsers
+            which were used before attributes.py
+converters: every converter on the synthetic annotations from synthetic.py,
+            every run is a new process, the wall time, lines/s, MB/s and peak
+            memory are saved as json to compare the runs across commits
+compare:    the ratios of two json reports from converters
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+
+from attributes import GFF3, GTF, Attributes
+from synthetic import SyntheticAnnotation
+
+__author__ = "Zhang Yiming"
+__since__ = "2026.10.17"
+
+
+__GTF_LINE__ = 'gene_id "ENSG00000223972.5"; transcript_id "ENST00000456328.2"; ' \
+               'gene_type "transcribed_unprocessed_pseudogene"; gene_name "DDX11L1"; ' \
+               'transcript_type "processed_transcript"; transcript_name "DDX11L1-202"; ' \
+               'exon_number 1; exon_id "ENSE00002234944.1"; level 2; transcript_support_level "1"; ' \
+               'hgnc_id "HGNC:37102"; tag "basic"; havana_gene "OTTHUMG00000000961.2";\n'
+
+__GFF_LINE__ = 'ID=exon-NM_001005484.2-1;Parent=rna-NM_001005484.2;' \
+               'Dbxref=GeneID:79501,GenBank:NM_001005484.2,HGNC:HGNC:14825;' \
+               'gbkey=mRNA;gene=OR4F5;product=olfactory receptor family 4 subfamily F member 5;' \
+               'tag=MANE Select;transcript_id=NM_001005484.2\n'
+
+
+def legacy_gff2gtf(line):
+    u"""
+    Gff2Gtf.split_gff_detail before attributes.py
+    """
+    res = {}
+    for i in line.split(";"):
+        i = i.split("=")
+        res[i[0]] = i[1] if ":" not in i[1] else i[1].split(":")[1]
+    return res
+
+
+def legacy_gtf2gff(line):
+    u"""
+    Gtf2Gff.__split_gtf_details__ before attributes.py
+    """
+    data = {}
+    for message in line.strip().split(";"):
+        if not message:
+            continue
+        key, value = message.strip().split(" ")
+        data[key.lower()] = re.sub(r"[\";]", "", value)
+    return data
+
+
+def legacy_gtf2bed12(line):
+    u"""
+    Gtf2Bed12.__split_gtf_details__ before attributes.py
+    """
+    data = {}
+    for message in line.strip().split(";"):
+        if not message:
+            continue
+
+        key, value = re.split(r"[=\s]", message.strip())[:2]
+        data[key.lower()] = re.sub(r"[\";]", "", value if ":" not in message else value.split(":")[1])
+    return data
+
+
+def bench_attributes(lines, number=3):
+    u"""
+    time every parser on the same attribute columns
+    :param lines: list of (9th column, GTF or GFF3)
+    :param number: repeats, the best one is reported
+    :return: list of (name, number of columns, seconds)
+    """
+    gtf = [x for x, fmt in lines if fmt == GTF]
+    gff = [x.rstrip() for x, fmt in lines if fmt == GFF3]
+    gtf_bytes = [x.encode("utf-8") for x in gtf]
+    gff_bytes = [x.encode("utf-8") for x in gff]
+
+    cases = [
+        ("legacy gtf2gff (gtf)", lambda: [legacy_gtf2gff(x) for x in gtf]),
+        ("legacy gtf2bed12 (gtf)", lambda: [legacy_gtf2bed12(x) for x in gtf]),
+        ("Attributes.to_dict (gtf, str)", lambda: [Attributes(x, GTF).to_dict(lower=True) for x in gtf]),
+        ("Attributes.to_dict (gtf, bytes)", lambda: [Attributes(x, GTF).to_dict(lower=True) for x in gtf_bytes]),
+        ("Attributes.get x2 (gtf, bytes)", lambda: [
+            (a.get("gene_id"), a.get("transcript_id")) for a in (Attributes(x, GTF) for x in gtf_bytes)
+        ]),
+        ("legacy gff2gtf (gff3)", lambda: [legacy_gff2gtf(x) for x in gff]),
+        ("legacy gtf2bed12 (gff3)", lambda: [legacy_gtf2bed12(x) for x in gff]),
+        ("Attributes.to_dict (gff3, str)", lambda: [Attributes(x, GFF3, True).to_dict() for x in gff]),
+        ("Attributes.to_dict (gff3, bytes)", lambda: [Attributes(x, GFF3, True).to_dict() for x in gff_bytes]),
+        ("Attributes.get x2 (gff3, bytes)", lambda: [
+            (a.get("ID"), a.get("Parent")) for a in (Attributes(x, GFF3, True) for x in gff_bytes)
+        ]),
+    ]
+
+    res = []
+    for name, func in cases:
+        count = len(gff) if "(gff3" in name else len(gtf)
+        if not count:
+            continue
+        try:
+            res.append((name, count, min(timeit.repeat(func, number=1, repeat=number))))
+        except (ValueError, IndexError) as err:
+            # the legacy parsers fail on values with spaces or empty attributes
+            print("%s failed: %s" % (name, err), file=sys.stderr)
+    return res
+
+
+def load_attributes(path, limit):
+    u"""
+    collect the 9th column of the first lines of an annotation file
+    """
+    lines = []
+    with open(path) as r:
+        for line in r:
+            if line.startswith("#"):
+                continue
+            column = line.split("\t")[8]
+            lines.append((column, Attributes(column).format))
+            if len(lines) >= limit:
+                break
+    return lines
+
+
+__DIR__ = os.path.dirname(os.path.abspath(__file__))
+
+# name -> (script, input generated by synthetic.py, command line of script)
+CONVERTERS = {
+    "gtf2gff": ("gtf2gff.py", "ensembl.gtf", ["-i", "{input}", "-o", "{output}.gff3"]),
+    "gtf2bed12": ("gtf2bed12.py", "ensembl.gtf", ["-i", "{input}", "-o", "{output}.bed"]),
+    "gff2gtf (ensembl)": ("gff2gtf.py", "ensembl.gff3", ["-i", "{input}", "-o", "{output}.gtf"]),
+    "gff2gtf (ncbi)": ("gff2gtf.py", "ncbi.gff3", ["-i", "{input}", "-o", "{output}.gtf"]),
+    "gmap_splicesites2sj": ("gmap_splicesites2sj.py", "gmap.txt", ["--infile", "{input}", "--outfile", "{output}.txt"]),
+}
+
+
+def generate(workdir, genes, isoforms, exons, reads, seed=42):
+    u"""
+    write the inputs of CONVERTERS into a sub-directory of workdir named by the scale,
+    the existing files are reused
+    :return: dict of file name -> path
+    """
+    workdir = os.path.join(workdir, "g%d_i%d_e%d_r%d_s%d" % (genes, isoforms, exons, reads, seed))
+    os.makedirs(workdir, exist_ok=True)
+
+    synthetic = SyntheticAnnotation(genes=genes, isoforms=isoforms, exons=exons, seed=seed)
+    files = {
+        "ensembl.gtf": ("gtf", "ensembl"),
+        "ensembl.gff3": ("gff3", "ensembl"),
+        "ncbi.gff3": ("gff3", "ncbi"),
+        "gmap.txt": ("gmap", None),
+    }
+
+    res = {}
+    for name, (fmt, dialect) in files.items():
+        path = os.path.join(workdir, name)
+        if not os.path.exists(path):
+            synthetic.write(path, fmt=fmt, dialect=dialect, reads=reads)
+        res[name] = path
+    return res
+
+
+def count_lines(path):
+    u"""
+    number of lines, read by blocks
+    """
+    count = 0
+    with open(path, "rb") as r:
+        for block in iter(lambda: r.read(1 << 20), b""):
+            count += block.count(b"\n")
+    return count
+
+
+def run_converter(name, path, workdir, repeat=1):
+    u"""
+    run a converter in new processes, the peak memory of the child is
+    collected by os.wait4, so the runs do not affect each other
+    :return: dict of measurements of the best run
+    """
+    script, _, options = CONVERTERS[name]
+    output = os.path.join(workdir, "out." + re.sub(r"\W+", "_", name))
+    command = [sys.executable, os.path.join(__DIR__, script)] + \
+              [x.format(input=path, output=output) for x in options]
+
+    size = os.path.getsize(path)
+    lines = count_lines(path)
+
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with open(os.devnull, "w") as devnull:
+            proc = subprocess.Popen(command, stdout=devnull, stderr=devnull, cwd=__DIR__)
+            _, status, usage = os.wait4(proc.pid, 0)
+        seconds = time.perf_counter() - start
+        proc.returncode = os.waitstatus_to_exitcode(status)
+
+        record = {
+            "converter": name,
+            "input": os.path.basename(path),
+            "lines": lines,
+            "bytes": size,
+            "seconds": round(seconds, 4),
+            "lines_per_s": round(lines / seconds, 1),
+            "mb_per_s": round(size / 1024 / 1024 / seconds, 3),
+            # ru_maxrss is KB on linux
+            "peak_rss_mb": round(usage.ru_maxrss / 1024, 1),
+            "returncode": proc.returncode,
+        }
+        if best is None or (record["returncode"] == 0 and record["seconds"] < best["seconds"]):
+            best = record
+    return best
+
+
+def git_commit():
+    u"""
+    current commit of the repository, None if not a git repository
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=__DIR__,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_converters(workdir, names=None, genes=20000, isoforms=3, exons=8, reads=100000, repeat=1):
+    u"""
+    :param workdir: directory of the synthetic inputs and the outputs
+    :param names: names of CONVERTERS to run, all of them if not set
+    :return: report as dict
+    """
+    files = generate(workdir, genes, isoforms, exons, reads)
+    results = []
+    for name in names or CONVERTERS.keys():
+        record = run_converter(name, files[CONVERTERS[name][1]], workdir, repeat)
+        print("%-24s\t%.3fs\t%.0f lines/s\t%.2f MB/s\t%.1f MB%s" % (
+            name, record["seconds"], record["lines_per_s"], record["mb_per_s"], record["peak_rss_mb"],
+            "" if record["returncode"] == 0 else "\tfailed (%d)" % record["returncode"]
+        ))
+        results.append(record)
+
+    return {
+        "commit": git_commit(),
+        "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "scale": {"genes": genes, "isoforms": isoforms, "exons": exons, "reads": reads},
+        "results": results,
+    }
+
+
+def compare(before, after):
+    u"""
+    :param before: path to json report
+    :param after: path to json report
+    :return: list of (converter, seconds before, seconds after, speedup, peak memory before, after)
+    """
+    with open(before) as r:
+        before = {x["converter"]: x for x in json.load(r)["results"]}
+    with open(after) as r:
+        after = {x["converter"]: x for x in json.load(r)["results"]}
+
+    res = []
+    for name, record in after.items():
+        if name not in before:
+            continue
+        old = before[name]
+        res.append((
+            name, old["seconds"], record["seconds"], old["seconds"] / record["seconds"],
+            old["peak_rss_mb"], record["peak_rss_mb"]
+        ))
+    return res
+
+
+def argument_parser():
+    u"""
+    argument_parser
+    """
+    parser = argparse.ArgumentParser(
+        description="Benchmarks of the converters"
+    )
+
+    sub = parser.add_subparsers(dest="command")
+
+    attrs = sub.add_parser("attributes", help="attributes parser against the legacy per-script parsers")
+    attrs.add_argument("-i", "--input", help="Path to gtf|gff3, use the builtin gencode and refseq lines if not set")
+    attrs.add_argument("-n", "--lines", type=int, default=200000, help="Number of attribute columns")
+    attrs.add_argument("-r", "--repeat", type=int, default=3, help="Repeats of every parser, the best one is reported")
+
+    conv = sub.add_parser("converters", help="every converter on synthetic annotations")
+    conv.add_argument("-o", "--output", help="Path to json report")
+    conv.add_argument("-w", "--workdir", help="Directory of the synthetic inputs, reused if exists, temporary if not set")
+    conv.add_argument("-c", "--converter", action="append", choices=list(CONVERTERS.keys()),
+                      help="Converters to run, could be used multiple times, all of them if not set")
+    conv.add_argument("--genes", type=int, default=20000, help="Number of genes")
+    conv.add_argument("--isoforms", type=int, default=3, help="Number of transcripts per gene")
+    conv.add_argument("--exons", type=int, default=8, help="Number of exons per transcript")
+    conv.add_argument("--reads", type=int, default=100000, help="Number of reads of gmap output")
+    conv.add_argument("-r", "--repeat", type=int, default=1, help="Runs of every converter, the best one is reported")
+
+    comp = sub.add_parser("compare", help="compare two json reports from converters")
+    comp.add_argument("before", help="Path to json report")
+    comp.add_argument("after", help="Path to json report")
+
+    if len(sys.argv[1:]) <= 0:
+        parser.print_help()
+        exit(0)
+
+    return parser.parse_args(sys.argv[1:])
+
+
+def main():
+    args = argument_parser()
+
+    if args.command == "attributes":
+        if args.input:
+            lines = load_attributes(args.input, args.lines)
+        else:
+            lines = [(__GTF_LINE__, GTF), (__GFF_LINE__, GFF3)] * (args.lines // 2)
+
+        for name, count, seconds in bench_attributes(lines, args.repeat):
+            print("%-36s\t%.3fs\t%.0f lines/s" % (name, seconds, count / seconds))
+
+    elif args.command == "converters":
+        workdir = args.workdir or tempfile.mkdtemp(prefix="benchmark_")
+        os.makedirs(workdir, exist_ok=True)
+
+        report = bench_converters(
+            workdir, args.converter, genes=args.genes, isoforms=args.isoforms,
+            exons=args.exons, reads=args.reads, repeat=args.repeat
+        )
+        if args.output:
+            with open(args.output, "w+") as w:
+                json.dump(report, w, indent=2)
+
+    elif args.command == "compare":
+        for name, old, new, speedup, old_rss, new_rss in compare(args.before, args.after):
+            print("%-24s\t%.3fs -> %.3fs\t%.2fx\t%.1f MB -> %.1f MB" % (name, old, new, speedup, old_rss, new_rss))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+u"""
+on-disk cache of the converted outputs, --cache of gff2gtf.py, gtf2gff.py and gtf2bed12.py
+
+python gtf2bed12.py -i gencode.gtf -o gencode.bed --cache ~/.cache/bfc --cache-size 20480
+
+the outputs are keyed by the fingerprint of the input (size, mtime and the
+hash of sampled blocks), the converter, the options affecting the outputs
+and the source of the scripts. a hit links the cached files to the outputs
+(or copies them across file systems) instead of converting again. the
+outputs linked to the cache are replaced by the next conversion instead of
+written through, see fileio.unlink_shared
+
+the cache is shared by the processes on one node:
+    - the conversions of the same key are serialized by a lock per key, the
+      other processes wait and take the outputs of the first one
+    - an entry is committed by renaming its finished directory, and the least
+      recently used entries are removed once the cache is over --cache-size MB,
+      under the exclusive lock of the whole cache, the hits take it shared
+
+the incremental conversions and the outputs to stdout are never cached
+
+python cache.py stats -c ~/.cache/bfc
+python cache.py clear -c ~/.cache/bfc
+"""
+import argparse
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+
+from incremental import remove_manifest
+
+__author__ = "Zhang Yiming"
+__since__ = "2026.10.17"
+
+
+VERSION = 1
+
+# the blocks hashed by the fingerprint, the smaller files are hashed as a whole
+SAMPLE_BLOCKS = 16
+SAMPLE_SIZE = 1 << 16
+
+# default size limit in MB
+CACHE_SIZE = 10240
+
+# the files written alongside an output, eg: the tabix index of sorted BGZF
+SIDECARS = (".tbi",)
+
+# the directories left by the crashed processes are removed after a day
+STALE_SECONDS = 24 * 3600
+
+__code_version__ = None
+
+
+def code_version():
+    u"""
+    hash of the scripts, the outputs of the changed converters are never taken
+    """
+    global __code_version__
+    if __code_version__ is None:
+        digest = hashlib.blake2b(digest_size=16)
+        root = os.path.dirname(os.path.abspath(__file__))
+        for name in sorted(os.listdir(root)):
+            if name.endswith(".py"):
+                digest.update(name.encode("utf-8"))
+                with open(os.path.join(root, name), "rb") as r:
+                    digest.update(r.read())
+        __code_version__ = digest.hexdigest()
+    return __code_version__
+
+
+def fingerprint(path):
+    u"""
+    :param path: path to the input
+    :return: dict of size, mtime and the hash of SAMPLE_BLOCKS blocks spread over the file
+    """
+    stat = os.stat(path)
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as r:
+        if stat.st_size <= SAMPLE_BLOCKS * SAMPLE_SIZE:
+            digest.update(r.read())
+        else:
+            step = (stat.st_size - SAMPLE_SIZE) // (SAMPLE_BLOCKS - 1)
+            for i in range(SAMPLE_BLOCKS):
+                r.seek(i * step)
+                digest.update(r.read(SAMPLE_SIZE))
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "hash": digest.hexdigest()}
+
+
+def place(source, target):
+    u"""
+    hard link source to target, or copy it across file systems, target is replaced at once
+    """
+    # renaming a link onto another link of the same file does nothing
+    if os.path.exists(target) and os.path.samefile(source, target):
+        return
+    temp = "%s.%s.tmp" % (target, uuid.uuid4().hex[:8])
+    try:
+        os.link(source, temp)
+    except OSError:
+        shutil.copyfile(source, temp)
+    os.replace(temp, target)
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(path, x)) for x in os.listdir(path))
+
+
+class ResultCache(object):
+    u"""
+    the outputs of conversions under root/entries/key, with their meta.json
+    """
+
+    def __init__(self, root, size=CACHE_SIZE):
+        u"""
+        :param root: directory of the cache, created if missing
+        :param size: size limit in MB
+        """
+        self.root = os.path.abspath(os.path.expanduser(root))
+        self.limit = size * 1024 * 1024
+        for name in ("entries", "locks", "tmp"):
+            os.makedirs(os.path.join(self.root, name), exist_ok=True)
+
+    def __repr__(self):
+        return "ResultCache(%s, %d MB)" % (self.root, self.limit // 1024 // 1024)
+
+    def entry(self, key):
+        return os.path.join(self.root, "entries", key)
+
+    @contextmanager
+    def __lock__(self, path, shared=False):
+        with open(path, "a+") as handle:
+            fcntl.flock(handle, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def lock(self, key):
+        u"""
+        the lock of one key, held while converting
+        """
+        return self.__lock__(os.path.join(self.root, "locks", key + ".lock"))
+
+    def shared(self, shared=True):
+        u"""
+        the lock of the whole cache, shared by the hits, exclusive for commit and eviction
+        """
+        return self.__lock__(os.path.join(self.root, "cache.lock"), shared=shared)
+
+    @staticmethod
+    def key(path, converter, options, outputs):
+        u"""
+        :param path: path to the input
+        :param converter: name of converter
+        :param options: dict of the options affecting the outputs
+        :param outputs: list of output paths, None for the outputs not asked
+        :return: hex digest
+        """
+        data = {
+            "version": VERSION,
+            "code": code_version(),
+            "input": fingerprint(path),
+            "converter": converter,
+            "options": options,
+            # BGZF or plain text of every output
+            "outputs": [x.endswith((".gz", ".bgz")) if x else None for x in outputs],
+        }
+        return hashlib.blake2b(json.dumps(data, sort_keys=True).encode("utf-8"), digest_size=20).hexdigest()
+
+    def restore(self, key, outputs):
+        u"""
+        :param key: from key()
+        :param outputs: list of output paths, same as key()
+        :return: whether the outputs are taken from the cache
+        """
+        entry = self.entry(key)
+        with self.shared():
+            if not os.path.isdir(entry):
+                return False
+            with open(os.path.join(entry, "meta.json")) as r:
+                meta = json.load(r)
+            for name, position, suffix in meta["files"]:
+                place(os.path.join(entry, name), outputs[position] + suffix)
+            # the mtime of entry is the time of last use
+            os.utime(entry)
+        return True
+
+    def store(self, key, outputs):
+        u"""
+        link the outputs into the cache, the least recently used entries are removed if it is full
+        :param key: from key()
+        :param outputs: list of output paths, same as key()
+        """
+        temp = os.path.join(self.root, "tmp", "%s.%d.%s" % (key, os.getpid(), uuid.uuid4().hex[:8]))
+        os.makedirs(temp)
+        try:
+            files = []
+            for position, path in enumerate(outputs):
+                if path is None:
+                    continue
+                for suffix in ("",) + SIDECARS:
+                    if os.path.isfile(path + suffix):
+                        name = "%d%s" % (position, suffix)
+                        place(path + suffix, os.path.join(temp, name))
+                        files.append((name, position, suffix))
+
+            size = directory_size(temp)
+            if size > self.limit:
+                print("the outputs are larger than the cache, skip caching", file=sys.stderr)
+                return
+
+            with open(os.path.join(temp, "meta.json"), "w+") as w:
+                json.dump({"files": files, "size": size, "created": time.time()}, w)
+
+            with self.shared(shared=False):
+                if not os.path.exists(self.entry(key)):
+                    os.rename(temp, self.entry(key))
+                self.__evict__()
+        finally:
+            shutil.rmtree(temp, ignore_errors=True)
+
+    def entries(self):
+        u"""
+        :return: list of (last use, size, key), the least recently used first
+        """
+        res = []
+        root = os.path.join(self.root, "entries")
+        for key in os.listdir(root):
+            try:
+                with open(os.path.join(root, key, "meta.json")) as r:
+                    size = json.load(r)["size"]
+                res.append((os.stat(os.path.join(root, key)).st_mtime, size, key))
+            except (OSError, ValueError, KeyError):
+                continue
+        return sorted(res)
+
+    def __evict__(self):
+        u"""
+        remove the least recently used entries until the cache fits, under the exclusive lock
+        """
+        entries = self.entries()
+        total = sum(x[1] for x in entries)
+        for _, size, key in entries:
+            if total <= self.limit:
+                break
+            shutil.rmtree(self.entry(key), ignore_errors=True)
+            total -= size
+
+        # left by the crashed processes
+        now = time.time()
+        temp = os.path.join(self.root, "tmp")
+        for name in os.listdir(temp):
+            path = os.path.join(temp, name)
+            try:
+                if now - os.stat(path).st_mtime > STALE_SECONDS:
+                    shutil.rmtree(path, ignore_errors=True)
+            except OSError:
+                continue
+
+    def clear(self):
+        with self.shared(shared=False):
+            for name in ("entries", "tmp"):
+                shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+                os.makedirs(os.path.join(self.root, name))
+
+    def stats(self):
+        u"""
+        :return: dict of the number and size of entries
+        """
+        entries = self.entries()
+        return {
+            "root": self.root,
+            "entries": len(entries),
+            "size_mb": round(sum(x[1] for x in entries) / 1024 / 1024, 2),
+            "limit_mb": self.limit // 1024 // 1024,
+        }
+
+
+def open_cache(root, size=CACHE_SIZE):
+    u"""
+    :return: ResultCache, None if root is empty
+    """
+    return ResultCache(root, size) if root else None
+
+
+def cached(convert, cache, input_file, converter, options, outputs):
+    u"""
+    take the outputs from cache, or convert and keep them in cache
+    :param convert: function converting the input, eg: Gtf2Bed12(...).convert
+    :param cache: ResultCache, None to convert directly
+    :param input_file: path to the input
+    :param converter: name of converter
+    :param options: dict of the options affecting the outputs
+    :param outputs: list of output paths, None for the outputs not asked
+    :return: whether the outputs are taken from the cache
+    """
+    if cache is None or "-" in outputs:
+        convert()
+        return False
+
+    key = cache.key(input_file, converter, options, outputs)
+    with cache.lock(key):
+        if cache.restore(key, outputs):
+            for path in outputs:
+                if path is not None:
+                    remove_manifest(path)
+            print("the outputs of %s are taken from %s" % (input_file, cache.root), file=sys.stderr)
+            return True
+
+        convert()
+        try:
+            cache.store(key, outputs)
+        except OSError as err:
+            print("failed to cache the outputs: %s" % err, file=sys.stderr)
+    return False
+
+
+def add_cache_arguments(parser):
+    u"""
+    --cache and --cache-size of the converters
+    """
+    parser.add_argument(
+        "--cache",
+        default=None,
+        help="Directory of the cache of outputs, the same input and options are converted once"
+    )
+
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=CACHE_SIZE,
+        help="Size limit of --cache in MB, the least recently used outputs are removed"
+    )
+
+
+def argument_parser():
+    u"""
+    argument_parser
+    """
+    parser = argparse.ArgumentParser(
+        description="Show or clear the cache of outputs"
+    )
+
+    parser.add_argument("command", choices=["stats", "clear"])
+
+    parser.add_argument(
+        "-c",
+        "--cache",
+        required=True,
+        help="Directory of the cache"
+    )
+
+    if len(sys.argv[1:]) <= 0:
+        parser.print_help()
+        exit(0)
+
+    return parser.parse_args(sys.argv[1:])
+
+
+def main():
+    args = argument_parser()
+    cache = ResultCache(args.cache)
+    if args.command == "clear":
+        cache.clear()
+    print(json.dumps(cache.stats(), indent=4))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+u"""
+parse the annotation once, and write several formats in the same pass
+
+python convert.py -i gencode.gtf -o gencode --to gff3,bed12,genes,introns,metaexons
+python convert.py -i refseq.gff3 -o refseq --to gtf,bed12 --bgzip
+
+targets:
+    gff3:  gtf to gff3, same as gtf2gff.py, prefix.gff3
+    gtf:   gff3 to gtf, same as gff2gtf.py, prefix.gtf
+    bed12: transcripts, same as gtf2bed12.py, prefix.bed
+    genes: span of every gene in bed6, prefix.genes.bed
+    introns: intron of every transcript in bed6, prefix.introns.bed
+    metaexons: merged exons of every gene in bed6, prefix.metaexons.bed
+
+gff3 needs gtf input and gtf needs gff3 input, the format of the input is
+never a target of itself, eg: --to gff3,bed12 for gtf, --to gtf,bed12 for gff3
+
+the records are read in batches, and every batch is handed to all the
+targets. gtf from gff3 still needs the index of genes and transcripts
+before the conversion, the index pass only decodes the IDs of gene and
+transcript records.
+"""
+import argparse
+import gc
+import os
+import sys
+from itertools import islice
+
+from tqdm import tqdm
+
+from attributes import GFF3, GTF
+from dialect import sniff
+from fileio import open_output
+from gff2gtf import PROFILE_HOOKS as GFF2GTF_HOOKS, Gff2Gtf, ParentIndex
+from gtf2bed12 import PROFILE_HOOKS as GTF2BED12_HOOKS, TranscriptModel
+from gtf2gff import PROFILE_HOOKS as GTF2GFF_HOOKS, Gtf2Gff
+from profiling import Profiler, current
+from store import open_records
+
+__author__ = "Zhang Yiming"
+__since__ = "2026.10.17"
+
+
+# target -> (suffix of output, required input format)
+TARGETS = {
+    "gff3": (".gff3", GTF),
+    "gtf": (".gtf", GFF3),
+    "bed12": (".bed", None),
+    "genes": (".genes.bed", None),
+    "introns": (".introns.bed", None),
+    "metaexons": (".metaexons.bed", None),
+}
+
+# the targets derived from the TranscriptModel of gtf2bed12.py
+MODEL_TARGETS = ("bed12", "genes", "introns", "metaexons")
+
+
+class GffTarget(object):
+    u"""
+    gtf to gff3 by Gtf2Gff
+    """
+
+    strip_prefix = False
+
+    def __init__(self, path, generate_genes=False, dialect=None):
+        self.generate_genes = generate_genes
+        self.dialect = dialect
+        self.genes = set()
+        self.handle = open_output(path, index="gff")
+        self.handle.write("#gff-version 3\n")
+
+    def add(self, records):
+        # __format_lines__ writes the 9th column back into the columns
+        records = [(list(lines), attrs) for lines, attrs in records if attrs is not None]
+        records = Gtf2Gff.__format_lines__(records, self.generate_genes, self.dialect)
+        Gtf2Gff.__write_lines__(self.handle, records, self.genes)
+
+    def close(self):
+        self.handle.close()
+
+
+class GtfTarget(object):
+    u"""
+    gff3 to gtf by Gff2Gtf
+    """
+
+    strip_prefix = True
+
+    def __init__(self, path, index):
+        u"""
+        :param path: path to output file
+        :param index: ParentIndex from Gff2Gtf.build_index
+        """
+        self.index = index
+        self.handle = open_output(path, index="gff")
+        self.handle.write("#gtf-version 2.2\n")
+
+    def add(self, records):
+        self.handle.writelines(Gff2Gtf.__format_lines__(self.index, records))
+
+    def close(self):
+        self.handle.close()
+
+
+class ModelTarget(object):
+    u"""
+    bed12 of transcripts, bed6 of genes, introns and meta exons, from the TranscriptModel of gtf2bed12.py
+    """
+
+    strip_prefix = True
+
+    def __init__(self, bed12=None, genes=None, dialect=None, introns=None, meta_exons=None):
+        u"""
+        :param bed12: path to bed12, None to skip
+        :param genes: path to the bed6 of genes, None to skip
+        :param dialect: Dialect of the input
+        :param introns: path to the bed6 of introns, None to skip
+        :param meta_exons: path to the bed6 of meta exons, None to skip
+        """
+        self.bed12 = bed12
+        self.genes = genes
+        self.introns = introns
+        self.meta_exons = meta_exons
+        self.model = TranscriptModel(dialect)
+
+    def add(self, records):
+        add = self.model.add
+        for lines, data in records:
+            if data is not None:
+                add(lines, data)
+
+    def close(self):
+        outputs = (
+            (self.bed12, self.model.bed12), (self.genes, self.model.gene_bed),
+            (self.introns, self.model.intron_bed), (self.meta_exons, self.model.meta_exon_bed),
+        )
+        for path, lines in outputs:
+            if path:
+                with open_output(path, index="bed") as w:
+                    w.writelines(lines())
+
+
+class Converter(object):
+    u"""
+    fan out the records of one input into several targets
+    """
+
+    def __init__(self, input_file, output, targets, generate_genes=False, bgzip=False, batch=256):
+        u"""
+        :param input_file: path to gtf, gff3 or store
+        :param output: prefix of the output files
+        :param targets: list of TARGETS
+        :param generate_genes: create the missing genes of gff3, see gtf2gff.py
+        :param bgzip: compress the outputs by BGZF
+        :param batch: number of records handed to the targets at once
+        """
+        self.input = input_file
+        self.output = output
+        self.targets = targets
+        self.generate_genes = generate_genes
+        self.bgzip = bgzip
+        self.batch = batch
+
+        self.dialect = sniff(input_file)
+        self.format = self.dialect.format or GTF
+        for target in targets:
+            if target not in TARGETS:
+                raise ValueError("unknown target %s, choose from %s" % (target, ",".join(TARGETS.keys())))
+            required = TARGETS[target][1]
+            if required is not None and required != self.format:
+                raise ValueError("%s needs %s input, but %s is %s already, remove %s from the targets" % (
+                    target, required, input_file, self.format, target
+                ))
+
+    def path(self, target):
+        u"""
+        :return: path to the output of target
+        """
+        return self.output + TARGETS[target][0] + (".gz" if self.bgzip else "")
+
+    def __open_targets__(self):
+        targets = []
+        if "gff3" in self.targets:
+            targets.append(GffTarget(self.path("gff3"), self.generate_genes, self.dialect))
+
+        if "gtf" in self.targets:
+            index = ParentIndex()
+            records = open_records(self.input, strip_prefix=True, fmt=self.format, keep=Gff2Gtf.__keep_index__)
+            records = current().records(records, count=False)
+            Gff2Gtf.build_index(index, tqdm(records, desc="Indexing"))
+            targets.append(GtfTarget(self.path("gtf"), index))
+
+        if any(x in self.targets for x in MODEL_TARGETS):
+            paths = {x: self.path(x) if x in self.targets else None for x in MODEL_TARGETS}
+            targets.append(ModelTarget(
+                paths["bed12"], paths["genes"], self.dialect,
+                introns=paths["introns"], meta_exons=paths["metaexons"]
+            ))
+        return targets
+
+    def convert(self):
+        u"""
+        read the input once, and write all the targets
+        :return: list of the output files
+        """
+        targets = self.__open_targets__()
+        strip = any(x.strip_prefix for x in targets)
+
+        # the records never form cycles, but the batches alive with the growing
+        # transcript model make every full collection scan the whole model,
+        # the state of the caller is restored, eg: gc disabled by the batch workers
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            records = current().records(open_records(self.input, fmt=self.format))
+            records = iter(tqdm(records, desc="Converting"))
+            while True:
+                batch = list(islice(records, self.batch))
+                if not batch:
+                    break
+
+                # the same columns with the ensembl prefix stripped, decoded lazily
+                stripped = [(x, y.view(True) if y is not None else None) for x, y in batch] if strip else batch
+                for target in targets:
+                    target.add(stripped if target.strip_prefix else batch)
+        finally:
+            if enabled:
+                gc.enable()
+
+        for target in targets:
+            target.close()
+
+        return [self.path(x) for x in self.targets]
+
+
+def argument_parser():
+    u"""
+    argument_parser
+    """
+    parser = argparse.ArgumentParser(
+        description="Parse gtf|gff3 once and convert it into several formats"
+    )
+
+    parser.add_argument(
+        "-i",
+        "--input",
+        help="Path to input file, gtf, gff3 or store from store.py",
+        required=True
+    )
+
+    parser.add_argument(
+        "-o",
+        "--output",
+        help="Prefix of output files, eg: out -> out.gff3, out.bed",
+        required=True
+    )
+
+    parser.add_argument(
+        "--to",
+        default="bed12",
+        help="Comma separated targets, %s; gff3 needs gtf input and gtf needs gff3 input, "
+             "the format of the input is not a target" % ",".join(TARGETS.keys())
+    )
+
+    parser.add_argument(
+        "-g",
+        "--gene",
+        action="store_true",
+        default=False,
+        help="Create the missing genes while converting gtf to gff3, see gtf2gff.py"
+    )
+
+    parser.add_argument(
+        "-z",
+        "--bgzip",
+        action="store_true",
+        default=False,
+        help="Compress the outputs by BGZF, with tabix index if sorted"
+    )
+
+    parser.add_argument(
+        "--profile",
+        default=None,
+        help="Path to the json report of the time spent in every stage, - for stderr"
+    )
+
+    parser.add_argument(
+        "--pstats",
+        default=None,
+        help="Path to the cProfile stats, see python -m pstats"
+    )
+
+    if len(sys.argv[1:]) <= 0:
+        parser.print_help()
+        exit(0)
+
+    return parser.parse_args(sys.argv[1:])
+
+
+def main():
+    args = argument_parser()
+
+    if not os.path.isfile(args.input):
+        raise FileNotFoundError("%s not found" % args.input)
+
+    out_dir = os.path.dirname(os.path.abspath(args.output))
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+
+    targets = [x.strip() for x in args.to.split(",") if x.strip()]
+    hooks = GTF2GFF_HOOKS + GFF2GTF_HOOKS + GTF2BED12_HOOKS
+    with Profiler("convert", report=args.profile, pstats=args.pstats, hooks=hooks):
+        paths = Converter(args.input, args.output, targets, args.gene, args.bgzip).convert()
+
+    for path in paths:
+        print(path)
+
+
+if __name__ == '__main__':
+    main()
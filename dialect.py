@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+u"""
+detect the dialect of annotation from the first records
+
+ensembl:   gene_biotype, gene_source in gtf, ID=gene:ENSG... in gff3
+gencode:   gene_type, level in gtf, ID=ENSG...;gene_type=... in gff3
+refseq:    db_xref, BestRefSeq|Gnomon in gtf, ID=gene-...;Dbxref=... in gff3
+stringtie: StringTie in the source column
+gmap:      the ids of gmap -f gff3_gene, eg: ID=read1.path1;Name=read1
+generic:   none of above
+
+the format of attributes is decided once instead of every record, and the
+converters look up the known key of a dialect directly, eg: gene_id instead
+of trying gene_id, geneid and id, the records without the known key fall
+back to the general path one by one
+"""
+import re
+from collections import Counter
+from itertools import islice
+
+from attributes import GFF3, GTF
+from store import open_records
+
+__author__ = "Zhang Yiming"
+__since__ = "2026.10.17"
+
+
+# number of records sampled from the begin of file
+SAMPLE_SIZE = 1000
+
+
+class Dialect(object):
+    u"""
+    the known format and attribute keys of an annotation source
+    """
+
+    def __init__(self, name, fmt, keys=()):
+        u"""
+        :param name: name of dialect
+        :param fmt: GTF or GFF3, None if not sure
+        :param keys: the attribute keys always present in this dialect, looked up directly
+        """
+        self.name = name
+        self.format = fmt
+        self.keys = frozenset(keys)
+
+    def __repr__(self):
+        return "Dialect(%s, %s)" % (self.name, self.format)
+
+    def get(self, data, target, pop=False):
+        u"""
+        the direct lookup of a known key
+        :param data: dict or Attributes
+        :param target: the key, eg: gene_id
+        :param pop: remove the key from dict
+        :return: value, None if the key is not known by this dialect or missing in this record
+        """
+        if target not in self.keys:
+            return None
+        value = data.get(target)
+        if value is not None and pop and isinstance(data, dict):
+            del data[target]
+        return value
+
+
+__GTF_KEYS__ = ("gene_id", "transcript_id")
+__GFF_KEYS__ = ("ID", "Parent")
+
+ENSEMBL = "ensembl"
+GENCODE = "gencode"
+REFSEQ = "refseq"
+STRINGTIE = "stringtie"
+GMAP = "gmap"
+GENERIC = "generic"
+
+# (name, format) -> the known keys
+DIALECTS = {
+    (ENSEMBL, GTF): __GTF_KEYS__ + ("gene_name", "transcript_name"),
+    (GENCODE, GTF): __GTF_KEYS__ + ("gene_name", "transcript_name"),
+    (REFSEQ, GTF): __GTF_KEYS__,
+    (STRINGTIE, GTF): __GTF_KEYS__,
+    (GMAP, GTF): __GTF_KEYS__,
+    (GENERIC, GTF): (),
+    (ENSEMBL, GFF3): __GFF_KEYS__,
+    (GENCODE, GFF3): __GFF_KEYS__ + ("gene_id", "transcript_id", "gene_name", "transcript_name"),
+    (REFSEQ, GFF3): __GFF_KEYS__,
+    (STRINGTIE, GFF3): __GFF_KEYS__,
+    (GMAP, GFF3): __GFF_KEYS__,
+    (GENERIC, GFF3): (),
+}
+
+REFSEQ_SOURCES = {"BestRefSeq", "Gnomon", "RefSeq", "Curated Genomic", "cmsearch", "tRNAscan-SE"}
+GMAP_ID = re.compile(r"\.(path|mrna)\d+$")
+
+
+def get_dialect(name, fmt):
+    u"""
+    :return: Dialect of name and format
+    """
+    return Dialect(name, fmt, DIALECTS.get((name, fmt), ()))
+
+
+def detect_dialect(records, size=SAMPLE_SIZE):
+    u"""
+    :param records: iterable of (columns, Attributes), see store.open_records
+    :param size: number of records to sample
+    :return: Dialect
+    """
+    sample = list(islice((x for x in records if x[1] is not None), size))
+    if not sample:
+        return get_dialect(GENERIC, None)
+
+    fmt = Counter(x[1].format for x in sample).most_common(1)[0][0]
+    sources = {x[0][1] for x in sample}
+    keys = set()
+    for _, attrs in sample:
+        keys.update(k for k, _ in attrs.raw_items())
+
+    if any(x.lower() == "stringtie" for x in sources):
+        return get_dialect(STRINGTIE, fmt)
+
+    if fmt == GFF3:
+        ids = [x[1].raw_items() for x in sample]
+        ids = [v for pairs in ids for k, v in pairs if k == "ID"]
+        if ids and any(x.startswith(("gene:", "transcript:")) for x in ids):
+            return get_dialect(ENSEMBL, fmt)
+        if ids and any(x.startswith(("gene-", "rna-")) for x in ids) or "Dbxref" in keys and sources & REFSEQ_SOURCES:
+            return get_dialect(REFSEQ, fmt)
+        if "gene_type" in keys:
+            return get_dialect(GENCODE, fmt)
+        if ids and all(GMAP_ID.search(x) for x in ids):
+            return get_dialect(GMAP, fmt)
+        return get_dialect(GENERIC, fmt)
+
+    if "gene_type" in keys or "level" in keys:
+        return get_dialect(GENCODE, fmt)
+    if "gene_biotype" in keys or "gene_source" in keys:
+        return get_dialect(ENSEMBL, fmt)
+    if "db_xref" in keys or sources & REFSEQ_SOURCES:
+        return get_dialect(REFSEQ, fmt)
+
+    transcripts = [x[1].get("transcript_id") for x in sample]
+    if all(x is not None and GMAP_ID.search(x) for x in transcripts):
+        return get_dialect(GMAP, fmt)
+    return get_dialect(GENERIC, fmt)
+
+
+def sniff(path, size=SAMPLE_SIZE):
+    u"""
+    detect the dialect from the first records of a gtf, gff3 or store
+    """
+    records = open_records(path)
+    try:
+        return detect_dialect(records, size)
+    finally:
+        records.close()
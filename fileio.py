@@ -0,0 +1,445 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+u"""
+compressed input and output shared by the scripts
+
+open_input: plain text, gzip or BGZF, detected by the magic number
+open_output: BGZF if the output ends with .gz or .bgz, stdout if the output is -,
+             plain text otherwise, the BGZF blocks are compressed by multiple
+             threads and a tabix index (.tbi) is written alongside if the output
+             is sorted. the lines are gathered by BufferedOutput and flushed by
+             a single write call per buffer
+"""
+import gzip
+import os
+import struct
+import sys
+import zlib
+from array import array
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+
+__author__ = "Zhang Yiming"
+__since__ = "2026.10.17"
+
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+# max size of uncompressed data in a BGZF block, same as htslib
+BLOCK_SIZE = 0xff00
+BGZF_EOF = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+
+# size of the BufferedOutput buffer in characters
+BUFFER_SIZE = 4 * 1024 * 1024
+
+# tabix presets: (format, column of seqid, column of start, column of end), 1-based columns
+TABIX_PRESETS = {
+    "gff": (0, 1, 4, 5),
+    "bed": (0x10000, 1, 2, 3),
+}
+
+
+def is_gzip(path):
+    u"""
+    check the magic number of gzip, BGZF is gzip too
+    """
+    with open(path, "rb") as r:
+        return r.read(2) == GZIP_MAGIC
+
+
+def open_input(path):
+    u"""
+    open plain text, gzip or BGZF in text mode
+    """
+    if is_gzip(path):
+        return gzip.open(path, "rt")
+    return open(path)
+
+
+def unlink_shared(path):
+    u"""
+    remove the file hard linked elsewhere, eg: an output taken from cache.py,
+    so the new output is written into a new file instead of through the links
+    """
+    try:
+        if os.stat(path).st_nlink > 1 and os.path.isfile(path):
+            os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def open_output(path, index=None, threads=None, buffer_size=None):
+    u"""
+    :param path: path to output file, BGZF if ends with .gz or .bgz, stdout if -
+    :param index: tabix preset, gff or bed, to write the .tbi if the output is sorted
+    :param threads: number of threads to compress the blocks
+    :param buffer_size: size of buffer in characters, default BUFFER_SIZE
+    :return: BufferedOutput in text mode
+    """
+    if path == "-":
+        handle = sys.stdout
+    elif path.endswith((".gz", ".bgz")):
+        handle = BgzfWriter(path, index=index, threads=threads)
+    else:
+        unlink_shared(path)
+        handle = open(path, "w+")
+    return BufferedOutput(handle, buffer_size=buffer_size)
+
+
+class BufferedOutput(object):
+    u"""
+    gather the written strings into a list, and pass them to the underlying
+    file by one write call when the buffer is full, instead of one call per line
+    """
+
+    def __init__(self, handle, buffer_size=None):
+        u"""
+        :param handle: file-like object in text mode, stdout is flushed but never closed
+        :param buffer_size: size of buffer in characters, default BUFFER_SIZE
+        """
+        self.handle = handle
+        self.buffer_size = buffer_size or BUFFER_SIZE
+        self.__buffer__ = []
+        self.__size__ = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None and isinstance(self.handle, BgzfWriter):
+            # the partial output is removed, instead of closed as a complete BGZF
+            self.__buffer__ = []
+            self.handle.abort()
+        else:
+            self.close()
+
+    @property
+    def closed(self):
+        return self.handle.closed
+
+    def write(self, text):
+        self.__buffer__.append(text)
+        self.__size__ += len(text)
+        if self.__size__ >= self.buffer_size:
+            self.__flush_buffer__()
+        return len(text)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.__buffer__.append(line)
+            self.__size__ += len(line)
+            if self.__size__ >= self.buffer_size:
+                self.__flush_buffer__()
+
+    def __flush_buffer__(self):
+        if self.__buffer__:
+            self.handle.write("".join(self.__buffer__))
+            self.__buffer__ = []
+            self.__size__ = 0
+
+    def flush(self):
+        self.__flush_buffer__()
+        self.handle.flush()
+
+    def close(self):
+        if self.handle.closed:
+            return
+        self.__flush_buffer__()
+        if self.handle is sys.stdout:
+            self.handle.flush()
+        else:
+            self.handle.close()
+
+
+def compress_block(data, level=6):
+    u"""
+    compress data into one or more BGZF blocks
+    :param data: bytes, no longer than BLOCK_SIZE
+    :return: list of (size of uncompressed data, block)
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    cdata = compressor.compress(data) + compressor.flush()
+
+    # the block could not be larger than 64KB, split incompressible data
+    if len(cdata) > 65536 - 26:
+        half = len(data) // 2
+        return compress_block(data[:half], level) + compress_block(data[half:], level)
+
+    header = struct.pack("<4BI2BH2BHH", 0x1f, 0x8b, 8, 4, 0, 0, 0xff, 6, 66, 67, 2, len(cdata) + 25)
+    footer = struct.pack("<II", zlib.crc32(data), len(data))
+    return [(len(data), header + cdata + footer)]
+
+
+def reg2bin(beg, end):
+    u"""
+    UCSC binning scheme used by tabix
+    :param beg: 0-based start
+    :param end: end, excluded
+    """
+    end -= 1
+    if beg >> 14 == end >> 14:
+        return ((1 << 15) - 1) // 7 + (beg >> 14)
+    if beg >> 17 == end >> 17:
+        return ((1 << 12) - 1) // 7 + (beg >> 17)
+    if beg >> 20 == end >> 20:
+        return ((1 << 9) - 1) // 7 + (beg >> 20)
+    if beg >> 23 == end >> 23:
+        return ((1 << 6) - 1) // 7 + (beg >> 23)
+    if beg >> 26 == end >> 26:
+        return ((1 << 3) - 1) // 7 + (beg >> 26)
+    return 0
+
+
+class BgzfWriter(object):
+    u"""
+    text writer of BGZF, the blocks are compressed by a thread pool, zlib
+    releases the GIL so the threads run in parallel
+    """
+
+    def __init__(self, path, index=None, threads=None, level=6):
+        u"""
+        :param path: path to output file
+        :param index: tabix preset, gff or bed, None to skip the index
+        :param threads: number of threads, default min(4, cpu count)
+        :param level: compression level
+        """
+        self.path = path
+        self.level = level
+        self.threads = threads or min(4, os.cpu_count() or 1)
+        unlink_shared(path)
+        self.__handle__ = open(path, "wb")
+        self.__pool__ = ThreadPoolExecutor(self.threads) if self.threads > 1 else None
+
+        self.__buffer__ = []
+        self.__buffer_size__ = 0
+
+        # uncompressed and compressed offsets of every block, for the virtual offsets
+        self.__block_u__ = array("q")
+        self.__block_c__ = array("q")
+        self.__u_offset__ = 0
+        self.__c_offset__ = 0
+
+        self.index = index
+        self.__indexer__ = TabixIndexer(index) if index else None
+        self.__partial__ = ""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+    def write(self, text):
+        u"""
+        :param text: str
+        """
+        if self.__indexer__ is not None:
+            self.__index_lines__(text)
+        self.write_bytes(text.encode("utf-8"))
+        return len(text)
+
+    def write_bytes(self, data):
+        u"""
+        :param data: bytes, not indexed
+        """
+        self.__buffer__.append(data)
+        self.__buffer_size__ += len(data)
+        if self.__buffer_size__ >= BLOCK_SIZE * self.threads * 4:
+            self.__flush_buffer__(final=False)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def __index_lines__(self, text):
+        u"""
+        collect the coordinates and uncompressed offsets of every complete line
+        """
+        lines = (self.__partial__ + text).split("\n")
+        self.__partial__ = lines.pop()
+        for line in lines:
+            self.__indexer__.add(line, len(line.encode("utf-8")) + 1 if not line.isascii() else len(line) + 1)
+
+    def __flush_buffer__(self, final):
+        u"""
+        cut the buffer into blocks and compress them
+        """
+        data = b"".join(self.__buffer__)
+        cut = len(data) if final else len(data) - len(data) % BLOCK_SIZE
+        blocks = [data[i:i + BLOCK_SIZE] for i in range(0, cut, BLOCK_SIZE)]
+        self.__buffer__ = [data[cut:]] if cut < len(data) else []
+        self.__buffer_size__ = len(data) - cut
+
+        if self.__pool__ is not None:
+            compressed = self.__pool__.map(compress_block, blocks, [self.level] * len(blocks))
+        else:
+            compressed = [compress_block(x, self.level) for x in blocks]
+
+        for parts in compressed:
+            for size, block in parts:
+                self.__block_u__.append(self.__u_offset__)
+                self.__block_c__.append(self.__c_offset__)
+                self.__handle__.write(block)
+                self.__u_offset__ += size
+                self.__c_offset__ += len(block)
+
+    def virtual_offset(self, offset):
+        u"""
+        convert the offset of uncompressed data into BGZF virtual offset
+        """
+        if offset >= self.__u_offset__:
+            return self.__c_offset__ << 16
+        idx = bisect_right(self.__block_u__, offset) - 1
+        return (self.__block_c__[idx] << 16) | (offset - self.__block_u__[idx])
+
+    @property
+    def closed(self):
+        return self.__handle__.closed
+
+    def flush(self):
+        self.__handle__.flush()
+
+    def close(self):
+        if self.__handle__.closed:
+            return
+
+        # the last line without newline
+        if self.__partial__ and self.__indexer__ is not None:
+            self.__indexer__.add(self.__partial__, len(self.__partial__.encode("utf-8")))
+            self.__partial__ = ""
+        self.__flush_buffer__(final=True)
+        self.__handle__.write(BGZF_EOF)
+        self.__handle__.close()
+
+        if self.__pool__ is not None:
+            self.__pool__.shutdown()
+
+        if self.__indexer__ is not None and self.__indexer__.sorted:
+            self.__indexer__.write(self.path + ".tbi", self.virtual_offset)
+            return
+
+        if self.__indexer__ is not None:
+            print("%s is not sorted, skip the tabix index" % self.path, file=sys.stderr)
+        # the index of an earlier output would be read by tabix for this one
+        if os.path.exists(self.path + ".tbi"):
+            os.remove(self.path + ".tbi")
+
+    def abort(self):
+        u"""
+        the conversion failed, remove the partial output without the EOF block
+        and the index, so it is never taken as a complete BGZF
+        """
+        if self.__handle__.closed:
+            return
+
+        self.__handle__.close()
+        if self.__pool__ is not None:
+            self.__pool__.shutdown()
+
+        for path in (self.path, self.path + ".tbi"):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class TabixIndexer(object):
+    u"""
+    collect the records while writing, and write the tabix index at last
+    """
+
+    def __init__(self, preset):
+        self.preset = preset
+        self.format, self.col_seq, self.col_beg, self.col_end = TABIX_PRESETS[preset]
+        self.sorted = True
+
+        self.names = []
+        self.__last__ = None
+        self.__offset__ = 0
+
+        # seqid index, 0-based start, end, uncompressed offset of line start and end
+        self.records = [array("l"), array("q"), array("q"), array("q"), array("q")]
+
+    def add(self, line, size):
+        u"""
+        :param line: line without newline
+        :param size: size of the line in bytes, with the newline
+        """
+        start = self.__offset__
+        self.__offset__ += size
+        if not self.sorted or not line or line.startswith("#"):
+            return
+
+        lines = line.split("\t")
+        chrom = lines[self.col_seq - 1]
+        beg = int(lines[self.col_beg - 1])
+        end = int(lines[self.col_end - 1])
+        if not self.format & 0x10000:
+            beg -= 1
+
+        if not self.names or self.names[-1] != chrom:
+            if chrom in self.names:
+                self.sorted = False
+                return
+            self.names.append(chrom)
+        elif beg < self.__last__:
+            self.sorted = False
+            return
+        self.__last__ = beg
+
+        for target, value in zip(self.records, (len(self.names) - 1, beg, max(end, beg + 1), start, self.__offset__)):
+            target.append(value)
+
+    def write(self, path, virtual_offset):
+        u"""
+        :param path: path to .tbi
+        :param virtual_offset: function to convert uncompressed offset into virtual offset
+        """
+        names = b"".join(x.encode("utf-8") + b"\0" for x in self.names)
+        data = [struct.pack("<4s8i", b"TBI\1", len(self.names), self.format,
+                            self.col_seq, self.col_beg, self.col_end, ord("#"), 0, len(names)), names]
+
+        refs, begs, ends, u_starts, u_ends = self.records
+        i, n = 0, len(refs)
+        for ref in range(len(self.names)):
+            bins, linear = {}, []
+            first, last, count = None, None, 0
+            while i < n and refs[i] == ref:
+                v_start, v_end = virtual_offset(u_starts[i]), virtual_offset(u_ends[i])
+                first = v_start if first is None else first
+                last = v_end
+                count += 1
+
+                chunks = bins.setdefault(reg2bin(begs[i], ends[i]), [])
+                if chunks and chunks[-1][1] == v_start:
+                    chunks[-1][1] = v_end
+                else:
+                    chunks.append([v_start, v_end])
+
+                for window in range(begs[i] >> 14, ((ends[i] - 1) >> 14) + 1):
+                    if window >= len(linear):
+                        linear.extend([None] * (window + 1 - len(linear)))
+                    if linear[window] is None:
+                        linear[window] = v_start
+                i += 1
+
+            # the pseudo bin with the statistics, same as htslib
+            if count:
+                bins[37450] = [[first, last], [count, 0]]
+
+            data.append(struct.pack("<i", len(bins)))
+            for bin_id, chunks in bins.items():
+                data.append(struct.pack("<Ii", bin_id, len(chunks)))
+                data.extend(struct.pack("<QQ", x[0], x[1]) for x in chunks)
+
+            for window in range(len(linear)):
+                if linear[window] is None:
+                    linear[window] = linear[window - 1] if window else 0
+            data.append(struct.pack("<i", len(linear)))
+            data.extend(struct.pack("<Q", x) for x in linear)
+
+        data.append(struct.pack("<Q", 0))
+
+        with BgzfWriter(path, threads=1) as w:
+            w.write_bytes(b"".join(data))
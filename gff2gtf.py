@@ -5,33 +5,146 @@ gff3 to gtf format
 """
 import argparse
 import os
-import re
+import resource
 import sys
+from array import array
 
 from tqdm import tqdm
 
+from attributes import GTF
+from cache import add_cache_arguments, cached, open_cache
+from dialect import sniff
+from fileio import open_output
+from profiling import FORMAT, RESOLVE, Profiler, current
+from projection import ALL, Projection, split_names
+from sort import sorted_output
+from store import open_records
+
 __author__ = "Zhang Yiming"
 __version__ = "0.1.1"
 __since__ = 20180927
 
 
+# these never be the parent of others, skipped while building the index
+LEAF_TYPES = {
+    "exon", "CDS", "five_prime_UTR", "three_prime_UTR", "UTR",
+    "start_codon", "stop_codon", "intron", "polyA_site"
+}
+
+# the attributes read by the conversion, the others are only decoded to be written
+KEYS = ("ID", "Parent", "Name", "gene_id", "transcript_id")
+
+# always written, the other attributes could be dropped by --keep-attrs
+LINK_KEYS = ("gene_id", "transcript_id")
+
+
+class ParentIndex(object):
+    u"""
+    compact index of the gene and transcript level records of a gff3
+
+    every ID and name is interned into a string table, the records are kept
+    in arrays indexed by the handle of their ID, instead of dicts of lists
+    """
+
+    GENE = 1
+    TRANSCRIPT = 2
+
+    def __init__(self):
+        self.strings = []
+        self.handles = {}
+        self.kind = array("b")
+        self.parent = array("l")
+        self.name = array("l")
+
+    def intern(self, value):
+        u"""
+        :param value: str
+        :return: int handle of the value
+        """
+        handle = self.handles.get(value)
+        if handle is None:
+            handle = len(self.strings)
+            self.handles[value] = handle
+            self.strings.append(value)
+        return handle
+
+    def add(self, ids, kind, parent, name):
+        u"""
+        :param ids: ID of the record
+        :param kind: GENE or TRANSCRIPT
+        :param parent: ID of the parent, None for genes
+        :param name: gene_name of genes, transcript_name of transcripts
+        """
+        handle = self.intern(ids)
+        parent = self.intern(parent) if parent is not None else -1
+        name = self.intern(name)
+
+        missing = len(self.strings) - len(self.kind)
+        if missing > 0:
+            self.kind.extend([0] * missing)
+            self.parent.extend([-1] * missing)
+            self.name.extend([-1] * missing)
+
+        self.kind[handle] = kind
+        self.parent[handle] = parent
+        self.name[handle] = name
+
+    def get(self, ids):
+        u"""
+        :param ids: ID of the record
+        :return: handle, -1 if the record is not indexed
+        """
+        handle = self.handles.get(ids, -1)
+        if handle < 0 or handle >= len(self.kind) or not self.kind[handle]:
+            return -1
+        return handle
+
+    def is_gene(self, ids):
+        handle = self.get(ids)
+        return handle >= 0 and self.kind[handle] == self.GENE
+
+
 class Gff2Gtf(object):
     u"""
     convert gff3 to gtf
     """
 
-    def __init__(self):
+    def __init__(
+            self, input_file, output, buffer_size=4096, sort=False, memory=1024, tmpdir=None, progress=True,
+            feature_types=None, keep_attrs=None
+    ):
         u"""
+        init this class, the conversion is started by convert()
+        :param input_file: path to gff3 or store
+        :param output: path to output file, - for stdout
+        :param buffer_size: size of output buffer in KB
+        :param sort: sort the output by coordinate, see sort.py
+        :param memory: memory limit of sort in MB
+        :param tmpdir: directory of the sorted runs
+        :param progress: show the progressbar
+        :param feature_types: list of the input feature types to convert, None for all, see projection.py
+        :param keep_attrs: list of the attributes to write besides gene_id and transcript_id, None for all
         """
-        args = self.argument_parser()
-        self.input = os.path.abspath(args.input)
-        self.output = os.path.abspath(args.output)
+        self.input = os.path.abspath(input_file)
+        self.output = os.path.abspath(output) if output != "-" else output
+        self.buffer_size = buffer_size * 1024
+        self.sort = sort
+        self.memory = memory
+        self.tmpdir = tmpdir
+        self.progress = progress
+        self.projection = Projection(feature_types, keep_attrs)
         self.check_dir()
 
-        self.genes = {}
-        self.transcripts = {}
-        self.convert()
-        pass
+        self.index = ParentIndex()
+
+    @staticmethod
+    def peak_rss():
+        u"""
+        peak resident memory of this process in MB
+        """
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on linux, bytes on macOS
+        return rss / 1024 / 1024 if sys.platform == "darwin" else rss / 1024
 
     def check_dir(self):
         u"""
@@ -43,7 +156,7 @@ class Gff2Gtf(object):
 
         outdir = os.path.dirname(self.output)
 
-        if not os.path.exists(outdir):
+        if self.output != "-" and not os.path.exists(outdir):
             os.makedirs(outdir)
 
     @staticmethod
@@ -58,17 +171,73 @@ class Gff2Gtf(object):
         parser.add_argument(
             "-i",
             "--input",
-            help="Path to input file",
+            help="Path to input file, gff3 or store from store.py",
             required=True
         )
 
         parser.add_argument(
             "-o",
             "--output",
-            help="Path to output file",
+            help="Path to output file, - for stdout",
             required=True
         )
 
+        parser.add_argument(
+            "-b",
+            "--buffer-size",
+            type=int,
+            default=4096,
+            help="Size of output buffer in KB, the lines are written once the buffer is full"
+        )
+
+        parser.add_argument(
+            "--sort",
+            action="store_true",
+            default=False,
+            help="Sort the output by chromosome and start, the records of a gene are kept together"
+        )
+
+        parser.add_argument(
+            "--memory",
+            type=int,
+            default=1024,
+            help="Memory limit of --sort in MB, counting the lines and the genes and IDs kept to order them, "
+                 "the sorted runs of lines are merged on disk if larger"
+        )
+
+        parser.add_argument(
+            "--tmpdir",
+            default=None,
+            help="Directory of the sorted runs of --sort"
+        )
+
+        parser.add_argument(
+            "--feature-types",
+            default=None,
+            help="Comma separated feature types of input to convert, eg: gene,mRNA,exon, "
+                 "the genes and transcripts are still indexed to resolve the parents"
+        )
+
+        parser.add_argument(
+            "--keep-attrs",
+            default=None,
+            help="Comma separated attributes to write besides gene_id and transcript_id, eg: gene_name,gene_type"
+        )
+
+        parser.add_argument(
+            "--profile",
+            default=None,
+            help="Path to the json report of the time spent in every stage, - for stderr"
+        )
+
+        parser.add_argument(
+            "--pstats",
+            default=None,
+            help="Path to the cProfile stats, see python -m pstats"
+        )
+
+        add_cache_arguments(parser)
+
         if len(sys.argv[1:]) <= 0:
             parser.print_help()
             exit(0)
@@ -81,124 +250,217 @@ class Gff2Gtf(object):
             exit(0)
 
     @staticmethod
-    def split_gff_detail(line):
+    def concat_dict_to_string(data, keep=None):
         u"""
-        将gff中的信息列，拆分成字典
+        将字典中的键值对构成字符串
+        :param data: dict of attributes
+        :param keep: set of the attributes to write besides LINK_KEYS, None for the ids and names
         """
-        res = {}
+        res = []
 
-        for i in line.split(";"):
-            i = i.split("=")
+        for k, v in data.items():
+            if keep is None:
+                if "id" in k or "name" in k:
+                    res.append("%s \"%s\"" % (k, v))
+            elif k in keep or k in LINK_KEYS:
+                res.append("%s \"%s\"" % (k, v))
+        return "; ".join(res)
 
-            res[i[0]] = i[1] if ":" not in i[1] else i[1].split(":")[1]
-        return res
+    @staticmethod
+    def __keep_index__(label):
+        u"""
+        whether the records of the feature type are read by build_index
+        """
+        return label not in LEAF_TYPES
 
     @staticmethod
-    def concat_dict_to_string(data):
+    def __keep__(label):
         u"""
-        将字典中的键值对构成字符串
+        whether the records of the feature type are read by the conversion
         """
-        res = []
+        return label not in LEAF_TYPES or label == "exon" or label == "CDS"
 
-        for k, v in data.items():
-            if "id" in k or "name" in k:
-                res.append("%s \"%s\"" % (k, v))
-        return "; ".join(res)
+    @staticmethod
+    def build_index(index, records):
+        u"""
+        first pass, collect the genes and transcripts into index
+        the exons and other leaf records are skipped without parsing the attributes
+        :param index: ParentIndex
+        :param records: iterable of (columns, Attributes) with strip_prefix, see store.open_records
+        """
+        for lines, info in records:
+            if info is None or lines[2] in LEAF_TYPES:
+                continue
+
+            ids = info.get("ID")
+            if ids is None:
+                continue
+
+            parents = info.get_list("Parent")
+            if not parents and "gene" in lines[2]:
+                name = info.get("gene_name") or info.get("Name") or "NA"
+                index.add(ids, ParentIndex.GENE, None, name)
+            elif parents:
+                name = info.get("transcript_name") or info.get("Name") or "NA"
+                index.add(ids, ParentIndex.TRANSCRIPT, parents[0], name)
 
     def convert(self):
         u"""
         start to converting
+        the parents are resolved from self.index, so the children could
+        appear before their parents
+        """
+        dialect = sniff(self.input)
+
+        # the exons and other leaf records are skipped by the reader
+        records = open_records(self.input, strip_prefix=True, fmt=dialect.format, keep=self.__keep_index__)
+        records = current().records(records, count=False)
+        self.build_index(self.index, tqdm(records, desc="Indexing", disable=not self.progress))
+
+        with open_output(self.output, index="gff", buffer_size=self.buffer_size) as w, \
+                sorted_output(w, GTF, self.sort, self.memory, self.tmpdir) as w:
+            w.write("#gtf-version 2.2\n")
+            keep = self.projection.narrow(self.__keep__)
+            records = open_records(self.input, strip_prefix=True, fmt=dialect.format, keep=keep)
+            records = tqdm(current().records(records), desc="Converting", disable=not self.progress)
+            w.writelines(self.__format_lines__(self.index, records, self.projection))
+
+    @classmethod
+    def __format_lines__(cls, index, records, projection=ALL):
+        u"""
+        second pass, convert the records into gtf
+        :param index: ParentIndex from build_index
+        :param records: iterable of (columns, Attributes) with strip_prefix, see store.open_records
+        :param projection: the attributes to write, see projection.py, the feature types are
+                           skipped by the reader
+        :return: generator of gtf lines, the comments are kept as they are
         """
-        with open(self.output, "w+") as w:
-            w.write("#gtf-version")
-            with open(self.input) as r:
-                for line in tqdm(r):
-                    if line.startswith("#"):
-                        w.write(line)
-                        continue
+        strings = index.strings
+        keys = projection.keys(KEYS)
+        keep = projection.attributes
+        for lines, attrs in records:
+            if attrs is None:
+                yield lines
+                continue
+
+            lines = lines[:9]
+            if lines[2] not in ("gene", "transcript", "exon", "CDS") and \
+                    lines[2] in LEAF_TYPES:
+                continue
+
+            info = attrs.to_dict(keys=keys)
+            parents = [None]
+
+            # first class. eg: gene
+            if "ID" in info.keys() and \
+                "Parent" not in info.keys() and \
+                    "gene" in lines[2]:
+
+                if "gene_id" not in info.keys():
+                    info["gene_id"] = info["ID"]
 
-                    lines = line.rstrip().split("\t")
-                    info = self.split_gff_detail(lines[-1])
+                if "gene_name" not in info.keys():
+                    info["gene_name"] = info.get("Name", "NA")
 
-                    # first class. eg: gene
-                    if "ID" in info.keys() and \
-                        "Parent" not in info.keys() and \
-                            "gene" in lines[2]:
+            elif "Parent" in info.keys():
+                parents = attrs.get_list("Parent")
 
-                        if "gene_id" not in info.keys():
-                            info["gene_id"] = info["ID"]
+                # second class. eg: transcripts
+                if index.is_gene(parents[0]):
+                    info["gene_id"] = parents[0]
+                    info["gene_name"] = strings[index.name[index.get(parents[0])]]
 
-                        if "gene_name" not in info.keys():
-                            info["gene_name"] = info["Name"]
+                    if "transcript_id" not in info.keys():
+                        info["transcript_id"] = info["ID"]
 
-                        self.genes[info["gene_id"]] = info["gene_name"]
+                    if "transcript_name" not in info.keys():
+                        info["transcript_name"] = info["Name"] if "Name" in info.keys(
+                        ) else "NA"
 
-                    elif "Parent" in info.keys():
+                    info["transcript_type"] = lines[2]
 
-                        # second class. eg: transcripts
-                        if info["Parent"] in self.genes.keys():
-                            info["gene_id"] = info["Parent"]
-                            info["gene_name"] = self.genes[
-                                info["Parent"]
-                            ]
+                    if lines[2] != "CDS":
+                        lines[2] = "transcript"
+                    parents = [None]
 
-                            if "transcript_id" not in info.keys():
-                                info["transcript_id"] = info["ID"]
+                # third class. eg: exons, one line per parent transcript
+                # filled by resolve_transcript
 
-                            if "transcript_name" not in info.keys():
-                                info["transcript_name"] = info["Name"] if "Name" in info.keys(
-                                ) else "NA"
+            if lines[2] not in ("gene", "transcript", "exon", "CDS"):
+                continue
 
-                            self.transcripts[info["transcript_id"]] = [
-                                info["transcript_name"],
-                                info["gene_id"]
-                            ]
+            for parent in parents:
+                record = info
+                if parent is not None:
+                    record = cls.resolve_transcript(index, dict(info), parent, lines[2])
+
+                lines[-1] = cls.concat_dict_to_string(record, keep)
+                yield "\t".join(lines) + "\n"
+
+    @staticmethod
+    def resolve_transcript(index, info, parent, label):
+        u"""
+        fill the transcript and gene of a third class record, eg: exons
+        :param index: ParentIndex
+        :param info: attributes of the record
+        :param parent: ID of the parent transcript
+        :param label: the feature type, third column
+        :return: info
+        """
+        strings = index.strings
 
-                            info["transcript_type"] = lines[2]
+        if "transcript_id" not in info.keys():
+            info["transcript_id"] = parent
 
-                            if lines[2] != "CDS":
-                                lines[2] = "transcript"
+        transcript = index.get(parent)
+        gene = index.parent[transcript] if transcript >= 0 else -1
 
-                        # third class. eg: exons
-                        else:
-                            if "transcript_id" not in info.keys():
-                                info["transcript_id"] = info["Parent"]
+        if "transcript_name" not in info.keys() and transcript >= 0:
+            info["transcript_name"] = strings[index.name[transcript]]
 
-                            transcript = self.transcripts[
-                                info["Parent"]
-                            ]
+        if "gene_id" not in info.keys() and gene >= 0:
+            info["gene_id"] = strings[gene]
 
-                            if "transcript_name" not in info.keys():
-                                info["transcript_name"] = transcript[0]
+        gene = index.get(strings[gene]) if gene >= 0 else -1
+        if "gene_name" not in info.keys() and gene >= 0:
+            info["gene_name"] = strings[index.name[gene]]
 
-                            if "gene_id" not in info.keys():
-                                info["gene_id"] = transcript[1]
+        ele_id = "%s_id" % label.lower()
+        ele_name = "%s_name" % label.lower()
 
-                            if "gene_name" not in info.keys():
-                                info["gene_name"] = self.genes[
-                                    transcript[1]
-                                ]
+        if ele_id not in info.keys() and \
+                "ID" in info.keys():
+            info[ele_id] = info.pop("ID")
 
-                            ele_id = "%s_id" % lines[2].lower()
-                            ele_name = "%s_name" % lines[2].lower()
+        if ele_name not in info.keys() and \
+                "Name" in info.keys():
+            info[ele_name] = info.pop("Name")
+        return info
 
-                            if ele_id not in info.keys() and \
-                                    "ID" in info.keys():
-                                info[ele_id] = info.pop("ID")
 
-                            if ele_name not in info.keys() and \
-                                    "Name" in info.keys():
-                                info[ele_name] = info.pop("Name")
+# the stages of --profile, see profiling.py, the attributes are timed as parse by its COMMON_HOOKS
+PROFILE_HOOKS = (
+    (Gff2Gtf, "build_index", RESOLVE),
+    (Gff2Gtf, "resolve_transcript", RESOLVE),
+    (Gff2Gtf, "__format_lines__", FORMAT),
+    (Gff2Gtf, "concat_dict_to_string", FORMAT),
+)
 
-                    # others just convert and output
-                    else:
-                        pass
 
-                    lines[-1] = self.concat_dict_to_string(info)
+def main():
+    args = Gff2Gtf.argument_parser()
 
-                    if lines[2] in ("gene", "transcript", "exon", "CDS"):
-                        w.write("\t".join(lines) + "\n")
+    converter = Gff2Gtf(
+        args.input, args.output, buffer_size=args.buffer_size, sort=args.sort, memory=args.memory, tmpdir=args.tmpdir,
+        feature_types=split_names(args.feature_types), keep_attrs=split_names(args.keep_attrs)
+    )
+    print(sniff(converter.input), file=sys.stderr)
+    options = dict(sort=args.sort, **converter.projection.options())
+    with Profiler("gff2gtf", report=args.profile, pstats=args.pstats, hooks=PROFILE_HOOKS):
+        cached(converter.convert, open_cache(args.cache, args.cache_size), converter.input, "gff2gtf", options,
+               [converter.output])
+    print("peak RSS: %.1f MB" % converter.peak_rss(), file=sys.stderr)
 
 
 if __name__ == '__main__':
-    Gff2Gtf()
+    main()
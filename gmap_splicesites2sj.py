@@ -2,77 +2,460 @@
 # -*- coding:utf-8 -*-
 u"""
 从gmap的splicesite中提取位点
+
+--reference gencode.gtf labels every junction as known, novel_donor,
+novel_acceptor ... and the distances to the nearest annotated splice sites,
+--junction-format bin|star writes the junctions in the binary format or
+STAR SJ.out.tab instead of text, see junctions.py
 """
+import heapq
+import io
+import os
 import re
+import shutil
+import sys
+import tempfile
+from array import array
+from collections import deque
+from itertools import chain
+from multiprocessing import Pool
 
+import numpy as np
 from fire import Fire
 from tqdm import tqdm
 
+from fileio import is_gzip, open_input, open_output
+from junctions import IntronIndex, JunctionFile, write_star
+from profiling import COUNT, FORMAT, PARSE, READ, RESOLVE, Profiler, current
+
+# size of the shards parsed by --workers, the memory of a worker does not grow with the input
+SHARD_SIZE = 4 * 1024 * 1024
+
+# --junction-format -> suffix of the junctions
+JUNCTION_FORMATS = {"text": ".junctions", "bin": ".junctions.bin", "star": ".SJ.out.tab"}
+
+PATTERN = re.compile(
+    r"^\s+(?P<strand>[+-])(?P<chrom>[\w\.]+):(?P<start>\d+)-(?P<end>\d+)\s+\(\d+-\d+\)\s+\d+%.*"
+)
+
+
+class JunctionCounter(object):
+    u"""
+    junction counts keyed by packed integers instead of formatted strings
+
+    group: chromosome id * 2 + strand, the chromosome ids are in the order of first appearance
+    key: start << 32 | end
+
+    the new junctions are buffered in arrays, and folded into sorted unique keys
+    and counts by numpy. if the tables are larger than the memory budget, they
+    are spilled into sorted runs on disk, and merged at the end
+    """
+
+    RUN_DTYPE = np.dtype([("group", "<u4"), ("key", "<u8"), ("count", "<u4")])
+
+    def __init__(self, memory=1024, tmpdir=None):
+        u"""
+        :param memory: memory budget of the tables in MB
+        :param tmpdir: directory of the spilled runs
+        """
+        self.memory = memory * 1024 * 1024
+        self.tmpdir = tmpdir
+
+        self.chromosomes = {}
+        self.tables = {}
+        self.pending = {}
+        self.pending_size = 0
+        self.runs = []
+
+    def add(self, chromosome, strand, start, end):
+        u"""
+        count a junction
+        """
+        chrom = self.chromosomes.setdefault(chromosome, len(self.chromosomes))
+        group = chrom * 2 + (strand == "-")
+
+        pending = self.pending.get(group)
+        if pending is None:
+            pending = self.pending[group] = array("Q")
+        pending.append(start << 32 | end)
+
+        self.pending_size += 1
+        if self.pending_size >= 1 << 20:
+            self.__fold__()
+
+    def __merge__(self, group, keys, counts):
+        u"""
+        merge the unique keys and their counts into the table of group
+        """
+        table = self.tables.get(group)
+        if table is not None:
+            keys = np.concatenate([table[0], keys])
+            counts = np.concatenate([table[1], counts])
+            keys, index = np.unique(keys, return_inverse=True)
+            counts = np.bincount(index, weights=counts, minlength=len(keys))
+        self.tables[group] = (keys, counts.astype(np.uint32))
+
+    def __fold__(self):
+        u"""
+        merge the pending junctions into tables
+        """
+        for group, pending in self.pending.items():
+            keys, counts = np.unique(np.asarray(pending, dtype=np.uint64), return_counts=True)
+            self.__merge__(group, keys, counts)
+
+        self.pending.clear()
+        self.pending_size = 0
+
+        if sum(len(x[0]) for x in self.tables.values()) * self.RUN_DTYPE.itemsize > self.memory:
+            self.__spill__()
+
+    def export(self):
+        u"""
+        the counts of a shard, to be sent back to the main process
+        :return: (list of chromosomes in order of first appearance, sorted records)
+        """
+        self.__fold__()
+        return list(self.chromosomes.keys()), self.__to_records__()
+
+    def update(self, chromosomes, records):
+        u"""
+        merge the output of export() from a shard
+        the chromosome ids of the shard are mapped into ids of this counter
+        """
+        mapping = np.array(
+            [self.chromosomes.setdefault(x, len(self.chromosomes)) for x in chromosomes], dtype=np.uint32
+        )
+        groups = records["group"]
+        for group in np.unique(groups).tolist():
+            selected = records[groups == group]
+            target = int(mapping[group // 2]) * 2 + group % 2
+            self.__merge__(target, selected["key"], selected["count"])
+
+        if sum(len(x[0]) for x in self.tables.values()) * self.RUN_DTYPE.itemsize > self.memory:
+            self.__spill__()
+
+    def __to_records__(self):
+        u"""
+        tables into one sorted record array
+        """
+        records = np.zeros(sum(len(x[0]) for x in self.tables.values()), dtype=self.RUN_DTYPE)
+        offset = 0
+        for group in sorted(self.tables.keys()):
+            keys, counts = self.tables[group]
+            records["group"][offset:offset + len(keys)] = group
+            records["key"][offset:offset + len(keys)] = keys
+            records["count"][offset:offset + len(keys)] = counts
+            offset += len(keys)
+        return records
+
+    def __spill__(self):
+        u"""
+        write the tables into a sorted run on disk
+        """
+        fd, path = tempfile.mkstemp(suffix=".junctions", dir=self.tmpdir)
+        with os.fdopen(fd, "wb") as w:
+            self.__to_records__().tofile(w)
+        self.runs.append(path)
+        self.tables.clear()
+
+    @staticmethod
+    def __iter_run__(records, step=65536):
+        u"""
+        iterate the records block by block
+        """
+        for i in range(0, len(records), step):
+            block = records[i:i + step]
+            yield from zip(block["group"].tolist(), block["key"].tolist(), block["count"].tolist())
+
+    def items(self):
+        u"""
+        :return: generator of (chromosome, start, end, strand, count), sorted by
+                 chromosome (in order of first appearance), strand, start and end
+        """
+        self.__fold__()
+        streams = [self.__iter_run__(self.__to_records__())]
+        streams += [self.__iter_run__(np.memmap(x, dtype=self.RUN_DTYPE, mode="r")) for x in self.runs]
+
+        chromosomes = list(self.chromosomes.keys())
+
+        def decode(group, key, count):
+            return chromosomes[group // 2], key >> 32, key & 0xffffffff, "+-"[group % 2], count
+
+        last, count = None, 0
+        try:
+            for group, key, value in heapq.merge(*streams):
+                if (group, key) != last:
+                    if last is not None:
+                        yield decode(last[0], last[1], count)
+                    last, count = (group, key), 0
+                count += value
+
+            if last is not None:
+                yield decode(last[0], last[1], count)
+        finally:
+            for path in self.runs:
+                os.remove(path)
+            self.runs = []
+
 
 class converter(object):
 
-    def __init__(self, infile, outfile):
+    def __init__(
+            self, infile, outfile, memory=1024, tmpdir=None, workers=1, buffer_size=4096, profile=None, pstats=None,
+            reference=None, junction_format="text"
+    ):
+        u"""
+        :param infile: gmap -A output
+        :param outfile: read level output, the junctions are written into outfile.junctions
+        :param memory: memory budget of the junction table in MB, spill to disk if larger
+        :param tmpdir: directory of the spilled junctions
+        :param workers: number of processes to parse the shards of infile
+        :param buffer_size: size of output buffer in KB
+        :param profile: path to the json report of the time spent in every stage, - for stderr
+        :param pstats: path to the cProfile stats
+        :param reference: path to the reference gtf|gff3, the junctions are labeled by its introns
+        :param junction_format: text, bin (binary junctions) or star (SJ.out.tab), see junctions.py
+        """
+        if junction_format not in JUNCTION_FORMATS:
+            raise ValueError("unknown junction format %s, choose from %s" % (
+                junction_format, ",".join(JUNCTION_FORMATS.keys())
+            ))
         self.infile = infile
         self.outfile = outfile
+        self.tmpdir = tmpdir
+        self.workers = max(int(workers), 1)
+        self.buffer_size = int(buffer_size) * 1024
+        self.reference = reference
+        self.junction_format = junction_format
 
-        self.data = []
-        self.junctions = {}
-        self.__convert__()
+        self.junctions = JunctionCounter(memory=memory, tmpdir=tmpdir)
+        # Fire takes the flag without value as True, eg: --profile
+        profile = "-" if profile is True else profile
+        with Profiler("gmap_splicesites2sj", report=profile, pstats=pstats, hooks=PROFILE_HOOKS):
+            self.__convert__()
 
-    def __convert__(self):
+    @staticmethod
+    def __junctions_path__(outfile, fmt="text"):
+        u"""
+        path to the junctions, keep the compression suffix at the end, the binary junctions are never compressed
+        """
+        suffix = JUNCTION_FORMATS[fmt]
+        for compression in (".gz", ".bgz"):
+            if outfile.endswith(compression):
+                return outfile[:-len(compression)] + suffix + ("" if fmt == "bin" else compression)
+        return outfile + suffix
+
+    @staticmethod
+    def __format_read__(chromosome, strand, current):
+        u"""
+        :param chromosome: chromosome of the alignment
+        :param strand: strand of the alignment
+        :param current: start and end of all the exons
+        :return: the read level line, and list of (start, end) of junctions
+        """
+        current = sorted(current)
+
+        gene_range = "%s\t%d\t%d\t%s" % (
+            chromosome,
+            current[0],
+            current[-1],
+            strand
+        )
+
+        junctions = []
+        for i in range(1, len(current) - 1, 2):
+            junctions.append((current[i] + 1, current[i + 1] - 1))
+
+        return "%s\t%s" % (
+            gene_range, ",".join(["%d,%d" % x for x in junctions])
+        ), junctions
+
+    @classmethod
+    def __parse_reads__(cls, lines):
+        u"""
+        :param lines: lines of gmap -A output
+        :return: generator of (read level line, chromosome, strand, junctions)
+        """
         current = []
         strand = "."
         chromosome = "."
-        pattern = r"^\s+(?P<strand>[+-])(?P<chrom>[\w\.]+):(?P<start>\d+)-(?P<end>\d+)\s+\(\d+-\d+\)\s+\d+%.*"
-        with open(self.infile) as r:
-            for line in tqdm(r):
-                data = re.search(pattern, line)
-
-                if not data:
-                    if current:
-                        current = sorted(current)
-
-                        gene_range = "%s\t%d\t%d\t%s" % (
-                            chromosome,
-                            current[0],
-                            current[-1],
-                            strand
-                        )
-
-                        junctions = []
-                        for i in range(1, len(current) - 1, 2):
-                            junctions.append(current[i] + 1)
-                            junctions.append(current[i + 1] - 1)
-
-                            key = "%s\t%d\t%d\t%s" % (
-                                chromosome,
-                                current[i] + 1,
-                                current[i + 1] - 1,
-                                strand
-                            )
-
-                            if key in self.junctions.keys():
-                                self.junctions[key] += 1
-                            else:
-                                self.junctions[key] = 1
-
-                        current.clear()
-
-                        self.data.append("%s\t%s" % (
-                            gene_range, ",".join([str(x) for x in junctions])
-                        ))
-                    continue
-
-                chromosome, strand = data["chrom"], data["strand"]
-                current.append(int(data["start"]))
-                current.append(int(data["end"]))
-
-        with open(self.outfile, "w+") as w:
-            w.write("\n".join(self.data))
-
-        with open(self.outfile + ".junctions", "w+") as w:
-            for key, value in self.junctions.items():
-                w.write("%s\t%d\n" % (key, value))
+        # the last read is complete at the end of file
+        for line in chain(lines, [""]):
+            data = PATTERN.search(line)
+
+            if not data:
+                if current:
+                    line, junctions = cls.__format_read__(chromosome, strand, current)
+                    current.clear()
+                    yield line, chromosome, strand, junctions
+                continue
+
+            chromosome, strand = data["chrom"], data["strand"]
+            current.append(int(data["start"]))
+            current.append(int(data["end"]))
+
+    def __shards__(self):
+        u"""
+        split the input at the lines between alignments
+        :return: generator of (start, end, text), the byte offsets of plain text,
+                 or the text of gzip which is read in the main process
+        """
+        if is_gzip(self.infile):
+            with open_input(self.infile) as r:
+                while True:
+                    lines = r.readlines(SHARD_SIZE)
+                    if not lines:
+                        break
+                    # extend to the end of current alignment
+                    while PATTERN.search(lines[-1]):
+                        line = r.readline()
+                        if not line:
+                            break
+                        lines.append(line)
+                    yield None, None, "".join(lines)
+            return
+
+        size = os.path.getsize(self.infile)
+        step = SHARD_SIZE
+
+        with open(self.infile, "rb") as r:
+            start = 0
+            while start < size:
+                r.seek(start + step)
+                r.readline()
+                # the shard ends after a line which is not part of an alignment
+                while True:
+                    line = r.readline()
+                    if not line or not PATTERN.search(line.decode("utf-8")):
+                        break
+                end = min(r.tell(), size)
+                yield start, end, None
+                start = end
+
+    def __convert__(self):
+        first = True
+        with open_output(self.outfile, buffer_size=self.buffer_size) as w:
+            if self.workers > 1:
+                self.__convert_shards__(w)
+            else:
+                with open_input(self.infile) as r:
+                    # the reads are written once they are complete
+                    lines = current().iterate(tqdm(r), READ)
+                    for line, chromosome, strand, junctions in self.__parse_reads__(lines):
+                        for start, end in junctions:
+                            self.junctions.add(chromosome, strand, start, end)
+
+                        w.write(line if first else "\n" + line)
+                        first = False
+
+        introns = IntronIndex.load(self.reference) if self.reference is not None else None
+        path = self.__junctions_path__(self.outfile, self.junction_format)
+
+        if self.junction_format == "bin":
+            JunctionFile.build(path, self.__labeled__(introns))
+        elif self.junction_format == "star":
+            write_star(self.__labeled__(introns), path)
+        elif introns is None:
+            with open_output(path, buffer_size=self.buffer_size) as w:
+                for chromosome, start, end, strand, count in self.junctions.items():
+                    w.write("%s\t%d\t%d\t%s\t%d\n" % (chromosome, start, end, strand, count))
+        else:
+            with open_output(path, buffer_size=self.buffer_size) as w:
+                for chromosome, start, end, strand, count in self.junctions.items():
+                    label, donor, acceptor = introns.annotate(chromosome, start, end, strand)
+                    w.write("%s\t%d\t%d\t%s\t%d\t%s\t%s\t%s\n" % (
+                        chromosome, start, end, strand, count, label,
+                        "NA" if donor is None else donor, "NA" if acceptor is None else acceptor
+                    ))
+
+        if introns is not None:
+            print("junctions: %s" % introns.summary(), file=sys.stderr)
+
+    def __convert_shards__(self, w):
+        u"""
+        parse the shards by the workers, the read level lines of every shard
+        are written into a temp file by the worker, and copied into w in order.
+        at most 2 shards per worker are in flight, so neither the shards nor
+        their results pile up in memory
+        :param w: the read level output
+        """
+        first = True
+        temp = tempfile.mkdtemp(prefix="gmap_shards", dir=self.tmpdir)
+        progress = tqdm(desc="Shards")
+
+        def collect(result):
+            nonlocal first
+            path, (chromosomes, records) = result.get()
+            self.junctions.update(chromosomes, records)
+            with open(path) as r:
+                chunk = r.read(SHARD_SIZE)
+                if chunk and not first:
+                    w.write("\n")
+                while chunk:
+                    w.write(chunk)
+                    first = False
+                    chunk = r.read(SHARD_SIZE)
+            os.remove(path)
+            progress.update()
+
+        try:
+            with Pool(self.workers) as p:
+                pending = deque()
+                for start, end, text in self.__shards__():
+                    pending.append(p.apply_async(__parse_shard__, ((self.infile, start, end, text, temp),)))
+                    if len(pending) >= self.workers * 2:
+                        collect(pending.popleft())
+                while pending:
+                    collect(pending.popleft())
+        finally:
+            progress.close()
+            shutil.rmtree(temp, ignore_errors=True)
+
+    def __labeled__(self, introns):
+        u"""
+        :param introns: IntronIndex, None without reference
+        :return: generator of (chromosome, start, end, strand, count, label), label is None without reference
+        """
+        for chromosome, start, end, strand, count in self.junctions.items():
+            label = introns.annotate(chromosome, start, end, strand)[0] if introns is not None else None
+            yield chromosome, start, end, strand, count, label
+
+
+# the stages of --profile, see profiling.py
+PROFILE_HOOKS = (
+    (converter, "__parse_reads__", PARSE),
+    (converter, "__format_read__", FORMAT),
+    (JunctionCounter, "add", COUNT),
+    (JunctionCounter, "__fold__", COUNT),
+    (JunctionCounter, "update", COUNT),
+    (JunctionCounter, "items", COUNT),
+    (IntronIndex, "annotate", RESOLVE),
+)
+
+
+def __parse_shard__(args):
+    u"""
+    parse a shard of gmap -A output in the sub-process
+    :param args: (path, start offset, end offset, text of gzip, directory of the read level lines)
+    :return: (path to the read level lines joined by newline, JunctionCounter.export())
+    """
+    path, start, end, text, tmpdir = args
+    if text is None:
+        with open(path, "rb") as r:
+            r.seek(start)
+            text = r.read(end - start).decode("utf-8")
+
+    counter = JunctionCounter(memory=1 << 20)
+    fd, output = tempfile.mkstemp(suffix=".reads", dir=tmpdir)
+    with os.fdopen(fd, "w") as w:
+        first = True
+        for line, chromosome, strand, junctions in converter.__parse_reads__(io.StringIO(text, newline=None)):
+            for start, end in junctions:
+                counter.add(chromosome, strand, start, end)
+            w.write(line if first else "\n" + line)
+            first = False
+
+    return output, counter.export()
 
 
 if __name__ == '__main__':
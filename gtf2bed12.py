@@ -35,33 +35,73 @@ blockStarts - A comma-separated list of block starts.
     Allowed yet ignored by bedtools.
 """
 import argparse
+import contextlib
 import os
 import re
 import sys
+from array import array
+from bisect import bisect_right
 
+import numpy as np
 from tqdm import tqdm
 
+from attributes import GFF3
+from cache import add_cache_arguments, cached, open_cache
+from dialect import sniff
+from fileio import open_output
+from incremental import IncrementalError, IncrementalWriter, SegmentKey, remove_manifest
+from profiling import FORMAT, PARSE, RESOLVE, Profiler, current
+from projection import ALL, Projection, split_names
+from sort import BED, sorted_output
+from store import open_records
+
 __author__ = "Zhang Yiming"
 __since__ = "2020.01.13"
 
 
+# number of exons and transcripts of the genes flushed together by --stream
+STREAM_BATCH = 50000
+
+
 class Gtf2Bed12(object):
 
-    def __init__(self):
+    def __init__(
+            self, input_file, output, buffer_size=4096, incremental=False, sort=False, memory=1024, tmpdir=None,
+            progress=True, feature_types=None, genes=None, introns=None, meta_exons=None, stream=False
+    ):
         u"""
-        init this class
+        init this class, the conversion is started by convert()
+        :param input_file: path to gtf, gff3 or store
+        :param output: path to output file, - for stdout
+        :param buffer_size: size of output buffer in KB
+        :param incremental: only convert the changed genes, see incremental.py
+        :param sort: sort the output by coordinate, see sort.py
+        :param memory: memory limit of sort in MB
+        :param tmpdir: directory of the sorted runs
+        :param progress: show the progressbar
+        :param feature_types: list of the input feature types to read, None for all, see projection.py
+        :param genes: path to the bed6 of gene spans, written in the same pass, None to skip
+        :param introns: path to the bed6 of introns, named by transcript, None to skip
+        :param meta_exons: path to the bed6 of the merged exons of every gene, None to skip
+        :param stream: write the genes once they are complete, see __convert_streaming__
         """
-        args = self.argument_parser()
-        print(args)
-        self.input = os.path.abspath(args.input)
-        self.output = os.path.abspath(args.output)
+        self.input = os.path.abspath(input_file)
+        self.output = os.path.abspath(output) if output != "-" else output
+        self.buffer_size = buffer_size * 1024
+        self.sort = sort
+        self.memory = memory
+        self.tmpdir = tmpdir
+        self.incremental = incremental
+        self.progress = progress
+        self.stream = stream
+        self.projection = Projection(feature_types)
+        self.extras = [
+            (os.path.abspath(path), label) for path, label in (
+                (genes, "gene_bed"), (introns, "intron_bed"), (meta_exons, "meta_exon_bed")
+            ) if path
+        ]
         self.check_dir()
 
-        self.genes = {}
-        self.transcripts = {}
-        self.convert()
-        pass
-
     def check_dir(self):
         u"""
         检查输入文件
@@ -72,9 +112,13 @@ class Gtf2Bed12(object):
 
         out_dir = os.path.dirname(self.output)
 
-        if not os.path.exists(out_dir):
+        if self.output != "-" and not os.path.exists(out_dir):
             os.makedirs(out_dir)
 
+        for path, _ in self.extras:
+            if not os.path.exists(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+
     @staticmethod
     def argument_parser():
         u"""
@@ -87,17 +131,98 @@ class Gtf2Bed12(object):
         parser.add_argument(
             "-i",
             "--input",
-            help="Path to input file",
+            help="Path to input file, gtf, gff3 or store from store.py",
             required=True
         )
 
         parser.add_argument(
             "-o",
             "--output",
-            help="Path to output file",
+            help="Path to output file, - for stdout",
             required=True
         )
 
+        parser.add_argument(
+            "-b",
+            "--buffer-size",
+            type=int,
+            default=4096,
+            help="Size of output buffer in KB, the lines are written once the buffer is full"
+        )
+
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            default=False,
+            help="Only convert the genes changed since last run, the others are copied from the old output"
+        )
+
+        parser.add_argument(
+            "--sort",
+            action="store_true",
+            default=False,
+            help="Sort the output by chromosome and start, the records of a gene are kept together"
+        )
+
+        parser.add_argument(
+            "--memory",
+            type=int,
+            default=1024,
+            help="Memory limit of --sort in MB, the sorted runs are merged on disk if larger"
+        )
+
+        parser.add_argument(
+            "--tmpdir",
+            default=None,
+            help="Directory of the sorted runs of --sort"
+        )
+
+        parser.add_argument(
+            "--feature-types",
+            default=None,
+            help="Comma separated feature types to read, eg: mRNA,exon to skip the CDS and the non-coding transcripts"
+        )
+
+        parser.add_argument(
+            "--stream",
+            action="store_true",
+            default=False,
+            help="Write the transcripts once their gene is complete, the memory stays flat for the inputs grouped "
+                 "by gene; the inputs out of order are converted as a whole"
+        )
+
+        parser.add_argument(
+            "--genes",
+            default=None,
+            help="Path to the bed6 of gene spans, derived from the same pass"
+        )
+
+        parser.add_argument(
+            "--introns",
+            default=None,
+            help="Path to the bed6 of introns named by transcript, derived from the same pass"
+        )
+
+        parser.add_argument(
+            "--meta-exons",
+            default=None,
+            help="Path to the bed6 of the merged exons of every gene, derived from the same pass"
+        )
+
+        parser.add_argument(
+            "--profile",
+            default=None,
+            help="Path to the json report of the time spent in every stage, - for stderr"
+        )
+
+        parser.add_argument(
+            "--pstats",
+            default=None,
+            help="Path to the cProfile stats, see python -m pstats"
+        )
+
+        add_cache_arguments(parser)
+
         if len(sys.argv[1:]) <= 0:
             parser.print_help()
             exit(0)
@@ -110,94 +235,516 @@ class Gtf2Bed12(object):
             exit(0)
 
     @staticmethod
-    def __split_gtf_details__(line):
-        u"""
-        format gtf detailed messages into dict
-        :param line: columns like gene_id "gene"; transcript_id "transcript";
-        :return: dict {"gene_id": "gene"}
-        """
-
-        data = {}
-        for message in line.strip().split(";"):
-            if not message:
-                continue
-
-            key, value = re.split(r"[=\s]", message.strip())[:2]
-            data[key.lower()] = re.sub(r"[\";]", "", value if ":" not in message else value.split(":")[1])
-        return data
-
-    @staticmethod
-    def __get_value_from_data__(data, target, pop=True):
+    def __get_value_from_data__(data, target, pop=True, dialect=None):
         u"""
         从gtf的详细列中构建出的字典，从其中提取出所需要的数据
         但是由于有多个可能性，比如：gene_id, geneID, ID等等，不同的标准下的gtf文件，太烦人了
         因此，在此通过正则来处理这个问题
         :param data: 从gtf文件中，提取出的字典信息
         :param target: 所要提取数据的目标，为gene_id等标签
+        :param dialect: Dialect, the known keys are looked up directly
         :return: string
         """
+        if dialect is not None:
+            value = dialect.get(data, target, pop)
+            if value is not None:
+                return value
+
         ids = [target, target.replace("_", ""), target.split("_")[-1]]
         for i in ids:
-            if i in data.keys():
-                return data.pop(i) if pop else data[i]
+            if i in data:
+                return data.pop(i) if pop and isinstance(data, dict) else data[i]
         return "NA"
 
     @staticmethod
-    def __format_bed12_exons__(data: (int, list)) -> str:
+    def __format_bed12_exons__(index, starts, ends, n):
         u"""
         将外显子信息转换为三个值，总外显子数，外显子长度以及外显子的相对位置
-        :param data: 由self.__split_gtf_details__构造的字典
-        :return: string
+        all the transcripts are computed at once
+        :param index: numpy array, index of the transcript of every exon
+        :param starts: numpy array, start of every exon
+        :param ends: numpy array, end of every exon
+        :param n: number of transcripts
+        :return: list of string, one per transcript
         """
-        data = sorted(data, key=lambda x: x[0])
+        order = np.lexsort((starts, index))
+        index, starts, ends = index[order], starts[order], ends[order]
+
+        # CSR offsets, exons of transcript i are offsets[i]:offsets[i + 1]
+        counts = np.bincount(index, minlength=n)
+        offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
 
-        sizes = []
-        pos = []
-        for i in data:
-            sizes.append(str(i[1] - i[0]))
-            pos.append(str(i[0] - data[0][0]))
+        first = np.repeat(starts[offsets[:-1][counts > 0]], counts[counts > 0])
+        sizes = (ends - starts).astype(str).tolist()
+        pos = (starts - first).astype(str).tolist()
 
-        return "\t".join([str(len(data)), ",".join(sizes), ",".join(pos)])
+        return [
+            "%d\t%s\t%s" % (c, ",".join(sizes[o:o + c]), ",".join(pos[o:o + c]))
+            for c, o in zip(counts.tolist(), offsets[:-1].tolist())
+        ]
+
+    @staticmethod
+    def __format_thick__(index, starts, ends, n):
+        u"""
+        thickStart and thickEnd of every transcript from its CDS
+        :param index: numpy array, index of the transcript of every CDS
+        :param starts: numpy array, start of every CDS
+        :param ends: numpy array, end of every CDS
+        :param n: number of transcripts
+        :return: (thickStart, thickEnd) numpy arrays, -1 for non-coding transcripts
+        """
+        thick_start = np.full(n, np.iinfo(np.int64).max, dtype=np.int64)
+        thick_end = np.full(n, -1, dtype=np.int64)
+        np.minimum.at(thick_start, index, starts)
+        np.maximum.at(thick_end, index, ends)
+        thick_start[thick_end < 0] = -1
+        return thick_start, thick_end
 
     def convert(self):
         u"""
         进行转化
+        the exons and CDS are kept in flat arrays, and the blocks of all
+        transcripts are formatted together after reading
         :return:
         """
-        transcripts = {}
-        with open(self.output, "w+") as w:
-            with open(self.input) as r:
-                for line in tqdm(r, desc="Reading"):
-                    if line.startswith("#"):
-                        continue
+        if self.output != "-":
+            if self.incremental and self.sort:
+                print("the sorted output could not be patched, convert the whole file", file=sys.stderr)
+            elif self.incremental and self.extras:
+                print("the genes, introns and meta exons need the whole model, convert the whole file", file=sys.stderr)
+            elif self.incremental:
+                try:
+                    self.__convert_incremental__()
+                    return
+                except IncrementalError as err:
+                    print("%s, convert the whole file" % err, file=sys.stderr)
+            remove_manifest(self.output)
+
+        if self.stream:
+            try:
+                self.__convert_streaming__()
+                return
+            except IncrementalError as err:
+                # the sorted lines are kept until the end, nothing is written yet
+                if self.output == "-" and not self.sort:
+                    raise ValueError("%s, the lines written to stdout could not be taken back, "
+                                     "convert without --stream" % err)
+                print("%s, convert the whole file" % err, file=sys.stderr)
+
+        model = TranscriptModel().load(self.input, progress=self.progress, projection=self.projection)
+
+        with open_output(self.output, index="bed", buffer_size=self.buffer_size) as w, \
+                sorted_output(w, BED, self.sort, self.memory, self.tmpdir) as w:
+            w.writelines(tqdm(model.bed12(), total=len(model.records), desc="Writing", disable=not self.progress))
+
+        # derived from the same model, the input is not read again
+        for path, label in self.extras:
+            with open_output(path, index="bed", buffer_size=self.buffer_size) as w, \
+                    sorted_output(w, BED, self.sort, self.memory, self.tmpdir) as w:
+                w.writelines(getattr(model, label)())
+
+    def __convert_streaming__(self):
+        u"""
+        read the genes in batches, and write the bed12 and the extras of every
+        batch once the next gene starts, the outputs are the same as convert()
+        :raise IncrementalError: the records of a gene or transcript are not consecutive,
+                                 the outputs are incomplete, and should be converted again
+        """
+        dialect = sniff(self.input)
+        keep = self.projection.narrow(TranscriptModel(dialect).__keep__)
+        records = current().records(open_records(self.input, strip_prefix=True, fmt=dialect.format, keep=keep))
+
+        outputs = [(self.output, "bed12")] + [(path, label) for path, label in self.extras]
+        with contextlib.ExitStack() as stack:
+            writers = []
+            for path, label in outputs:
+                w = stack.enter_context(open_output(path, index="bed", buffer_size=self.buffer_size))
+                # the memory of --sort is shared by the outputs
+                w = stack.enter_context(sorted_output(w, BED, self.sort, self.memory // len(outputs), self.tmpdir))
+                writers.append((w, label))
+
+            for model in tqdm(TranscriptModel.stream(records, dialect), desc="Streaming", disable=not self.progress):
+                for w, label in writers:
+                    w.writelines(getattr(model, label)())
+
+    def __convert_incremental__(self):
+        u"""
+        only convert the genes changed since last run, see incremental.py
+        the changed genes of a batch share one TranscriptModel, and the
+        transcripts are split back by the range of their indices
+        """
+        dialect = sniff(self.input)
+        keep = self.projection.narrow(TranscriptModel(dialect).__keep__)
+
+        def convert(segments):
+            model = TranscriptModel(dialect)
+            bounds = []
+            for _, segment, _ in segments:
+                start = len(model.transcripts)
+                for lines, data in segment:
+                    model.add(lines, data)
+                bounds.append((start, len(model.transcripts)))
+
+            indices = [[] for _ in segments]
+            for idx in model.records.keys():
+                indices[bisect_right(bounds, (idx, float("inf"))) - 1].append(idx)
+            return ["".join(model.bed12(x)) for x in indices]
+
+        # the exons could come before their transcripts in gff3, and the genes
+        # are dropped by keep, so the top ancestors are read from all the records first
+        key = SegmentKey(dialect)
+        if dialect.format == GFF3:
+            key.index(open_records(self.input, strip_prefix=True, fmt=dialect.format))
+
+        records = open_records(self.input, strip_prefix=True, fmt=dialect.format, keep=keep)
+        IncrementalWriter(self.output, "gtf2bed12", self.projection.options()).run(
+            current().records(records), key, convert,
+            index="bed", buffer_size=self.buffer_size
+        )
+
+
+class TranscriptModel(object):
+    u"""
+    transcripts of gtf|gff3, and their exons and CDS in flat arrays
+    tagged with the index of the transcript
+    """
+
+    def __init__(self, dialect=None):
+        u"""
+        :param dialect: Dialect of the input, detected by load() if not set
+        """
+        self.dialect = dialect
+        # feature type -> whether it is a transcript, eg: mRNA, lnc_RNA
+        self.__types__ = {}
+
+        # transcript id -> index in the arrays, the exons could come before the transcript
+        self.transcripts = {}
+        # index -> [chrom, start, end, transcript id, score, strand]
+        self.records = {}
+        # index -> gene id
+        self.genes = {}
+
+        self.exons = (array("l"), array("l"), array("l"))
+        self.cds = (array("l"), array("l"), array("l"))
+        self.__blocks__ = None
+
+    def __get_parent__(self, data):
+        u"""
+        transcript of exon and CDS
+        """
+        parent = "NA"
+        if data.format != GFF3:
+            parent = Gtf2Bed12.__get_value_from_data__(data, "transcript_id", False, self.dialect)
+        if parent == "NA":
+            parent = Gtf2Bed12.__get_value_from_data__(data, "Parent", False, self.dialect)
+        return parent
+
+    def __get_transcript__(self, data):
+        u"""
+        id of transcript, gff3 links the records by ID and Parent
+        """
+        transcript_id = "NA"
+        if data.format != GFF3:
+            transcript_id = Gtf2Bed12.__get_value_from_data__(data, "transcript_id", True, self.dialect)
+        if transcript_id == "NA":
+            transcript_id = Gtf2Bed12.__get_value_from_data__(data, "ID", True, self.dialect)
+        return transcript_id
+
+    def __get_gene__(self, data):
+        u"""
+        gene of transcript
+        """
+        gene_id = "NA"
+        if data.format != GFF3:
+            gene_id = Gtf2Bed12.__get_value_from_data__(data, "gene_id", False, self.dialect)
+        if gene_id == "NA":
+            gene_id = Gtf2Bed12.__get_value_from_data__(data, "Parent", False, self.dialect)
+        return gene_id
+
+    def __is_transcript__(self, label):
+        u"""
+        whether the feature type is a transcript, the types are checked once
+        """
+        res = self.__types__.get(label)
+        if res is None:
+            res = self.__types__[label] = re.search("(transcript|mRNA)", label, re.I) is not None
+        return res
+
+    def __keep__(self, label):
+        u"""
+        whether the records of the feature type are used
+        """
+        return label == "exon" or label == "CDS" or self.__is_transcript__(label)
+
+    def add(self, lines, data):
+        u"""
+        add a record
+        :param lines: columns of gtf|gff3
+        :param data: Attributes of this record, with strip_prefix
+        """
+        if self.__is_transcript__(lines[2]):
+            transcript_id = self.__get_transcript__(data)
+            gene_id = self.__get_gene__(data)
 
-                    lines = line.split("\t")
-                    data = self.__split_gtf_details__(lines[8])
+            idx = self.transcripts.setdefault(transcript_id, len(self.transcripts))
+            self.records[idx] = [lines[0], lines[3], lines[4], transcript_id, "255", lines[6]]
+            self.genes[idx] = gene_id
+            self.__blocks__ = None
 
-                    if re.search("(transcript|mRNA)", lines[2], re.I):
+        elif lines[2] == "exon" or lines[2] == "CDS":
+            parent = self.__get_parent__(data)
 
-                        transcript_id = self.__get_value_from_data__(data, "transcript_id", True)
-                        if transcript_id == "NA":
-                            transcript_id = self.__get_value_from_data__(data, "ID", True)
+            target = self.exons if lines[2] == "exon" else self.cds
+            target[0].append(self.transcripts.setdefault(parent, len(self.transcripts)))
+            target[1].append(int(lines[3]))
+            target[2].append(int(lines[4]))
+            self.__blocks__ = None
 
-                        transcripts[transcript_id] = [
-                            lines[0], lines[3], lines[4], transcript_id, "255", lines[6],
-                            lines[3], lines[4], "255,0,0", []
-                        ]
+    def load(self, path, progress=True, projection=ALL):
+        u"""
+        read gtf, gff3 or store
+        :param path: path to input file
+        :param progress: show the progressbar
+        :param projection: the feature types to read, see projection.py
+        :return: self
+        """
+        if self.dialect is None:
+            self.dialect = sniff(path)
+
+        # the other features are skipped by the reader, eg: start_codon, UTR
+        records = open_records(path, strip_prefix=True, fmt=self.dialect.format, keep=projection.narrow(self.__keep__))
+        records = current().records(records)
+        for lines, data in tqdm(records, desc="Reading", disable=not progress):
+            # only the ids are needed, the other attributes are never decoded
+            if data is not None:
+                self.add(lines, data)
+        return self
+
+    @classmethod
+    def stream(cls, records, dialect, batch_size=STREAM_BATCH):
+        u"""
+        split the records into the models of consecutive genes, a model is
+        yielded once it holds batch_size exons and transcripts and a transcript
+        of the next gene comes, only the ids of the yielded genes and transcripts are kept
+        :param records: iterable of (columns, Attributes), with strip_prefix
+        :param dialect: Dialect of the records
+        :param batch_size: number of exons and transcripts per model
+        :return: generator of TranscriptModel, in the order of the records
+        :raise IncrementalError: the records of a gene or transcript are not consecutive
+        """
+        model = cls(dialect)
+        genes, transcripts = set(), set()
+
+        def done(model):
+            # the ids of an earlier model, eg: the exons after another gene, or before their parents in gff3
+            for seen, ids, label in ((transcripts, model.transcripts.keys(), "transcript"),
+                                     (genes, model.genes.values(), "gene")):
+                shared = seen.intersection(ids)
+                shared.discard("NA")
+                if shared:
+                    raise IncrementalError("the records of %s %s are not consecutive" % (label, min(shared)))
+                seen.update(ids)
+            return model
+
+        # the genes are only decoded again once the model is full
+        is_transcript, last = model.__is_transcript__, None
+        for lines, data in records:
+            if data is None:
+                continue
 
-                    elif lines[2] == "exon":
-                        parent = self.__get_value_from_data__(data, "transcript_id", False)
-                        if parent == "NA":
-                            parent = self.__get_value_from_data__(data, "Parent", False)
+            if is_transcript(lines[2]) and len(model.exons[0]) + len(model.records) >= batch_size:
+                gene = model.__get_gene__(data)
+                if last is None:
+                    last = next(reversed(model.genes.values()), gene)
+                if gene != last:
+                    yield done(model)
+                    model = cls(dialect)
+                    is_transcript, last = model.__is_transcript__, None
+            model.add(lines, data)
 
-                        temp = transcripts.get(parent, [])
-                        temp[-1].append([int(lines[3]), int(lines[4])])
-                        transcripts[parent] = temp
+        if model.transcripts:
+            yield done(model)
 
-            for transcript in tqdm(transcripts.values()):
-                transcript[-1] = self.__format_bed12_exons__(transcript[-1])
-                w.write("\t".join(transcript) + "\n")
+    def gene_spans(self):
+        u"""
+        span of every gene, from all its transcripts, the genes without id are skipped
+        :return: dict of gene id -> [chrom, start, end, strand], in order of first transcript
+        """
+        genes = {}
+        for idx, record in self.records.items():
+            gene_id = self.genes[idx]
+            if gene_id == "NA":
+                continue
+            start, end = int(record[1]), int(record[2])
+            gene = genes.get(gene_id)
+            if gene is None:
+                genes[gene_id] = [record[0], start, end, record[5]]
+            else:
+                gene[1] = min(gene[1], start)
+                gene[2] = max(gene[2], end)
+        return genes
+
+    def arrays(self, label="exon"):
+        u"""
+        :param label: exon or CDS
+        :return: (transcript index, start, end) numpy arrays
+        """
+        target = self.exons if label == "exon" else self.cds
+        return tuple(np.asarray(x, dtype=np.int64) for x in target)
+
+    def introns(self):
+        u"""
+        the gaps between the consecutive exons of every transcript, the overlapping
+        or adjacent exons leave no intron
+        :return: (transcript index, first base, last base) numpy arrays, sorted by transcript and start
+        """
+        transcripts, starts, ends = self.arrays("exon")
+        order = np.lexsort((starts, transcripts))
+        transcripts, starts, ends = transcripts[order], starts[order], ends[order]
+
+        same = transcripts[1:] == transcripts[:-1]
+        transcripts = transcripts[1:][same]
+        intron_starts = ends[:-1][same] + 1
+        intron_ends = starts[1:][same] - 1
+
+        valid = intron_ends >= intron_starts
+        return transcripts[valid], intron_starts[valid], intron_ends[valid]
+
+    def meta_exons(self):
+        u"""
+        the exons of all the transcripts of every gene merged by a sweep line, the
+        overlapping and adjacent exons are merged, the genes without id are skipped
+        :return: (list of gene id in order of first transcript, (gene index, start, end) numpy arrays)
+        """
+        genes = {}
+        codes = np.full(len(self.transcripts), -1, dtype=np.int64)
+        for idx in self.records.keys():
+            gene_id = self.genes[idx]
+            if gene_id != "NA":
+                codes[idx] = genes.setdefault(gene_id, len(genes))
+
+        transcripts, starts, ends = self.arrays("exon")
+        gene = codes[transcripts]
+        valid = gene >= 0
+        gene, starts, ends = gene[valid], starts[valid], ends[valid]
+        if not len(gene):
+            return list(genes.keys()), (gene, starts, ends)
+
+        order = np.lexsort((starts, gene))
+        gene, starts, ends = gene[order], starts[order], ends[order]
+
+        # the running max of the ends inside every gene, the offset keeps the genes apart
+        offset = gene << 32
+        reach = np.maximum.accumulate(ends + offset)
+        first = np.ones(len(gene), dtype=bool)
+        first[1:] = (gene[1:] != gene[:-1]) | (starts[1:] + offset[1:] > reach[:-1] + 1)
+
+        heads = np.flatnonzero(first)
+        return list(genes.keys()), (gene[heads], starts[heads], np.maximum.reduceat(ends, heads))
+
+    def gene_bed(self):
+        u"""
+        bed6 of the gene spans, see gene_spans
+        :return: generator of lines
+        """
+        for gene_id, (chrom, start, end, strand) in self.gene_spans().items():
+            yield "%s\t%d\t%d\t%s\t255\t%s\n" % (chrom, start, end, gene_id, strand)
+
+    def intron_bed(self):
+        u"""
+        bed6 of the introns, named by transcript, in the same coordinates of bed12()
+        :return: generator of lines
+        """
+        records = self.records
+        for idx, start, end in zip(*[x.tolist() for x in self.introns()]):
+            record = records.get(idx)
+            # the exons without transcript have no chromosome
+            if record is not None:
+                yield "%s\t%d\t%d\t%s\t255\t%s\n" % (record[0], start, end, record[3], record[5])
+
+    def meta_exon_bed(self):
+        u"""
+        bed6 of the merged exons, named by gene, in the same coordinates of bed12()
+        :return: generator of lines
+        """
+        genes, (gene, starts, ends) = self.meta_exons()
+
+        # chromosome and strand of the first transcript of every gene
+        places = {}
+        for idx, record in self.records.items():
+            places.setdefault(self.genes[idx], (record[0], record[5]))
+
+        for code, start, end in zip(gene.tolist(), starts.tolist(), ends.tolist()):
+            chrom, strand = places[genes[code]]
+            yield "%s\t%d\t%d\t%s\t255\t%s\n" % (chrom, start, end, genes[code], strand)
+
+    def __format_blocks__(self):
+        u"""
+        blocks and thickStart/thickEnd of all the transcripts, computed once
+        """
+        if self.__blocks__ is None:
+            n = len(self.transcripts)
+            exons = self.arrays("exon")
+            cds = self.arrays("CDS")
+
+            blocks = Gtf2Bed12.__format_bed12_exons__(exons[0], exons[1], exons[2], n)
+            thick_start, thick_end = Gtf2Bed12.__format_thick__(cds[0], cds[1], cds[2], n)
+            self.__blocks__ = blocks, thick_start.tolist(), thick_end.tolist()
+        return self.__blocks__
+
+    def bed12(self, indices=None):
+        u"""
+        format the transcripts into bed12
+        :param indices: index of the transcripts, all the transcripts in order if None
+        :return: generator of bed12 lines
+        """
+        blocks, thick_start, thick_end = self.__format_blocks__()
+
+        if indices is None:
+            indices = self.records.keys()
+
+        for idx in indices:
+            transcript = self.records.get(idx)
+            if transcript is None:
+                continue
+
+            if thick_end[idx] < 0:
+                thick = "%s\t%s" % (transcript[1], transcript[2])
+            else:
+                thick = "%d\t%d" % (thick_start[idx], thick_end[idx])
+
+            yield "%s\t%s\t255,0,0\t%s\n" % ("\t".join(transcript), thick, blocks[idx])
+
+
+# the stages of --profile, see profiling.py, the attributes are timed as parse by its COMMON_HOOKS
+PROFILE_HOOKS = (
+    (Gtf2Bed12, "__get_value_from_data__", PARSE),
+    (TranscriptModel, "add", RESOLVE),
+    (Gtf2Bed12, "__format_bed12_exons__", FORMAT),
+    (Gtf2Bed12, "__format_thick__", FORMAT),
+    (TranscriptModel, "bed12", FORMAT),
+)
+
+
+def main():
+    args = Gtf2Bed12.argument_parser()
+    print(args, file=sys.stderr)
+
+    converter = Gtf2Bed12(
+        args.input, args.output, buffer_size=args.buffer_size, incremental=args.incremental,
+        sort=args.sort, memory=args.memory, tmpdir=args.tmpdir, feature_types=split_names(args.feature_types),
+        genes=args.genes, introns=args.introns, meta_exons=args.meta_exons, stream=args.stream
+    )
+    # the paths of the extras are outputs, only whether they are asked affects the key
+    options = dict(sort=args.sort, **converter.projection.options())
+    outputs = [converter.output] + [os.path.abspath(x) if x else None for x in (args.genes, args.introns, args.meta_exons)]
+    with Profiler("gtf2bed12", report=args.profile, pstats=args.pstats, hooks=PROFILE_HOOKS):
+        cached(
+            converter.convert, None if args.incremental else open_cache(args.cache, args.cache_size),
+            converter.input, "gtf2bed12", options, outputs
+        )
 
 
 if __name__ == '__main__':
-    Gtf2Bed12()
+    main()
@@ -5,31 +5,67 @@ u"""
 convert gtf files to gff3
 """
 import argparse
+import io
 import os
-import re
 import sys
+from multiprocessing import Pool
+
+from attributes import GFF3, iter_records
+from cache import add_cache_arguments, cached, open_cache
+from dialect import sniff
+from fileio import is_gzip, open_input, open_output
+from incremental import IncrementalError, IncrementalWriter, SegmentKey, remove_manifest
+from profiling import FORMAT, WRITE, Profiler, current
+from projection import ALL, Projection, split_names
+from sort import sorted_output
+from store import AnnotationStore, is_store, open_records
 
 __author__ = "Zhang Yiming"
 __since__ = "2018.10.24"
 
 
+# the attributes read by the conversion (lower case), with the fallbacks of __get_value_from_data__,
+# the id of other features (eg: utr_id) is added by the feature type
+KEYS = (
+    "gene_id", "geneid", "gene_name", "genename", "transcript_id", "transcriptid",
+    "transcript_name", "transcriptname", "id", "name", "exon_id", "protein_id", "exon_number",
+)
+
+
 class Gtf2Gff(object):
 
-    def __init__(self):
+    def __init__(
+            self, input_file, output, generate_genes=False, threads=1, buffer_size=4096,
+            incremental=False, sort=False, memory=1024, tmpdir=None, feature_types=None, keep_attrs=None
+    ):
         u"""
-        init this class
+        init this class, the conversion is started by convert()
+        :param input_file: path to gtf or store
+        :param output: path to output file, - for stdout
+        :param generate_genes: create the missing genes, see --gene
+        :param threads: number of processes
+        :param buffer_size: size of output buffer in KB
+        :param incremental: only convert the changed genes, see incremental.py
+        :param sort: sort the output by coordinate, see sort.py
+        :param memory: memory limit of sort in MB
+        :param tmpdir: directory of the sorted runs
+        :param feature_types: list of the input feature types to convert, None for all, see projection.py
+        :param keep_attrs: list of the attributes to write besides ID, Name and Parent, None for all
         """
-        args = self.argument_parser()
-        print(args)
-        self.input = os.path.abspath(args.input)
-        self.output = os.path.abspath(args.output)
-        self.generate_genes = args.gene
+        self.input = os.path.abspath(input_file)
+        self.output = os.path.abspath(output) if output != "-" else output
+        self.buffer_size = buffer_size * 1024
+        self.sort = sort
+        self.memory = memory
+        self.tmpdir = tmpdir
+        self.generate_genes = generate_genes
+        self.threads = max(threads, 1)
+        self.incremental = incremental
+        self.projection = Projection(feature_types, keep_attrs, lower=True)
         self.check_dir()
 
         self.genes = {}
         self.transcripts = {}
-        self.convert()
-        pass
 
     def check_dir(self):
         u"""
@@ -41,7 +77,7 @@ class Gtf2Gff(object):
 
         out_dir = os.path.dirname(self.output)
 
-        if not os.path.exists(out_dir):
+        if self.output != "-" and not os.path.exists(out_dir):
             os.makedirs(out_dir)
 
     @staticmethod
@@ -56,14 +92,14 @@ class Gtf2Gff(object):
         parser.add_argument(
             "-i",
             "--input",
-            help="Path to input file",
+            help="Path to input file, gtf or store from store.py",
             required=True
         )
 
         parser.add_argument(
             "-o",
             "--output",
-            help="Path to output file",
+            help="Path to output file, - for stdout",
             required=True
         )
 
@@ -78,6 +114,76 @@ class Gtf2Gff(object):
             """
         )
 
+        parser.add_argument(
+            "-t",
+            "--threads",
+            type=int,
+            default=1,
+            help="Number of processes to convert the chunks of a large gtf"
+        )
+
+        parser.add_argument(
+            "-b",
+            "--buffer-size",
+            type=int,
+            default=4096,
+            help="Size of output buffer in KB, the lines are written once the buffer is full"
+        )
+
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            default=False,
+            help="Only convert the genes changed since last run, the others are copied from the old output"
+        )
+
+        parser.add_argument(
+            "--sort",
+            action="store_true",
+            default=False,
+            help="Sort the output by chromosome and start, the records of a gene are kept together"
+        )
+
+        parser.add_argument(
+            "--memory",
+            type=int,
+            default=1024,
+            help="Memory limit of --sort in MB, counting the lines and the genes and IDs kept to order them, "
+                 "the sorted runs of lines are merged on disk if larger"
+        )
+
+        parser.add_argument(
+            "--tmpdir",
+            default=None,
+            help="Directory of the sorted runs of --sort"
+        )
+
+        parser.add_argument(
+            "--feature-types",
+            default=None,
+            help="Comma separated feature types to convert, eg: gene,transcript,exon"
+        )
+
+        parser.add_argument(
+            "--keep-attrs",
+            default=None,
+            help="Comma separated attributes to write besides ID, Name and Parent, eg: gene_biotype,tag"
+        )
+
+        parser.add_argument(
+            "--profile",
+            default=None,
+            help="Path to the json report of the time spent in every stage, - for stderr"
+        )
+
+        parser.add_argument(
+            "--pstats",
+            default=None,
+            help="Path to the cProfile stats, see python -m pstats"
+        )
+
+        add_cache_arguments(parser)
+
         if len(sys.argv[1:]) <= 0:
             parser.print_help()
             exit(0)
@@ -90,55 +196,49 @@ class Gtf2Gff(object):
             exit(0)
 
     @staticmethod
-    def __split_gtf_details__(line):
-        u"""
-        format gtf detailed messages into dict
-        :param line: columns like gene_id "gene"; transcript_id "transcript";
-        :return: dict {"gene_id": "gene"}
-        """
-        data = {}
-        for message in line.strip().split(";"):
-            if not message:
-                continue
-            key, value = message.strip().split(" ")
-            data[key.lower()] = re.sub(r"[\";]", "", value)
-        return data
-
-    @staticmethod
-    def __get_value_from_data__(data, target, pop=True):
+    def __get_value_from_data__(data, target, pop=True, dialect=None):
         u"""
         从gtf的详细列中构建出的字典，从其中提取出所需要的数据
         但是由于有多个可能性，比如：gene_id, geneID, ID等等，不同的标准下的gtf文件，太烦人了
         因此，在此通过正则来处理这个问题
         :param data: 从gtf文件中，提取出的字典信息
         :param target: 所要提取数据的目标，为gene_id等标签
+        :param dialect: Dialect, the known keys are looked up directly
         :return: string
         """
+        if dialect is not None:
+            value = dialect.get(data, target, pop)
+            if value is not None:
+                return value
+
         ids = [target, target.replace("_", ""), target.split("_")[-1]]
         for i in ids:
             if i in data.keys():
                 return data.pop(i) if pop else data[i]
         return "NA"
 
-    def __format_gff_details__(self, data, label):
+    @classmethod
+    def __format_gff_details__(cls, data, label, dialect=None, keep=None):
         u"""
         将获取到的gtf的信息，format成gff3样式
-        :param data: 由self.__split_gtf_details__构造的字典
+        :param data: Attributes of the record
         :param label: gtf文件，第二列表明的元件类型
+        :param dialect: Dialect of the input
+        :param keep: set of the attributes to write besides ID, Name and Parent, None for all
         :return: string
         """
-        result = ""
+        result = []
         if label == "gene":
-            result += "ID=%s;Name=%s" % (
-                self.__get_value_from_data__(data=data, target="gene_id"),
-                self.__get_value_from_data__(data=data, target="gene_name"),
-            )
+            result.append("ID=%s;Name=%s" % (
+                cls.__get_value_from_data__(data=data, target="gene_id", dialect=dialect),
+                cls.__get_value_from_data__(data=data, target="gene_name", dialect=dialect),
+            ))
         elif label == "transcript":
-            result += "ID=%s;Name=%s;Parent=%s" % (
-                self.__get_value_from_data__(data=data, target="transcript_id"),
-                self.__get_value_from_data__(data=data, target="transcript_name"),
-                self.__get_value_from_data__(data=data, target="gene_id"),
-            )
+            result.append("ID=%s;Name=%s;Parent=%s" % (
+                cls.__get_value_from_data__(data=data, target="transcript_id", dialect=dialect),
+                cls.__get_value_from_data__(data=data, target="transcript_name", dialect=dialect),
+                cls.__get_value_from_data__(data=data, target="gene_id", dialect=dialect),
+            ))
 
             if "gene_name" in data.keys():
                 data.pop("gene_name")
@@ -152,57 +252,264 @@ class Gtf2Gff(object):
 
             ids = ids if isinstance(ids, str) else "NA"
 
-            parent = self.__get_value_from_data__(data=data, target="transcript_id")
+            parent = cls.__get_value_from_data__(data=data, target="transcript_id", dialect=dialect)
 
             if "exon_number" in data.keys() and ids == "NA":
                 ids = "%s.%s" % (parent, data["exon_number"])
 
-            result += "ID=%s;Parent=%s" % (ids, parent)
+            result.append("ID=%s;Parent=%s" % (ids, parent))
 
             if "gene_name" in data.keys():
                 data.pop("gene_name")
 
         for key, value in data.items():
-            result += ";%s=%s" % (key, value)
+            if keep is None or key in keep:
+                result.append("%s=%s" % (key, value))
+
+        return ";".join(result)
+
+    @classmethod
+    def __format_lines__(cls, records, generate_genes=False, dialect=None, projection=ALL):
+        u"""
+        将gtf的每一行转化为gff3
+        :param records: iterable of (columns, Attributes), see store.open_records
+        :param generate_genes: 是否自动生成gene
+        :param dialect: Dialect of the input
+        :param projection: the attributes to write, see projection.py, the feature types are
+                           skipped by the reader
+        :return: generator of formatted gff3 lines, and the events for --gene
+                 ("gene", gene_id) for the genes in gtf
+                 ("transcript", gene_id, gene_line) for the first transcript of a gene
+                 only the first event of every gene_id is yielded
+        """
+        genes = set()
+        keep = projection.attributes
+        # feature type -> the keys decoded
+        keys = {}
+        for lines, attrs in records:
+            if attrs is None:
+                continue
 
-        return result
+            if keep is None:
+                data = attrs.to_dict(lower=True)
+            else:
+                label = lines[2]
+                if label not in keys:
+                    keys[label] = projection.keys(KEYS + ("%s_id" % label.lower(),))
+                data = attrs.to_dict(lower=True, keys=keys[label])
+
+            if generate_genes:
+                if lines[2] == "gene":
+                    parent = cls.__get_value_from_data__(data, "gene_id", False, dialect)
+                    if parent not in genes:
+                        genes.add(parent)
+                        yield "gene", parent
+
+                if lines[2] == "transcript":
+                    parent = cls.__get_value_from_data__(data, "gene_id", False, dialect)
+                    parent_name = cls.__get_value_from_data__(data, "gene_name", False, dialect)
+
+                    if parent_name == "NA":
+                        parent_name = parent
+                    if parent not in genes:
+                        new_line = lines[:8] + ["ID=%s;Name=%s" % (parent, parent_name)]
+                        new_line[2] = "gene"
+                        genes.add(parent)
+                        yield "transcript", parent, "\t".join(new_line) + "\n"
+
+            lines[8] = cls.__format_gff_details__(data, lines[2], dialect, keep)
+
+            yield "\t".join(lines) + "\n"
+
+    @staticmethod
+    def __resolve_events__(records, genes):
+        u"""
+        the lines of __format_lines__, the generated genes are kept
+        only if the gene is not found before
+        :param records: output of __format_lines__
+        :param genes: set of the gene_id already written or found
+        :return: generator of gff3 lines
+        """
+        for record in records:
+            if isinstance(record, str):
+                yield record
+            elif record[1] not in genes:
+                genes.add(record[1])
+                if record[0] == "transcript":
+                    yield record[2]
+
+    @classmethod
+    def __write_lines__(cls, w, records, genes):
+        u"""
+        write the output of __format_lines__, see __resolve_events__
+        :param w: output file
+        :param records: output of __format_lines__
+        :param genes: set of the gene_id already written or found
+        """
+        w.writelines(cls.__resolve_events__(records, genes))
+
+    def __chunks__(self):
+        u"""
+        split the input file into chunks at the line ends
+        :return: generator of (start, end, text), start and end are the byte offsets of plain
+                 text or feature indices of store, the gzip input can not be seeked, so its
+                 text is read in the main process
+        """
+        if is_store(self.input):
+            size = len(AnnotationStore(self.input))
+            step = max(size // (self.threads * 4) + 1, 10000)
+            for start in range(0, size, step):
+                yield start, min(start + step, size), None
+            return
+
+        if is_gzip(self.input):
+            with open_input(self.input) as r:
+                while True:
+                    lines = r.readlines(4 * 1024 * 1024)
+                    if not lines:
+                        break
+                    yield None, None, "".join(lines)
+            return
+
+        size = os.path.getsize(self.input)
+        step = max(size // (self.threads * 4) + 1, 1024 * 1024)
+
+        with open(self.input, "rb") as r:
+            start = 0
+            while start < size:
+                r.seek(start + step)
+                r.readline()
+                end = min(r.tell(), size)
+                yield start, end, None
+                start = end
 
     def convert(self):
         u"""
         进行转化
         :return:
         """
+        dialect = sniff(self.input)
+
+        if self.output != "-":
+            if self.incremental and self.sort:
+                print("the sorted output could not be patched, convert the whole file", file=sys.stderr)
+            elif self.incremental:
+                try:
+                    self.__convert_incremental__(dialect)
+                    return
+                except IncrementalError as err:
+                    print("%s, convert the whole file" % err, file=sys.stderr)
+            remove_manifest(self.output)
+
         genes = set()
-        with open(self.output, "w+") as w:
+        with open_output(self.output, index="gff", threads=self.threads, buffer_size=self.buffer_size) as w, \
+                sorted_output(w, GFF3, self.sort, self.memory, self.tmpdir) as w:
             w.write("#gff-version 3\n")
-            with open(self.input) as r:
-                for line in r:
-                    if line.startswith("#"):
-                        continue
-
-                    lines = line.split("\t")
-                    data = self.__split_gtf_details__(lines[8])
-
-                    if self.generate_genes:
-                        if lines[2] == "gene":
-                            genes.add(self.__get_value_from_data__(data, "gene_id", False))
-
-                        if lines[2] == "transcript":
-                            parent = self.__get_value_from_data__(data, "gene_id", False)
-                            parent_name = self.__get_value_from_data__(data, "gene_name", False)
 
-                            if parent_name == "NA":
-                                parent_name = parent
-                            if parent not in genes:
-                                new_line = lines[:8] + ["ID=%s;Name=%s" % (parent, parent_name)]
-                                new_line[2] = "gene"
-                                genes.add(parent)
-                                w.write("\t".join(new_line) + "\n")
+            if self.threads > 1:
+                with Pool(self.threads) as p:
+                    jobs = (
+                        (self.input, start, end, text, self.generate_genes, dialect, self.projection)
+                        for start, end, text in self.__chunks__()
+                    )
+                    for records in p.imap(__convert_chunk__, jobs):
+                        self.__write_lines__(w, records, genes)
+            else:
+                records = open_records(self.input, fmt=dialect.format, keep=self.projection.narrow())
+                records = self.__format_lines__(current().records(records), self.generate_genes, dialect, self.projection)
+                self.__write_lines__(w, records, genes)
+
+    def __convert_incremental__(self, dialect):
+        u"""
+        only convert the genes changed since last run, see incremental.py
+        the generated genes depend on the genes found before, they are part of the hash
+        """
+        found = set()
+
+        def salt(gene, segment):
+            if not self.generate_genes:
+                return ""
+            events = {
+                self.__get_value_from_data__(attrs.to_dict(lower=True), "gene_id", False, dialect)
+                for lines, attrs in segment if lines[2] in ("gene", "transcript")
+            }
+            state = "\n".join(sorted(events & found))
+            found.update(events)
+            return state
+
+        def convert(segments):
+            res = []
+            for _, segment, state in segments:
+                w = io.StringIO()
+                records = [(list(lines), attrs) for lines, attrs in segment]
+                genes = set(state.split("\n")) if state else set()
+                records = self.__format_lines__(records, self.generate_genes, dialect, self.projection)
+                self.__write_lines__(w, records, genes)
+                res.append(w.getvalue())
+            return res
+
+        records = open_records(self.input, fmt=dialect.format, keep=self.projection.narrow())
+        IncrementalWriter(
+            self.output, "gtf2gff", dict(gene=self.generate_genes, **self.projection.options()),
+            header="#gff-version 3\n"
+        ).run(
+            current().records(records), SegmentKey(dialect), convert, salt,
+            index="gff", threads=self.threads, buffer_size=self.buffer_size
+        )
 
-                    lines[8] = self.__format_gff_details__(data, lines[2])
 
-                    w.write("\t".join(lines) + "\n")
+# the stages of --profile, see profiling.py, the attributes are timed as parse by its COMMON_HOOKS
+PROFILE_HOOKS = (
+    (Gtf2Gff, "__format_gff_details__", FORMAT),
+    (Gtf2Gff, "__format_lines__", FORMAT),
+    (Gtf2Gff, "__write_lines__", WRITE),
+)
+
+
+def __convert_chunk__(args):
+    u"""
+    convert a chunk of gtf in the sub-process
+    :param args: (path to gtf or store, start offset, end offset, text of gzip, generate genes, Dialect, Projection)
+    :return: list of the records from Gtf2Gff.__format_lines__, consecutive lines are joined
+    """
+    path, start, end, text, generate_genes, dialect, projection = args
+
+    if text is not None:
+        records = iter_records(io.StringIO(text), fmt=dialect.format, keep=projection.narrow())
+    else:
+        records = open_records(path, start=start, end=end, fmt=dialect.format, keep=projection.narrow())
+
+    res, block = [], []
+    for record in Gtf2Gff.__format_lines__(records, generate_genes, dialect, projection):
+        if isinstance(record, str):
+            block.append(record)
+            continue
+        if block:
+            res.append("".join(block))
+            block = []
+        res.append(record)
+    if block:
+        res.append("".join(block))
+    return res
+
+
+def main():
+    args = Gtf2Gff.argument_parser()
+    print(args, file=sys.stderr)
+
+    converter = Gtf2Gff(
+        args.input, args.output, generate_genes=args.gene, threads=args.threads, buffer_size=args.buffer_size,
+        incremental=args.incremental, sort=args.sort, memory=args.memory, tmpdir=args.tmpdir,
+        feature_types=split_names(args.feature_types), keep_attrs=split_names(args.keep_attrs)
+    )
+    print(sniff(converter.input), file=sys.stderr)
+    options = dict(gene=args.gene, sort=args.sort, **converter.projection.options())
+    with Profiler("gtf2gff", report=args.profile, pstats=args.pstats, hooks=PROFILE_HOOKS):
+        cached(
+            converter.convert, None if args.incremental else open_cache(args.cache, args.cache_size),
+            converter.input, "gtf2gff", options, [converter.output]
+        )
 
 
 if __name__ == '__main__':
-    Gtf2Gff()
+    main()
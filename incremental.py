@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+u"""
+incremental re-conversion, only the genes changed since last run are converted
+
+the records are split into segments, the consecutive records of the same
+gene. the manifest next to the output (output.manifest) keeps the hash of
+every segment, and the range of its lines in the output. in the next run,
+the segments with the same gene and hash are copied from the old output,
+the others are converted again, and the removed genes are simply dropped
+
+the patched output is the same as a full conversion as long as the records
+of a gene are consecutive and no transcript is shared by two genes,
+otherwise IncrementalError is raised and the caller converts the whole file.
+the genes of gff3 are resolved by SegmentKey.index before splitting, so the
+children could come before their parents
+"""
+import gzip
+import hashlib
+import json
+import os
+import sys
+
+from attributes import GFF3
+from fileio import is_gzip, open_output
+
+__author__ = "Zhang Yiming"
+__since__ = "2026.10.17"
+
+
+VERSION = 2
+
+# number of changed segments converted together
+BATCH_SIZE = 2000
+
+
+class IncrementalError(Exception):
+    u"""
+    the input could not be converted segment by segment
+    """
+    pass
+
+
+def manifest_path(output):
+    return output + ".manifest"
+
+
+def load_manifest(output, converter, options):
+    u"""
+    :param output: path to the old output
+    :param converter: name of converter
+    :param options: dict of the options affecting the output
+    :return: dict of (gene, hash) -> (offset, length), empty if the manifest is missing or stale
+    """
+    path = manifest_path(output)
+    if not os.path.exists(path) or not os.path.exists(output):
+        return {}
+
+    with open(path) as r:
+        manifest = json.load(r)
+
+    if manifest.get("version") != VERSION or manifest.get("converter") != converter or \
+            manifest.get("options") != options or manifest.get("size") != os.path.getsize(output):
+        return {}
+    return {(key, digest): (offset, length) for key, digest, offset, length in manifest["segments"]}
+
+
+def segment_hash(records, salt=""):
+    u"""
+    :param records: list of (columns, Attributes)
+    :param salt: the state of converter affecting the output of this segment
+    :return: hex digest of the records
+    """
+    digest = hashlib.blake2b(salt.encode("utf-8"), digest_size=16)
+    for lines, attrs in records:
+        digest.update("\t".join(lines[:8]).encode("utf-8"))
+        if attrs.raw is not None:
+            raw = attrs.raw
+            digest.update(raw if isinstance(raw, bytes) else raw.encode("utf-8"))
+        else:
+            digest.update(repr(attrs.raw_items()).encode("utf-8"))
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+class SegmentKey(object):
+    u"""
+    the gene of every record, gene_id of gtf or the top ancestor of gff3,
+    and the transcripts of the records to make sure they stay in one gene
+    """
+
+    def __init__(self, dialect=None):
+        u"""
+        :param dialect: Dialect of the input, only the format is used, the keys
+                        of all the dialects are the same gene_id, transcript_id, ID and Parent
+        """
+        self.dialect = dialect
+        # ID -> first Parent of gff3, from index() and the records seen
+        self.parents = {}
+        self.roots = {}
+
+    def index(self, records):
+        u"""
+        read the Parent of every ID before splitting the records, otherwise
+        the children before their parents in gff3 are keyed to the parent itself
+        :param records: iterable of (columns, Attributes), all the feature types of the input
+        :return: self
+        """
+        for _, attrs in records:
+            if attrs is not None and attrs.format == GFF3:
+                ids = attrs.get("ID")
+                parents = attrs.get_list("Parent")
+                if ids is not None and parents:
+                    self.parents.setdefault(ids, parents[0])
+        return self
+
+    def root(self, ids):
+        u"""
+        :return: the top ancestor of ids, ids itself if it has no parent
+        """
+        res = self.roots.get(ids)
+        if res is None:
+            res, seen = ids, {ids}
+            while self.parents.get(res, res) not in seen:
+                res = self.parents[res]
+                seen.add(res)
+            self.roots[ids] = res
+        return res
+
+    def __call__(self, attrs):
+        u"""
+        :return: (gene, transcript) of the record, transcript is None for gff3
+        """
+        if attrs.format != GFF3:
+            return attrs.get("gene_id"), attrs.get("transcript_id")
+
+        ids = attrs.get("ID")
+        parents = attrs.get_list("Parent")
+        if not parents:
+            return ids, None
+        if ids is not None and ids not in self.parents:
+            self.parents[ids] = parents[0]
+        return self.root(parents[0]), None
+
+
+def iter_segments(records, key):
+    u"""
+    :param records: iterable of (columns, Attributes), the comments are skipped
+    :param key: SegmentKey
+    :return: generator of (gene, list of records)
+    """
+    current, segment = None, []
+    transcripts = {}
+    seen = set()
+    for lines, attrs in records:
+        if attrs is None:
+            continue
+
+        gene, transcript = key(attrs)
+        if transcript is not None and transcripts.setdefault(transcript, gene) != gene:
+            raise IncrementalError("transcript %s is shared by %s and %s" % (transcript, transcripts[transcript], gene))
+
+        if segment and gene != current:
+            yield current, segment
+            seen.add(current)
+            segment = []
+            if gene in seen:
+                raise IncrementalError("the records of %s are not consecutive" % gene)
+
+        current = gene
+        segment.append((lines, attrs))
+
+    if segment:
+        yield current, segment
+
+
+class IncrementalWriter(object):
+    u"""
+    write the output segment by segment, copy the unchanged ones from the old output
+    """
+
+    def __init__(self, output, converter, options, header=""):
+        u"""
+        :param output: path to output, plain text or BGZF
+        :param converter: name of converter, saved in the manifest
+        :param options: dict of the options affecting the output, saved in the manifest
+        :param header: the lines before the first segment
+        """
+        self.output = output
+        self.converter = converter
+        self.options = options
+        self.header = header
+
+        self.cache = load_manifest(output, converter, options)
+        self.reused = 0
+        self.converted = 0
+
+    def run(self, records, key, convert, salt=None, **kwargs):
+        u"""
+        :param records: iterable of (columns, Attributes)
+        :param key: SegmentKey
+        :param convert: function of list of (gene, records, salt) -> list of str, the changed segments
+        :param salt: function of (gene, records) -> str, the state of converter before this segment
+                     which affects its output, called for every segment in order
+        :param kwargs: passed to open_output
+        """
+        temp = "%s.%d.tmp%s" % (self.output, os.getpid(), ".gz" if self.output.endswith((".gz", ".bgz")) else "")
+        old = None
+        if self.cache:
+            old = gzip.open(self.output, "rb") if is_gzip(self.output) else open(self.output, "rb")
+
+        segments = []
+        offset = len(self.header.encode("utf-8"))
+        pending = []
+        genes = set()
+
+        def flush(w):
+            u"""
+            convert the pending segments, and write them in order
+            """
+            nonlocal offset
+            changed = [(x[0], x[2], x[3]) for x in pending if x[2] is not None]
+            texts = iter(convert(changed) if changed else [])
+            for gene, digest, segment, _, span in pending:
+                if segment is not None:
+                    text = next(texts)
+                    data = text.encode("utf-8")
+                else:
+                    old.seek(span[0])
+                    data = old.read(span[1])
+                    text = data.decode("utf-8")
+                w.write(text)
+                segments.append([gene, digest, offset, len(data)])
+                offset += len(data)
+            pending.clear()
+
+        try:
+            with open_output(temp, **kwargs) as w:
+                w.write(self.header)
+                for gene, segment in iter_segments(records, key):
+                    genes.add(gene)
+                    state = salt(gene, segment) if salt is not None else ""
+                    digest = segment_hash(segment, state)
+                    span = self.cache.get((gene, digest))
+                    if span is not None:
+                        pending.append((gene, digest, None, state, span))
+                        self.reused += 1
+                    else:
+                        pending.append((gene, digest, segment, state, None))
+                        self.converted += 1
+                        if self.converted % BATCH_SIZE == 0:
+                            flush(w)
+                flush(w)
+        except BaseException:
+            for path in (temp, temp + ".tbi"):
+                if os.path.exists(path):
+                    os.remove(path)
+            raise
+        finally:
+            if old is not None:
+                old.close()
+
+        os.replace(temp, self.output)
+        if os.path.exists(temp + ".tbi"):
+            os.replace(temp + ".tbi", self.output + ".tbi")
+        elif os.path.exists(self.output + ".tbi"):
+            os.remove(self.output + ".tbi")
+
+        with open(manifest_path(self.output), "w+") as w:
+            json.dump({
+                "version": VERSION,
+                "converter": self.converter,
+                "options": self.options,
+                "size": os.path.getsize(self.output),
+                "segments": segments,
+            }, w)
+
+        print(
+            "incremental: %d genes reused, %d genes converted, %d genes removed" % (
+                self.reused, self.converted, len({x[0] for x in self.cache} - genes)
+            ), file=sys.stderr
+        )
+
+
+def remove_manifest(output):
+    u"""
+    the output is converted as a whole, the manifest is out of date
+    """
+    if os.path.exists(manifest_path(output)):
+        os.remove(manifest_path(output))
@@ -0,0 +1,487 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+u"""
+junctions of the samples: annotation, binary format, STAR export and merge
+
+python gmap_splicesites2sj.py --infile gmap.txt --outfile reads.txt --reference gencode.gtf --junction-format bin
+python junctions.py pack -i reads.txt.junctions -o reads.txt.junctions.bin
+python junctions.py star -i reads.txt.junctions.bin -o reads.SJ.out.tab
+python junctions.py merge -i samples/*.junctions.bin -o matrix.tsv.gz
+
+annotation
+
+the introns are taken from the exons of gtf2bed12.TranscriptModel, the gaps
+between the consecutive exons of every transcript. every junction is
+labeled while the junctions are written:
+
+    known:              the intron is annotated
+    novel_combination:  both splice sites are annotated, but not as one intron
+    novel_donor:        only the acceptor is annotated
+    novel_acceptor:     only the donor is annotated
+    novel:              none of the splice sites is annotated
+
+the donor is the start of junction on + strand and the end on - strand. the
+distances are the position of the splice site minus the nearest annotated
+site of the same side (intron start or end), 0 for the annotated ones and
+NA if the chromosome has no intron
+
+the introns are kept per chromosome in a set of packed integers
+(start << 32 | end) for the exact lookup, and in sorted lists of the starts
+and ends for the nearest site by bisect, so every junction costs O(1) plus
+O(log n) of the introns of its chromosome
+
+binary format
+the junctions of a sample are sorted by chromosome name, start, end and
+strand, and kept in columns with the same layout as store.py:
+
+    MAGIC, uint64 size of the header, json header (version, chromosomes), arrays
+    chrom:  uint32, index into the sorted chromosome names of header
+    start:  int32, first base of the junction, 1-based
+    end:    int32, last base of the junction
+    strand: uint8, 0 for + and 1 for -
+    count:  uint32, number of reads
+    label:  uint8, index of LABELS, 255 without reference
+
+the file is memory-mapped, the junctions of all the samples are in the
+same order, so merge only needs a small block of every file at a time
+"""
+import argparse
+import os
+import sys
+from array import array
+from bisect import bisect_left
+from collections import Counter
+
+import numpy as np
+
+from fileio import open_input, open_output
+from gtf2bed12 import TranscriptModel
+from store import read_arrays, write_arrays
+
+__author__ = "Zhang Yiming"
+__since__ = "2026.10.17"
+
+
+KNOWN = "known"
+NOVEL_COMBINATION = "novel_combination"
+NOVEL_DONOR = "novel_donor"
+NOVEL_ACCEPTOR = "novel_acceptor"
+NOVEL = "novel"
+
+LABELS = (KNOWN, NOVEL_COMBINATION, NOVEL_DONOR, NOVEL_ACCEPTOR, NOVEL)
+UNLABELED = 255
+
+MAGIC = b"BFCJUNCT"
+VERSION = 1
+
+STRANDS = "+-"
+
+# name -> (typecode of the buffer while building, dtype in file)
+COLUMNS = {
+    "chrom": ("L", "<u4"),
+    "start": ("q", "<i4"),
+    "end": ("q", "<i4"),
+    "strand": ("B", "u1"),
+    "count": ("Q", "<u4"),
+    "label": ("B", "u1"),
+}
+
+# total number of junctions read by merge in every round, shared by all the files
+MERGE_BUFFER = 1 << 18
+
+
+class IntronIndex(object):
+    u"""
+    the annotated introns of every chromosome
+    """
+
+    def __init__(self):
+        # chromosome -> set of start << 32 | end
+        self.introns = {}
+        # chromosome -> sorted unique starts and ends of the introns
+        self.starts = {}
+        self.ends = {}
+        self.labels = Counter()
+
+    def __len__(self):
+        return sum(len(x) for x in self.introns.values())
+
+    @classmethod
+    def from_model(cls, model):
+        u"""
+        :param model: gtf2bed12.TranscriptModel
+        :return: IntronIndex
+        """
+        index = cls()
+        transcripts, intron_starts, intron_ends = model.introns()
+
+        records = model.records
+        chromosomes = {}
+        for idx, start, end in zip(transcripts.tolist(), intron_starts.tolist(), intron_ends.tolist()):
+            record = records.get(idx)
+            # the exons without transcript have no chromosome
+            if record is None:
+                continue
+            introns = chromosomes.get(record[0])
+            if introns is None:
+                introns = chromosomes[record[0]] = set()
+            introns.add(start << 32 | end)
+
+        for chromosome, introns in chromosomes.items():
+            index.introns[chromosome] = introns
+            index.starts[chromosome] = sorted({x >> 32 for x in introns})
+            index.ends[chromosome] = sorted({x & 0xffffffff for x in introns})
+        return index
+
+    @classmethod
+    def load(cls, path, progress=True):
+        u"""
+        :param path: path to the reference gtf, gff3 or store
+        :param progress: show the progressbar
+        :return: IntronIndex
+        """
+        return cls.from_model(TranscriptModel().load(path, progress=progress))
+
+    @staticmethod
+    def __distance__(sites, pos):
+        u"""
+        :param sites: sorted positions
+        :param pos: position of a splice site
+        :return: pos minus the nearest site, the smaller site wins the tie
+        """
+        i = bisect_left(sites, pos)
+        if i < len(sites) and sites[i] == pos:
+            return 0
+
+        distance = None
+        if i > 0:
+            distance = pos - sites[i - 1]
+        if i < len(sites) and (distance is None or sites[i] - pos < distance):
+            distance = pos - sites[i]
+        return distance
+
+    def annotate(self, chromosome, start, end, strand="+"):
+        u"""
+        :param chromosome: chromosome of the junction
+        :param start: first base of the junction, 1-based
+        :param end: last base of the junction
+        :param strand: + or -, the others are taken as +
+        :return: (label, distance of donor, distance of acceptor), the distances are None
+                 if the chromosome has no intron
+        """
+        introns = self.introns.get(chromosome)
+        if introns is None:
+            self.labels[NOVEL] += 1
+            return NOVEL, None, None
+
+        if start << 32 | end in introns:
+            self.labels[KNOWN] += 1
+            return KNOWN, 0, 0
+
+        left = self.__distance__(self.starts[chromosome], start)
+        right = self.__distance__(self.ends[chromosome], end)
+        donor, acceptor = (right, left) if strand == "-" else (left, right)
+
+        if donor == 0 and acceptor == 0:
+            label = NOVEL_COMBINATION
+        elif acceptor == 0:
+            label = NOVEL_DONOR
+        elif donor == 0:
+            label = NOVEL_ACCEPTOR
+        else:
+            label = NOVEL
+        self.labels[label] += 1
+        return label, donor, acceptor
+
+    def summary(self):
+        u"""
+        :return: the number of junctions of every label, eg: 10 known, 2 novel_donor ...
+        """
+        return ", ".join("%d %s" % (self.labels[x], x) for x in LABELS)
+
+
+class JunctionFile(object):
+    u"""
+    read only view of a binary junction file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.__mmap__, self.header, self.arrays = read_arrays(path, MAGIC)
+        self.chromosomes = self.header["chromosomes"]
+
+    def __len__(self):
+        return len(self.arrays["start"])
+
+    @property
+    def labeled(self):
+        u"""
+        whether the junctions are annotated by a reference
+        """
+        return bool(len(self)) and bool((self.arrays["label"] != UNLABELED).any())
+
+    @staticmethod
+    def build(output, junctions):
+        u"""
+        :param output: path to output file
+        :param junctions: iterable of (chromosome, start, end, strand, count, label), the label
+                          is one of LABELS or None, the junctions must be unique
+        """
+        chromosomes = {}
+        buffers = {name: array(code) for name, (code, _) in COLUMNS.items()}
+        chrom, starts, ends = buffers["chrom"], buffers["start"], buffers["end"]
+        strands, counts, labels = buffers["strand"], buffers["count"], buffers["label"]
+        codes = {x: i for i, x in enumerate(LABELS)}
+
+        for chromosome, start, end, strand, count, label in junctions:
+            chrom.append(chromosomes.setdefault(chromosome, len(chromosomes)))
+            starts.append(start)
+            ends.append(end)
+            strands.append(strand == "-")
+            counts.append(count)
+            labels.append(UNLABELED if label is None else codes[label])
+
+        arrays = {name: np.frombuffer(x, dtype=x.typecode) for name, x in buffers.items()}
+        if len(starts) and max(int(arrays["end"].max()), int(arrays["start"].max())) > np.iinfo(np.int32).max:
+            raise ValueError("the junctions beyond %d are not supported" % np.iinfo(np.int32).max)
+
+        # the chromosome ids follow the sorted names, so the files of all the samples are in the same order
+        names = sorted(chromosomes.keys())
+        rank = np.zeros(len(names), dtype=np.uint32)
+        for i, name in enumerate(names):
+            rank[chromosomes[name]] = i
+        arrays["chrom"] = rank[arrays["chrom"]]
+
+        order = np.lexsort((arrays["strand"], arrays["end"], arrays["start"], arrays["chrom"]))
+        arrays = {name: arrays[name][order].astype(dtype) for name, (_, dtype) in COLUMNS.items()}
+        write_arrays(output, MAGIC, {"version": VERSION, "chromosomes": names}, arrays)
+
+    def items(self, step=65536):
+        u"""
+        :param step: number of junctions decoded at once
+        :return: generator of (chromosome, start, end, strand, count, label), label is None without reference
+        """
+        chromosomes = self.chromosomes
+        arrays = self.arrays
+        for i in range(0, len(self), step):
+            columns = [arrays[x][i:i + step].tolist() for x in COLUMNS.keys()]
+            for chrom, start, end, strand, count, label in zip(*columns):
+                yield (
+                    chromosomes[chrom], start, end, STRANDS[strand], count,
+                    LABELS[label] if label != UNLABELED else None
+                )
+
+
+def read_text(path):
+    u"""
+    the junctions written by gmap_splicesites2sj.py, with or without the labels of --reference
+    :return: generator of (chromosome, start, end, strand, count, label)
+    """
+    with open_input(path) as r:
+        for line in r:
+            columns = line.rstrip("\n").split("\t")
+            if len(columns) < 5:
+                continue
+            yield (
+                columns[0], int(columns[1]), int(columns[2]), columns[3], int(columns[4]),
+                columns[5] if len(columns) > 5 else None
+            )
+
+
+def write_star(junctions, output):
+    u"""
+    SJ.out.tab of STAR: chromosome, first and last base of intron, strand (0: undefined,
+    1: +, 2: -), intron motif, annotated, unique reads, multi-mapping reads, max overhang
+
+    the motif needs the genome, and gmap -A output has neither the multi-mapping reads
+    nor the overhang, they are written as 0
+    :param junctions: iterable of (chromosome, start, end, strand, count, label)
+    :param output: path to output file
+    """
+    with open_output(output) as w:
+        w.writelines(
+            "%s\t%d\t%d\t%d\t0\t%d\t%d\t0\t0\n" % (
+                chromosome, start, end, 2 if strand == "-" else 1 if strand == "+" else 0,
+                label == KNOWN, count
+            )
+            for chromosome, start, end, strand, count, label in junctions
+        )
+
+
+def sample_name(path):
+    u"""
+    sample for sample.junctions.bin
+    """
+    name = os.path.basename(path)
+    for suffix in (".bin", ".junctions", ".txt"):
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+    return name
+
+
+def __keys__(junctions, mapping, start, stop):
+    u"""
+    the sort keys of junctions[start:stop] in the global order of merge
+    :param junctions: JunctionFile
+    :param mapping: numpy array, the global chromosome id of every chromosome of the file
+    :return: (chromosome << 32 | start, end << 1 | strand) uint64 numpy arrays
+    """
+    arrays = junctions.arrays
+    high = mapping[arrays["chrom"][start:stop]] << np.uint64(32) | arrays["start"][start:stop].astype(np.uint64)
+    low = arrays["end"][start:stop].astype(np.uint64) << np.uint64(1) | arrays["strand"][start:stop].astype(np.uint64)
+    return high, low
+
+
+def merge(paths, output, names=None):
+    u"""
+    k-way merge of the binary junction files into a count matrix
+
+    the files are read block by block. the junctions up to the smallest last
+    key of the blocks are complete, the larger ones may still come from the
+    next block of another file, so only the complete ones are grouped by
+    numpy and written, and the others are read again in next round. the
+    memory does not grow with the number of junctions
+    :param paths: list of the binary junction files
+    :param output: path to the matrix, chromosome, start, end, strand, label (if any file
+                   is labeled) and the count of every sample
+    :param names: the column names of samples, the file names by default
+    :return: number of junctions in the matrix
+    """
+    names = names or [sample_name(x) for x in paths]
+    if len(names) != len(paths):
+        raise ValueError("%d names for %d files" % (len(names), len(paths)))
+
+    files = [JunctionFile(x) for x in paths]
+    chromosomes = sorted({x for f in files for x in f.chromosomes})
+    index = {x: i for i, x in enumerate(chromosomes)}
+    mappings = [np.array([index[x] for x in f.chromosomes], dtype=np.uint64) for f in files]
+    labeled = any(f.labeled for f in files)
+
+    step = max(MERGE_BUFFER // max(len(files), 1), 256)
+    cursors = [0] * len(files)
+    rows = 0
+    with open_output(output) as w:
+        w.write("\t".join(["chrom", "start", "end", "strand"] + (["label"] if labeled else []) + names) + "\n")
+
+        while True:
+            active = [i for i, f in enumerate(files) if cursors[i] < len(f)]
+            if not active:
+                break
+
+            # the smallest last key of the blocks not reaching the end of their files
+            bound = None
+            for i in active:
+                stop = cursors[i] + step
+                if stop < len(files[i]):
+                    high, low = __keys__(files[i], mappings[i], stop - 1, stop)
+                    key = (int(high[0]), int(low[0]))
+                    if bound is None or key < bound:
+                        bound = key
+
+            blocks = []
+            for i in active:
+                start = cursors[i]
+                high, low = __keys__(files[i], mappings[i], start, min(start + step, len(files[i])))
+                if bound is not None:
+                    complete = (high < np.uint64(bound[0])) | (high == np.uint64(bound[0])) & (low <= np.uint64(bound[1]))
+                    size = int(complete.sum())
+                    high, low = high[:size], low[:size]
+                arrays = files[i].arrays
+                blocks.append((
+                    high, low, np.full(len(high), i, dtype=np.int64),
+                    arrays["count"][start:start + len(high)], arrays["label"][start:start + len(high)]
+                ))
+                cursors[i] += len(high)
+
+            rows += __write_block__(w, chromosomes, len(files), labeled, *[np.concatenate(x) for x in zip(*blocks)])
+    return rows
+
+
+def __write_block__(w, chromosomes, samples, labeled, high, low, sample, count, label):
+    u"""
+    group the junctions of all the samples by key, and write them as rows of the matrix
+    :return: number of rows
+    """
+    if not len(high):
+        return 0
+
+    order = np.lexsort((sample, low, high))
+    high, low, sample, count, label = high[order], low[order], sample[order], count[order], label[order]
+
+    first = np.ones(len(high), dtype=bool)
+    first[1:] = (high[1:] != high[:-1]) | (low[1:] != low[:-1])
+    row = np.cumsum(first) - 1
+    size = int(row[-1]) + 1
+
+    matrix = np.zeros((size, samples), dtype=np.uint32)
+    matrix[row, sample] = count
+    labels = np.full(size, UNLABELED, dtype=np.uint8)
+    np.minimum.at(labels, row, label)
+
+    high, low = high[first], low[first]
+    columns = (
+        (high >> np.uint64(32)).tolist(), (high & np.uint64(0xffffffff)).tolist(),
+        (low >> np.uint64(1)).tolist(), (low & np.uint64(1)).tolist(), labels.tolist(), matrix.tolist(),
+    )
+    for chrom, start, end, strand, code, counts in zip(*columns):
+        line = "%s\t%d\t%d\t%s\t" % (chromosomes[chrom], start, end, STRANDS[strand])
+        if labeled:
+            line += (LABELS[code] if code != UNLABELED else "NA") + "\t"
+        w.write(line + "\t".join(map(str, counts)) + "\n")
+    return size
+
+
+def argument_parser():
+    u"""
+    argument_parser
+    """
+    parser = argparse.ArgumentParser(
+        description="Binary junctions, STAR SJ.out.tab and count matrix of samples"
+    )
+
+    sub = parser.add_subparsers(dest="command")
+
+    pack = sub.add_parser("pack", help="Text junctions of gmap_splicesites2sj.py into the binary format")
+    pack.add_argument("-i", "--input", help="Path to the text junctions", required=True)
+    pack.add_argument("-o", "--output", help="Path to the binary junctions", required=True)
+
+    star = sub.add_parser("star", help="Binary or text junctions into STAR SJ.out.tab")
+    star.add_argument("-i", "--input", help="Path to the binary or text junctions", required=True)
+    star.add_argument("-o", "--output", help="Path to SJ.out.tab", required=True)
+
+    merge_ = sub.add_parser("merge", help="Merge the binary junctions of samples into a count matrix")
+    merge_.add_argument("-i", "--input", nargs="+", help="Paths to the binary junctions", required=True)
+    merge_.add_argument("-o", "--output", help="Path to the count matrix, .gz to compress", required=True)
+    merge_.add_argument("-n", "--names", default=None, help="Comma separated names of samples, the file names by default")
+
+    if len(sys.argv[1:]) <= 0:
+        parser.print_help()
+        exit(0)
+
+    return parser.parse_args(sys.argv[1:])
+
+
+def is_binary(path):
+    u"""
+    check the magic of the file
+    """
+    with open(path, "rb") as r:
+        return r.read(len(MAGIC)) == MAGIC
+
+
+def main():
+    args = argument_parser()
+
+    if args.command == "pack":
+        JunctionFile.build(args.output, read_text(args.input))
+    elif args.command == "star":
+        junctions = JunctionFile(args.input).items() if is_binary(args.input) else read_text(args.input)
+        write_star(junctions, args.output)
+    elif args.command == "merge":
+        names = args.names.split(",") if args.names else None
+        rows = merge(args.input, args.output, names)
+        print("%d junctions of %d samples" % (rows, len(args.input)), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+u"""
+per-stage profiling of the converters, --profile report.json and --pstats out.prof
+
+stages:
+    read:    reading and splitting the lines into records
+    parse:   decoding the attributes column
+    resolve: linking exons, transcripts and genes
+    format:  formatting the output lines
+    count:   counting the junctions, see gmap_splicesites2sj.py
+    sort:    sorting the output lines, see sort.py
+    write:   compressing and writing the output
+    other:   the rest, eg: the loop of converter itself
+
+the converters are generator pipelines, the stages are nested into each
+other, eg: format pulls the records from read. the time and the growth of
+peak memory are charged to the innermost running stage only, so the stages
+add up to the wall time and the peak memory
+
+    with Profiler("gtf2gff", report="report.json", hooks=PROFILE_HOOKS):
+        ...
+
+the hooks are (class, method name, stage), the methods are wrapped while
+profiling and restored after. the sub-processes (-t, --workers) are not
+profiled
+"""
+import cProfile
+import inspect
+import json
+import sys
+from collections import Counter
+from resource import RUSAGE_SELF, getrusage
+from time import perf_counter
+
+from attributes import Attributes
+from fileio import BufferedOutput
+from sort import SortedOutput
+
+__author__ = "Zhang Yiming"
+__since__ = "2026.10.17"
+
+
+READ = "read"
+PARSE = "parse"
+RESOLVE = "resolve"
+FORMAT = "format"
+COUNT = "count"
+SORT = "sort"
+WRITE = "write"
+OTHER = "other"
+
+STAGES = (READ, PARSE, RESOLVE, FORMAT, COUNT, SORT, WRITE, OTHER)
+
+# shared by all the converters
+COMMON_HOOKS = (
+    (Attributes, "get", PARSE),
+    (Attributes, "get_list", PARSE),
+    (Attributes, "to_dict", PARSE),
+    (Attributes, "items", PARSE),
+    (BufferedOutput, "__flush_buffer__", WRITE),
+    (SortedOutput, "__add__", SORT),
+    (SortedOutput, "__spill__", SORT),
+    (SortedOutput, "close", SORT),
+)
+
+
+# ru_maxrss per MB, kilobytes on linux, bytes on macOS
+RSS_UNIT = 1024 * 1024 if sys.platform == "darwin" else 1024
+
+
+def peak_rss():
+    u"""
+    peak resident memory of this process in MB
+    """
+    return getrusage(RUSAGE_SELF).ru_maxrss / RSS_UNIT
+
+
+class Profiler(object):
+    u"""
+    wall time, growth of peak memory and calls of every stage,
+    and the number of records per feature type
+    """
+
+    def __init__(self, name, report=None, pstats=None, hooks=()):
+        u"""
+        :param name: name of converter, saved in report
+        :param report: path to the json report, - for stderr, None to skip
+        :param pstats: path to the cProfile stats, None to skip
+        :param hooks: list of (class, method name, stage) to be timed
+        """
+        self.name = name
+        self.report = report
+        self.pstats = pstats
+        self.hooks = tuple(COMMON_HOOKS) + tuple(hooks)
+
+        self.seconds = dict.fromkeys(STAGES, 0.0)
+        self.memory = dict.fromkeys(STAGES, 0)
+        self.calls = dict.fromkeys(STAGES, 0)
+        self.features = Counter()
+
+        self.__stack__ = [OTHER]
+        self.__last__ = None
+        self.__last_rss__ = 0
+        self.__start__ = None
+        self.__patched__ = []
+        self.__cprofile__ = None
+
+    @property
+    def enabled(self):
+        return self.report is not None or self.pstats is not None
+
+    def __switch__(self):
+        u"""
+        charge the time and the growth of peak memory since last switch to the running stage
+        """
+        now, rss = perf_counter(), getrusage(RUSAGE_SELF).ru_maxrss
+        stage = self.__stack__[-1]
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + now - self.__last__
+        if rss != self.__last_rss__:
+            self.memory[stage] = self.memory.get(stage, 0) + rss - self.__last_rss__
+        self.__last__, self.__last_rss__ = now, rss
+
+    def enter(self, stage):
+        self.__switch__()
+        self.__stack__.append(stage)
+        self.calls[stage] = self.calls.get(stage, 0) + 1
+
+    def exit(self):
+        self.__switch__()
+        self.__stack__.pop()
+
+    def iterate(self, iterable, stage):
+        u"""
+        time every next() of iterable as stage
+        """
+        iterator = iter(iterable)
+        enter, exit = self.enter, self.exit
+        while True:
+            enter(stage)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                exit()
+            yield item
+
+    def records(self, records, stage=READ, count=True):
+        u"""
+        time the reading of records, and count them by feature type
+        :param records: iterable of (columns, Attributes), see store.open_records
+        :param stage: the stage of reading
+        :param count: count the feature types, False for the second pass of the same file
+        """
+        features = self.features
+        for record in self.iterate(records, stage):
+            if count and record[1] is not None:
+                features[record[0][2]] += 1
+            yield record
+
+    def wrap(self, func, stage):
+        u"""
+        :return: func timed as stage, the generators are timed by every next()
+        """
+        profiler = self
+        if inspect.isgeneratorfunction(func):
+            def wrapper(*args, **kwargs):
+                return profiler.iterate(func(*args, **kwargs), stage)
+        else:
+            def wrapper(*args, **kwargs):
+                profiler.enter(stage)
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    profiler.exit()
+        wrapper.__wrapped__ = func
+        return wrapper
+
+    def patch(self, owner, name, stage):
+        u"""
+        replace the method of owner by the timed one until the profiler is closed
+        """
+        raw = owner.__dict__[name]
+        if isinstance(raw, staticmethod):
+            timed = staticmethod(self.wrap(raw.__func__, stage))
+        elif isinstance(raw, classmethod):
+            timed = classmethod(self.wrap(raw.__func__, stage))
+        else:
+            timed = self.wrap(raw, stage)
+        setattr(owner, name, timed)
+        self.__patched__.append((owner, name, raw))
+
+    def __enter__(self):
+        global __current__
+        if not self.enabled:
+            return self
+
+        # the stages are only timed for the report, the wrappers would show up in the cProfile stats
+        if self.report:
+            for owner, name, stage in self.hooks:
+                self.patch(owner, name, stage)
+
+        if self.pstats:
+            self.__cprofile__ = cProfile.Profile()
+            self.__cprofile__.enable()
+
+        self.__start__ = self.__last__ = perf_counter()
+        self.__last_rss__ = getrusage(RUSAGE_SELF).ru_maxrss
+        __current__ = self
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        global __current__
+        if not self.enabled:
+            return
+
+        __current__ = NULL
+        self.__switch__()
+        seconds = perf_counter() - self.__start__
+
+        if self.__cprofile__ is not None:
+            self.__cprofile__.disable()
+            self.__cprofile__.dump_stats(self.pstats)
+
+        for owner, name, raw in reversed(self.__patched__):
+            setattr(owner, name, raw)
+        self.__patched__ = []
+
+        if exc_type is None and self.report:
+            self.dump(seconds)
+
+    def summary(self, seconds):
+        u"""
+        :param seconds: the wall time
+        :return: dict of the report
+        """
+        stages = {}
+        for stage, value in sorted(self.seconds.items(), key=lambda x: -x[1]):
+            if not value and not self.calls.get(stage):
+                continue
+            stages[stage] = {
+                "seconds": round(value, 4),
+                "share": round(value / seconds, 4) if seconds else 0,
+                "calls": self.calls.get(stage, 0),
+                "peak_growth_mb": round(self.memory.get(stage, 0) / RSS_UNIT, 1),
+            }
+
+        return {
+            "converter": self.name,
+            "seconds": round(seconds, 4),
+            "peak_rss_mb": round(peak_rss(), 1),
+            "records": sum(self.features.values()),
+            "features": dict(self.features.most_common()),
+            "stages": stages,
+        }
+
+    def dump(self, seconds):
+        u"""
+        write the json report, and a short table into stderr
+        """
+        summary = self.summary(seconds)
+
+        if self.report == "-":
+            json.dump(summary, sys.stderr, indent=4)
+            print(file=sys.stderr)
+        else:
+            with open(self.report, "w+") as w:
+                json.dump(summary, w, indent=4)
+
+        for stage, value in summary["stages"].items():
+            print("%-8s %10.3fs %6.1f%% %12d calls %10.1f MB" % (
+                stage, value["seconds"], value["share"] * 100, value["calls"], value["peak_growth_mb"]
+            ), file=sys.stderr)
+
+
+class NullProfiler(object):
+    u"""
+    used when not profiling, the records are passed as they are
+    """
+
+    enabled = False
+
+    @staticmethod
+    def records(records, stage=READ, count=True):
+        return records
+
+    @staticmethod
+    def iterate(iterable, stage):
+        return iterable
+
+
+NULL = NullProfiler()
+__current__ = NULL
+
+
+def current():
+    u"""
+    :return: the running Profiler, or NullProfiler
+    """
+    return __current__
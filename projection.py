@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+u"""
+feature types and attribute keys of the converters, pushed down into the reader
+
+every converter declares the feature types it converts and the attribute
+keys it reads, eg: Gff2Gtf never converts the UTRs and start codons. the
+records of other types are skipped by store.open_records(keep=...) before
+their 9th column is touched, and Attributes.to_dict(keys=...) only decodes
+the declared keys
+
+--feature-types and --keep-attrs narrow them further, and make the outputs smaller:
+
+    --feature-types gene,mRNA,exon  only the records of these input types are converted
+    --keep-attrs gene_name,gene_biotype
+                                    only these attributes are written, besides
+                                    the ids linking the records to their parents
+"""
+
+__author__ = "Zhang Yiming"
+__since__ = "2026.10.17"
+
+
+def split_names(text):
+    u"""
+    :param text: comma separated names, eg: gene,transcript,exon
+    :return: list of names, None if text is empty
+    """
+    if not text:
+        return None
+    names = [x.strip() for x in text.split(",") if x.strip()]
+    return names or None
+
+
+class Projection(object):
+    u"""
+    the feature types and attributes asked by --feature-types and --keep-attrs
+    """
+
+    def __init__(self, feature_types=None, attributes=None, lower=False):
+        u"""
+        :param feature_types: list of the input feature types to convert, None for all
+        :param attributes: list of the attribute keys to write, None for all
+        :param lower: lower case the attribute keys, for the converters using to_dict(lower=True)
+        """
+        self.feature_types = frozenset(feature_types) if feature_types else None
+        if attributes:
+            attributes = [x.lower() for x in attributes] if lower else attributes
+        self.attributes = frozenset(attributes) if attributes else None
+
+    def __repr__(self):
+        return "Projection(%s, %s)" % (
+            ",".join(sorted(self.feature_types)) if self.feature_types else "*",
+            ",".join(sorted(self.attributes)) if self.attributes else "*",
+        )
+
+    def options(self):
+        u"""
+        :return: dict of the options for the incremental manifest, empty if nothing is narrowed
+        """
+        res = {}
+        if self.feature_types is not None:
+            res["feature_types"] = sorted(self.feature_types)
+        if self.attributes is not None:
+            res["keep_attrs"] = sorted(self.attributes)
+        return res
+
+    def keep(self, label):
+        u"""
+        whether the records of the feature type are converted
+        """
+        return self.feature_types is None or label in self.feature_types
+
+    def narrow(self, keep=None):
+        u"""
+        :param keep: function of feature type -> bool declared by the converter, None for all
+        :return: the keep of store.open_records, None if nothing is skipped
+        """
+        if self.feature_types is None:
+            return keep
+        if keep is None:
+            return self.keep
+        return lambda label: keep(label) and label in self.feature_types
+
+    def filter(self, records):
+        u"""
+        the records of the kept feature types, for the sources not read by open_records
+        :param records: iterable of (columns, Attributes)
+        :return: generator of (columns, Attributes), the comments are kept
+        """
+        if self.feature_types is None:
+            yield from records
+            return
+
+        types = self.feature_types
+        for record in records:
+            if record[1] is None or record[0][2] in types:
+                yield record
+
+    def keys(self, required):
+        u"""
+        :param required: the keys read by the converter
+        :return: the keys decoded by Attributes.to_dict, None to decode all
+        """
+        if self.attributes is None:
+            return None
+        return self.attributes.union(required)
+
+
+# nothing is narrowed
+ALL = Projection()
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+u"""
+query the transcripts, genes or exons overlapping with regions
+
+python region.py -i gencode.gtf -r chr1:1,000,000-1,200,000 -o region.bed
+python region.py -i gencode.store -b panel.bed -f gene
+
+the transcripts are loaded by the same model of gtf2bed12.py, the intervals
+of every chromosome are sorted by start, and the overlaps are found by binary
+search between (start - longest interval) and end
+
+the regions are 1-based and closed like gtf, the regions in bed file are
+converted from 0-based
+"""
+import argparse
+import os
+import re
+import sys
+
+import numpy as np
+
+from fileio import open_output
+from gtf2bed12 import TranscriptModel
+
+__author__ = "Zhang Yiming"
+__since__ = "2026.10.17"
+
+
+class IntervalIndex(object):
+    u"""
+    intervals of every chromosome in arrays sorted by start
+    """
+
+    def __init__(self, chroms, starts, ends):
+        u"""
+        :param chroms: list of chromosome of every interval
+        :param starts: list or numpy array of start of every interval
+        :param ends: list or numpy array of end of every interval
+        """
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+
+        groups = {}
+        for idx, chrom in enumerate(chroms):
+            if chrom is not None:
+                groups.setdefault(chrom, []).append(idx)
+
+        # chromosome -> (starts, ends, index of intervals, longest interval)
+        self.index = {}
+        for chrom, indices in groups.items():
+            indices = np.asarray(indices, dtype=np.int64)
+            order = np.argsort(starts[indices], kind="stable")
+            indices = indices[order]
+            lengths = ends[indices] - starts[indices]
+            self.index[chrom] = (
+                starts[indices], ends[indices], indices, int(lengths.max()) if len(lengths) else 0
+            )
+
+    def query(self, chrom, start=None, end=None):
+        u"""
+        :param chrom: chromosome
+        :param start: start of region, 1-based, None for the begin of chromosome
+        :param end: end of region, closed, None for the end of chromosome
+        :return: numpy array, sorted index of the intervals overlapping with region
+        """
+        if chrom not in self.index:
+            return np.zeros(0, dtype=np.int64)
+
+        starts, ends, indices, longest = self.index[chrom]
+        if start is None and end is None:
+            return np.sort(indices)
+
+        start = starts[0] if start is None else start
+        end = ends.max() if end is None else end
+
+        lo = np.searchsorted(starts, start - longest, side="left")
+        hi = np.searchsorted(starts, end, side="right")
+        found = indices[lo:hi][ends[lo:hi] >= start]
+        return np.sort(found)
+
+
+class RegionIndex(object):
+    u"""
+    interval indices of transcripts, genes and exons
+    """
+
+    def __init__(self, model):
+        u"""
+        :param model: gtf2bed12.TranscriptModel
+        """
+        self.model = model
+
+        # transcripts, the index is the same as model
+        self.transcript_ids = [None] * len(model.transcripts)
+        chroms = [None] * len(model.transcripts)
+        starts = np.zeros(len(model.transcripts), dtype=np.int64)
+        ends = np.full(len(model.transcripts), -1, dtype=np.int64)
+        for idx, record in model.records.items():
+            chroms[idx] = record[0]
+            starts[idx] = int(record[1])
+            ends[idx] = int(record[2])
+            self.transcript_ids[idx] = record[3]
+        self.transcripts = IntervalIndex(chroms, starts, ends)
+
+        # genes, span of all their transcripts
+        genes = model.gene_spans()
+        self.gene_ids = list(genes.keys())
+        self.gene_records = list(genes.values())
+        self.genes = IntervalIndex(
+            [x[0] for x in self.gene_records], [x[1] for x in self.gene_records], [x[2] for x in self.gene_records]
+        )
+
+        # exons, the exons without transcript are dropped
+        index, exon_starts, exon_ends = model.arrays("exon")
+        self.exon_transcripts = index
+        self.exon_starts = exon_starts
+        self.exon_ends = exon_ends
+        self.exons = IntervalIndex([chroms[x] for x in index.tolist()], exon_starts, exon_ends)
+
+    @classmethod
+    def from_file(cls, path, progress=True):
+        u"""
+        :param path: path to gtf, gff3 or store
+        :param progress: show the progressbar while reading
+        """
+        return cls(TranscriptModel().load(path, progress=progress))
+
+    def query(self, regions, feature="transcript"):
+        u"""
+        :param regions: list of (chrom, start, end), start and end could be None
+        :param feature: transcript, gene or exon
+        :return: sorted index of the features overlapping with any regions
+        """
+        index = {"transcript": self.transcripts, "gene": self.genes, "exon": self.exons}[feature]
+        found = [index.query(*x) for x in regions]
+        return np.unique(np.concatenate(found)) if found else np.zeros(0, dtype=np.int64)
+
+    def transcript_names(self, chrom, start=None, end=None):
+        u"""
+        :return: transcript ids overlapping with the region
+        """
+        return [self.transcript_ids[x] for x in self.transcripts.query(chrom, start, end).tolist()]
+
+    def gene_names(self, chrom, start=None, end=None):
+        u"""
+        :return: gene ids overlapping with the region
+        """
+        return [self.gene_ids[x] for x in self.genes.query(chrom, start, end).tolist()]
+
+    def format(self, indices, feature="transcript"):
+        u"""
+        :param indices: output of query
+        :param feature: transcript, gene or exon
+        :return: generator of bed lines, bed12 for transcripts, bed6 for genes and exons
+        """
+        if feature == "transcript":
+            yield from self.model.bed12(indices.tolist())
+        elif feature == "gene":
+            for idx in indices.tolist():
+                chrom, start, end, strand = self.gene_records[idx]
+                yield "%s\t%d\t%d\t%s\t255\t%s\n" % (chrom, start, end, self.gene_ids[idx], strand)
+        else:
+            records = self.model.records
+            for idx in indices.tolist():
+                record = records.get(int(self.exon_transcripts[idx]))
+                if record is None:
+                    continue
+                yield "%s\t%d\t%d\t%s\t255\t%s\n" % (
+                    record[0], self.exon_starts[idx], self.exon_ends[idx], record[3], record[5]
+                )
+
+
+def parse_region(region):
+    u"""
+    :param region: chr1:1,000,000-1,200,000 or chr1
+    :return: (chrom, start, end)
+    """
+    match = re.match(r"^(?P<chrom>.+?)(:(?P<start>[\d,]+)(-(?P<end>[\d,]+))?)?$", region.strip())
+    if not match:
+        raise ValueError("invalid region %s" % region)
+
+    start, end = match.group("start"), match.group("end")
+    start = int(start.replace(",", "")) if start else None
+    end = int(end.replace(",", "")) if end else start
+    return match.group("chrom"), start, end
+
+
+def load_bed(path):
+    u"""
+    regions in bed file
+    :return: list of (chrom, start, end), 1-based
+    """
+    regions = []
+    with open(path) as r:
+        for line in r:
+            if line.startswith(("#", "track", "browser")) or not line.strip():
+                continue
+            lines = line.split("\t")
+            regions.append((lines[0], int(lines[1]) + 1, int(lines[2])))
+    return regions
+
+
+def argument_parser():
+    u"""
+    argument_parser
+    """
+    parser = argparse.ArgumentParser(
+        description="Query the transcripts, genes or exons overlapping with regions"
+    )
+
+    parser.add_argument(
+        "-i",
+        "--input",
+        help="Path to input file, gtf, gff3 or store from store.py",
+        required=True
+    )
+
+    parser.add_argument(
+        "-o",
+        "--output",
+        help="Path to output file, print to stdout if not set"
+    )
+
+    parser.add_argument(
+        "-r",
+        "--region",
+        action="append",
+        default=[],
+        help="Region like chr1:1000000-1200000, could be used multiple times"
+    )
+
+    parser.add_argument(
+        "-b",
+        "--bed",
+        help="Path to bed file of regions, eg: a panel of loci"
+    )
+
+    parser.add_argument(
+        "-f",
+        "--feature",
+        choices=["transcript", "gene", "exon"],
+        default="transcript",
+        help="Type of features to report, transcripts in bed12, genes and exons in bed6"
+    )
+
+    if len(sys.argv[1:]) <= 0:
+        parser.print_help()
+        exit(0)
+
+    return parser.parse_args(sys.argv[1:])
+
+
+def main():
+    args = argument_parser()
+
+    if not os.path.isfile(args.input):
+        raise FileNotFoundError("%s not found" % args.input)
+
+    regions = [parse_region(x) for x in args.region]
+    if args.bed:
+        regions += load_bed(args.bed)
+
+    index = RegionIndex.from_file(args.input)
+    lines = index.format(index.query(regions, args.feature), args.feature)
+
+    with open_output(args.output or "-", index="bed") as w:
+        w.writelines(lines)
+
+
+if __name__ == '__main__':
+    main()
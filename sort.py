@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+u"""
+coordinate sorted output of the converters, instead of sort -k1,1 -k2,2n afterwards
+
+the lines are sorted by chromosome (same as sort -k1,1), start, and the
+records of a gene are kept together as long as their starts are the same,
+the gene first, then its transcripts, then the others, so the parents
+always come before their children:
+
+    gene      100  G1
+    mRNA      100  T1 (G1)
+    mRNA      100  T2 (G1)
+    exon      100  T1.1
+    gene      100  G2
+    exon      300  T1.2
+
+the comments are written before all the records. the lines are sorted in
+memory until the memory limit, then the sorted runs are spilled into the
+temporary directory and merged at the end
+"""
+import heapq
+import os
+import sys
+import tempfile
+
+from attributes import GFF3, GTF, Attributes
+
+__author__ = "Zhang Yiming"
+__since__ = "2026.10.17"
+
+
+BED = "bed"
+
+# bytes per line besides the text, the key tuple and list slot
+LINE_OVERHEAD = 200
+
+# bytes per gene or ID kept for the order of genes, besides the text, the dict slot and the int
+GROUP_OVERHEAD = 120
+
+# the share of memory always left to the lines, even if the genes and IDs take the rest
+MIN_LINES_SHARE = 16
+
+
+class SortedOutput(object):
+    u"""
+    collect the lines written by the converters, and write them sorted into handle at close
+    """
+
+    def __init__(self, handle, fmt, memory=1024, tmpdir=None):
+        u"""
+        :param handle: the output from fileio.open_output, left open at close
+        :param fmt: GTF, GFF3 or BED, the format of the written lines
+        :param memory: memory limit in MB of the lines, and the genes and IDs kept for the
+                       whole run, the sorted runs of lines are spilled to disk if larger
+        :param tmpdir: directory of the sorted runs
+        """
+        if fmt not in (GTF, GFF3, BED):
+            raise ValueError("unknown format %s" % fmt)
+        self.handle = handle
+        self.format = fmt
+        self.memory = memory * 1024 * 1024
+        self.tmpdir = tmpdir
+
+        self.lines = []
+        self.size = 0
+        self.count = 0
+        self.runs = []
+        self.__partial__ = ""
+
+        # gene -> the order of its first line, and ID -> its gene for gff3
+        self.groups = {}
+        self.roots = {}
+        # the memory of groups and roots, which are never spilled
+        self.group_size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.__remove_runs__()
+
+    @property
+    def closed(self):
+        return self.handle.closed
+
+    def write(self, text):
+        u"""
+        :param text: one or more lines, the last line is kept until its newline is written
+        """
+        if self.__partial__:
+            text = self.__partial__ + text
+            self.__partial__ = ""
+
+        if text.count("\n") == 1 and text.endswith("\n"):
+            self.__add__(text)
+            return len(text)
+
+        lines = text.splitlines(True)
+        if lines and not lines[-1].endswith("\n"):
+            self.__partial__ = lines.pop()
+        for line in lines:
+            self.__add__(line)
+        return len(text)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def __key__(self, line):
+        u"""
+        :return: (chromosome, start, order of gene, level, order of line)
+        """
+        seq = self.count
+        self.count += 1
+        columns = line.split("\t", 9)
+
+        if self.format == BED:
+            return columns[0], int(columns[1]), seq, 0, seq
+
+        attrs = Attributes(columns[8], fmt=self.format) if len(columns) > 8 else None
+        if attrs is None:
+            group, level = None, 2
+        elif self.format == GTF:
+            group = attrs.get("gene_id")
+            level = 0 if columns[2] == "gene" else 1 if columns[2] == "transcript" else 2
+        else:
+            ids = attrs.get("ID")
+            parents = attrs.get_list("Parent")
+            if parents:
+                parent = self.roots.get(parents[0])
+                # the parent of a transcript is a gene
+                level = 1 if parent == parents[0] else 2
+                group = parent if parent is not None else parents[0]
+            else:
+                group, level = ids, 0
+            if ids is not None and ids not in self.roots:
+                self.roots[ids] = group
+                self.group_size += len(ids) + GROUP_OVERHEAD
+
+        if group is None:
+            order = seq
+        else:
+            order = self.groups.get(group)
+            if order is None:
+                order = self.groups[group] = seq
+                self.group_size += len(group) + GROUP_OVERHEAD
+        return columns[0], int(columns[3]), order, level, seq
+
+    def __add__(self, line):
+        if line.startswith("#") or not line.strip():
+            # the comments and empty lines are not sorted
+            self.handle.write(line)
+            return
+
+        self.lines.append(self.__key__(line) + (line,))
+        self.size += len(line) + LINE_OVERHEAD
+        if self.size + self.group_size >= self.memory and self.size >= self.memory // MIN_LINES_SHARE:
+            self.__spill__()
+
+    def __spill__(self):
+        u"""
+        write the sorted lines into a run on disk
+        """
+        self.lines.sort()
+        fd, path = tempfile.mkstemp(suffix=".sorting", dir=self.tmpdir)
+        with os.fdopen(fd, "w") as w:
+            w.writelines("%s\t%d\t%d\t%d\t%d\t%s" % x for x in self.lines)
+        self.runs.append(path)
+        self.lines = []
+        self.size = 0
+
+    @staticmethod
+    def __iter_run__(path):
+        with open(path) as r:
+            for line in r:
+                chrom, start, order, level, seq, line = line.split("\t", 5)
+                yield chrom, int(start), int(order), int(level), int(seq), line
+
+    def __remove_runs__(self):
+        for path in self.runs:
+            if os.path.exists(path):
+                os.remove(path)
+        self.runs = []
+
+    def close(self):
+        u"""
+        write the sorted lines into handle, the handle is closed by its owner
+        """
+        if self.__partial__:
+            self.__add__(self.__partial__ + "\n")
+            self.__partial__ = ""
+
+        if not self.runs:
+            self.lines.sort()
+            self.handle.writelines(x[-1] for x in self.lines)
+            self.lines = []
+            return
+
+        if self.lines:
+            self.__spill__()
+
+        print("merging %d sorted runs" % len(self.runs), file=sys.stderr)
+        try:
+            streams = [self.__iter_run__(path) for path in self.runs]
+            self.handle.writelines(x[-1] for x in heapq.merge(*streams))
+        finally:
+            self.__remove_runs__()
+
+
+def sorted_output(handle, fmt, sort=False, memory=1024, tmpdir=None):
+    u"""
+    :param handle: the output from fileio.open_output
+    :param fmt: GTF, GFF3 or BED
+    :param sort: sort the lines by coordinate, otherwise handle is returned as it is
+    :param memory: memory limit in MB, see SortedOutput
+    :param tmpdir: directory of the sorted runs
+    :return: SortedOutput or handle
+    """
+    return SortedOutput(handle, fmt, memory=memory, tmpdir=tmpdir) if sort else handle
@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+u"""
+binary annotation store, parse the gtf or gff3 once and convert it many times
+
+python store.py index -i gencode.gtf -o gencode.store
+python gtf2gff.py -i gencode.store -o gencode.gff3
+
+layout of the store, every array is 8 bytes aligned:
+    MAGIC, uint64 size of the header, json header, arrays
+
+    seqid, source, type, score, strand, phase: handles into the string table
+    start, end: int64
+    attr_offsets, attr_keys, attr_values: CSR of the attributes, the values are not decoded
+    id: handle of the gff3 ID, gtf gene_id or transcript_id, -1 if there is none
+    parent_offsets, parents: CSR of the parent features
+    child_offsets, children: CSR of the child features
+    comment_pos, comment_text: comment lines, and the number of features before them
+    string_offsets, string_data: the string table
+
+the store is memory-mapped, so the concurrent jobs share the same pages
+"""
+import argparse
+import io
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+import numpy as np
+from tqdm import tqdm
+
+from attributes import GFF3, GTF, Attributes, iter_records
+from fileio import open_input
+
+__author__ = "Zhang Yiming"
+__since__ = "2026.10.17"
+
+
+MAGIC = b"BFCSTORE"
+VERSION = 1
+
+COLUMNS = ("seqid", "source", "type", "score", "strand", "phase")
+
+
+def is_store(path):
+    u"""
+    check the magic of the file
+    """
+    with open(path, "rb") as r:
+        return r.read(len(MAGIC)) == MAGIC
+
+
+def write_arrays(output, magic, header, arrays):
+    u"""
+    write the 8 bytes aligned arrays after the magic and json header, same layout as the store
+    :param output: path to output file, replaced at last
+    :param magic: bytes at the begin of file
+    :param header: dict saved in the json header, the layout of arrays is added as "arrays"
+    :param arrays: dict of name -> numpy array
+    """
+    # the offsets depend on the size of header, which contains the offsets
+    layout, data = {}, b""
+    while True:
+        offset = len(magic) + 8 + len(data)
+        offset += -offset % 8
+        layout = {}
+        for name, array in arrays.items():
+            layout[name] = [offset, array.dtype.str, len(array)]
+            offset += array.nbytes
+            offset += -offset % 8
+
+        new_data = json.dumps(dict(header, arrays=layout)).encode("utf-8")
+        stable = len(new_data) == len(data)
+        data = new_data
+        if stable:
+            break
+
+    temp = output + ".tmp"
+    with open(temp, "wb") as w:
+        w.write(magic)
+        w.write(struct.pack("<Q", len(data)))
+        w.write(data)
+        for name, array in arrays.items():
+            w.write(b"\0" * (layout[name][0] - w.tell()))
+            w.write(array.tobytes())
+    os.replace(temp, output)
+
+
+def read_arrays(path, magic):
+    u"""
+    memory-map the file written by write_arrays
+    :return: (mmap, json header, dict of name -> numpy array on the mmap)
+    """
+    with open(path, "rb") as r:
+        buffer = mmap.mmap(r.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if buffer[:len(magic)] != magic:
+        raise ValueError("%s is not a %s file" % (path, magic.decode("utf-8")))
+
+    size, = struct.unpack_from("<Q", buffer, len(magic))
+    start = len(magic) + 8
+    header = json.loads(buffer[start:start + size].decode("utf-8"))
+
+    arrays = {}
+    for name, (offset, dtype, count) in header["arrays"].items():
+        arrays[name] = np.frombuffer(buffer, dtype=dtype, count=count, offset=offset)
+    return buffer, header, arrays
+
+
+def open_records(path, strip_prefix=False, start=None, end=None, fmt=None, keep=None):
+    u"""
+    records of gtf, gff3 or store, see attributes.iter_records
+    :param path: path to input file
+    :param strip_prefix: see Attributes
+    :param start: byte offset of plain text, or index of the first feature of store
+    :param end: byte offset of plain text, or index of the last feature of store (excluded)
+    :param fmt: GTF or GFF3 of plain text, None to detect from every record
+    :param keep: function of feature type -> bool, the records of other types are skipped, see projection.py
+    :return: generator of (columns, Attributes)
+    """
+    if is_store(path):
+        yield from AnnotationStore(path).records(strip_prefix=strip_prefix, start=start, end=end, keep=keep)
+        return
+
+    with open_input(path) as r:
+        if start is None and end is None:
+            yield from iter_records(r, fmt=fmt, strip_prefix=strip_prefix, keep=keep)
+            return
+
+    start = start or 0
+    with open(path, "rb") as r:
+        r.seek(start)
+        text = r.read(end - start if end is not None else -1).decode("utf-8")
+    yield from iter_records(io.StringIO(text, newline=None), fmt=fmt, strip_prefix=strip_prefix, keep=keep)
+
+
+class StringTable(object):
+    u"""
+    intern the strings into int handles while building the store
+    """
+
+    def __init__(self):
+        self.handles = {}
+
+    def __call__(self, value):
+        handle = self.handles.get(value)
+        if handle is None:
+            handle = len(self.handles)
+            self.handles[value] = handle
+        return handle
+
+    def to_arrays(self):
+        u"""
+        :return: (offsets, data) numpy arrays
+        """
+        data = [x.encode("utf-8") for x in self.handles.keys()]
+        offsets = np.zeros(len(data) + 1, dtype=np.int64)
+        np.cumsum([len(x) for x in data], out=offsets[1:])
+        return offsets, np.frombuffer(b"".join(data), dtype=np.uint8)
+
+
+class AnnotationStore(object):
+    u"""
+    read only view of a store file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.__mmap__, self.header, self.arrays = read_arrays(path, MAGIC)
+        self.format = self.header["format"]
+
+        self.__strings__ = {}
+
+    def __len__(self):
+        return len(self.arrays["start"])
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+    def string(self, handle):
+        u"""
+        decode a string from the string table, the decoded ones are cached
+        """
+        value = self.__strings__.get(handle)
+        if value is None:
+            offsets = self.arrays["string_offsets"]
+            value = self.arrays["string_data"][offsets[handle]:offsets[handle + 1]].tobytes().decode("utf-8")
+            if len(self.__strings__) > 1000000:
+                self.__strings__.clear()
+            self.__strings__[handle] = value
+        return value
+
+    def find(self, ids):
+        u"""
+        features with the ID, gene_id or transcript_id
+        :param ids: str
+        :return: numpy array of feature indices
+        """
+        data = ids.encode("utf-8")
+        offsets = self.arrays["string_offsets"]
+        strings = self.arrays["string_data"]
+
+        # only the strings with the same length are compared
+        for handle in np.flatnonzero(np.diff(offsets) == len(data)).tolist():
+            if strings[offsets[handle]:offsets[handle + 1]].tobytes() == data:
+                return np.flatnonzero(self.arrays["id"] == handle)
+        return np.array([], dtype=np.int64)
+
+    def parents(self, idx):
+        u"""
+        :return: numpy array of the parent feature indices
+        """
+        offsets = self.arrays["parent_offsets"]
+        return self.arrays["parents"][offsets[idx]:offsets[idx + 1]]
+
+    def children(self, idx):
+        u"""
+        :return: numpy array of the child feature indices
+        """
+        offsets = self.arrays["child_offsets"]
+        return self.arrays["children"][offsets[idx]:offsets[idx + 1]]
+
+    def attributes(self, idx, strip_prefix=False):
+        u"""
+        :return: Attributes of a feature
+        """
+        offsets = self.arrays["attr_offsets"]
+        keys = self.arrays["attr_keys"][offsets[idx]:offsets[idx + 1]].tolist()
+        values = self.arrays["attr_values"][offsets[idx]:offsets[idx + 1]].tolist()
+        pairs = [(self.string(k), self.string(v)) for k, v in zip(keys, values)]
+        return Attributes.from_pairs(pairs, self.format, strip_prefix=strip_prefix)
+
+    def records(self, strip_prefix=False, start=None, end=None, keep=None):
+        u"""
+        same as attributes.iter_records, but the 9th column is empty
+        :param strip_prefix: see Attributes
+        :param start: index of the first feature
+        :param end: index of the last feature, excluded
+        :param keep: function of feature type -> bool, the records of other types are skipped
+        :return: generator of (columns, Attributes), and comments as (line, None)
+        """
+        start = start or 0
+        end = len(self) if end is None else end
+        string = self.string
+
+        comment_pos = self.arrays["comment_pos"].tolist()
+        comment_text = self.arrays["comment_text"].tolist()
+        comment = int(np.searchsorted(self.arrays["comment_pos"], start)) if comment_pos else 0
+
+        # decode the columns block by block, so the memory is bounded
+        fmt = self.format
+        attr_offsets = self.arrays["attr_offsets"]
+        labels = {}
+        for block in range(start, end, 65536):
+            block_end = min(block + 65536, end)
+            columns = [[string(y) for y in self.arrays[x][block:block_end].tolist()] for x in COLUMNS]
+            starts = self.arrays["start"][block:block_end].tolist()
+            ends = self.arrays["end"][block:block_end].tolist()
+
+            lo, hi = attr_offsets[block], attr_offsets[block_end]
+            keys = [string(x) for x in self.arrays["attr_keys"][lo:hi].tolist()]
+            values = [string(x) for x in self.arrays["attr_values"][lo:hi].tolist()]
+            offsets = (attr_offsets[block:block_end + 1] - lo).tolist()
+
+            for i in range(block_end - block):
+                while comment < len(comment_pos) and comment_pos[comment] <= block + i:
+                    yield string(comment_text[comment]), None
+                    comment += 1
+
+                if keep is not None:
+                    label = columns[2][i]
+                    kept = labels.get(label)
+                    if kept is None:
+                        kept = labels[label] = keep(label)
+                    if not kept:
+                        continue
+
+                pairs = list(zip(keys[offsets[i]:offsets[i + 1]], values[offsets[i]:offsets[i + 1]]))
+                yield [
+                    columns[0][i], columns[1][i], columns[2][i], str(starts[i]), str(ends[i]),
+                    columns[3][i], columns[4][i], columns[5][i], ""
+                ], Attributes.from_pairs(pairs, fmt, strip_prefix=strip_prefix)
+
+        if end == len(self):
+            for i in range(comment, len(comment_pos)):
+                yield string(comment_text[i]), None
+
+    @staticmethod
+    def build(input_file, output, progress=True):
+        u"""
+        parse a gtf or gff3 and write the store
+        :param input_file: path to gtf or gff3
+        :param output: path to store
+        :param progress: show the progressbar
+        """
+        strings = StringTable()
+        columns = {x: array("l") for x in COLUMNS}
+        starts, ends = array("q"), array("q")
+        attr_offsets, attr_keys, attr_values = array("q", [0]), array("l"), array("l")
+        comment_pos, comment_text = array("q"), array("l")
+
+        # ID of every feature, and the IDs of its parents, resolved after reading
+        ids, parent_offsets, parent_ids = array("l"), array("q", [0]), array("l")
+
+        fmt = None
+        with open_input(input_file) as r:
+            for lines, attrs in tqdm(iter_records(r), desc="Indexing", disable=not progress):
+                if attrs is None:
+                    comment_pos.append(len(starts))
+                    comment_text.append(strings(lines))
+                    continue
+
+                fmt = fmt or attrs.format
+                for key, value in zip(COLUMNS, lines[:3] + lines[5:8]):
+                    columns[key].append(strings(value))
+                starts.append(int(lines[3]))
+                ends.append(int(lines[4]))
+
+                for key, value in attrs.raw_items():
+                    attr_keys.append(strings(key))
+                    attr_values.append(strings(value))
+                attr_offsets.append(len(attr_keys))
+
+                if attrs.format == GFF3:
+                    ids.append(strings(attrs["ID"]) if "ID" in attrs else -1)
+                    parents = attrs.get_list("Parent")
+                elif lines[2] == "gene":
+                    ids.append(strings(attrs["gene_id"]) if "gene_id" in attrs else -1)
+                    parents = []
+                elif lines[2] == "transcript":
+                    ids.append(strings(attrs["transcript_id"]) if "transcript_id" in attrs else -1)
+                    parents = [attrs["gene_id"]] if "gene_id" in attrs else []
+                else:
+                    ids.append(-1)
+                    parents = [attrs["transcript_id"]] if "transcript_id" in attrs else []
+
+                for parent in parents:
+                    parent_ids.append(strings(parent))
+                parent_offsets.append(len(parent_ids))
+
+        n = len(starts)
+        ids = np.asarray(ids, dtype=np.int64)
+
+        # resolve the parents into feature indices, the first feature of the same ID wins
+        owner = np.full(len(strings.handles), -1, dtype=np.int64)
+        defined = np.flatnonzero(ids >= 0)
+        owner[ids[defined[::-1]]] = defined[::-1]
+
+        parent_offsets = np.asarray(parent_offsets, dtype=np.int64)
+        parents = owner[np.asarray(parent_ids, dtype=np.int64)]
+
+        # gtf genes are optional, drop the parents not found
+        child = np.repeat(np.arange(n, dtype=np.int64), np.diff(parent_offsets))
+        found = parents >= 0
+        parents, child = parents[found], child[found]
+        parent_offsets = np.concatenate([[0], np.cumsum(np.bincount(child, minlength=n))]).astype(np.int64)
+
+        order = np.argsort(parents, kind="stable")
+        child_offsets = np.concatenate([[0], np.cumsum(np.bincount(parents, minlength=n))]).astype(np.int64)
+
+        string_offsets, string_data = strings.to_arrays()
+
+        arrays = {x: np.asarray(columns[x], dtype=np.int32) for x in COLUMNS}
+        arrays.update({
+            "start": np.asarray(starts, dtype=np.int64),
+            "end": np.asarray(ends, dtype=np.int64),
+            "attr_offsets": np.asarray(attr_offsets, dtype=np.int64),
+            "attr_keys": np.asarray(attr_keys, dtype=np.int32),
+            "attr_values": np.asarray(attr_values, dtype=np.int32),
+            "id": ids,
+            "parent_offsets": parent_offsets,
+            "parents": parents,
+            "child_offsets": child_offsets,
+            "children": child[order],
+            "comment_pos": np.asarray(comment_pos, dtype=np.int64),
+            "comment_text": np.asarray(comment_text, dtype=np.int32),
+            "string_offsets": string_offsets,
+            "string_data": string_data,
+        })
+
+        AnnotationStore.__write__(output, arrays, fmt or GTF)
+
+    @staticmethod
+    def __write__(output, arrays, fmt):
+        u"""
+        write the arrays into store
+        """
+        write_arrays(output, MAGIC, {"version": VERSION, "format": fmt}, arrays)
+
+
+def argument_parser():
+    u"""
+    argument_parser
+    """
+    parser = argparse.ArgumentParser(
+        description="Binary annotation store of gtf|gff3"
+    )
+
+    sub = parser.add_subparsers(dest="command")
+
+    index = sub.add_parser("index", help="Parse gtf|gff3 into store")
+    index.add_argument("-i", "--input", help="Path to input file", required=True)
+    index.add_argument("-o", "--output", help="Path to output file", required=True)
+
+    if len(sys.argv[1:]) <= 0:
+        parser.print_help()
+        exit(0)
+
+    return parser.parse_args(sys.argv[1:])
+
+
+def main():
+    args = argument_parser()
+
+    if args.command == "index":
+        if not os.path.isfile(args.input):
+            raise FileNotFoundError("%s not found" % args.input)
+
+        out_dir = os.path.dirname(os.path.abspath(args.output))
+        if not os.path.exists(out_dir):
+            os.makedirs(out_dir)
+
+        AnnotationStore.build(args.input, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+u"""
+deterministic synthetic annotations for the benchmarks
+
+python synthetic.py -o ensembl.gtf -f gtf --genes 20000 --isoforms 3 --exons 8
+python synthetic.py -o refseq.gff3 -f gff3 -d ncbi
+python synthetic.py -o reads.txt -f gmap --reads 100000
+
+gtf:  ensembl style, gene, transcript, exon, CDS, start_codon and stop_codon
+gff3: ensembl style (ID=transcript:T1;Parent=gene:G1) or ncbi style
+      (ID=rna-NM_000001.1;Parent=gene-GENE1;Dbxref=GeneID:1)
+gmap: gmap -A output of reads sampled from the transcripts
+
+the same seed and scale always produce the same files
+"""
+import argparse
+import random
+import sys
+
+__author__ = "Zhang Yiming"
+__since__ = "2026.10.17"
+
+
+class SyntheticAnnotation(object):
+    u"""
+    genes with several isoforms, laid out along the chromosomes in order
+    """
+
+    def __init__(self, genes=1000, isoforms=3, exons=8, chromosomes=5, seed=42):
+        u"""
+        :param genes: number of genes
+        :param isoforms: number of transcripts per gene
+        :param exons: number of exons per transcript
+        :param chromosomes: number of chromosomes, the genes are spread evenly
+        :param seed: seed of the random generator
+        """
+        self.genes = genes
+        self.isoforms = isoforms
+        self.exons = exons
+        self.chromosomes = chromosomes
+        self.seed = seed
+
+    def models(self):
+        u"""
+        :return: generator of (chrom, strand, gene index, list of transcripts), every transcript
+                 is a list of (start, end) of exons sorted by position, the last isoform
+                 of a gene is non-coding
+        """
+        rng = random.Random(self.seed)
+        per_chrom = max(self.genes // self.chromosomes, 1)
+        position = 0
+        for idx in range(self.genes):
+            chrom = str(min(idx // per_chrom, self.chromosomes - 1) + 1)
+            if idx % per_chrom == 0 and idx // per_chrom < self.chromosomes:
+                position = 10000
+
+            position += rng.randint(1000, 20000)
+            strand = "+-"[rng.random() < 0.5]
+
+            # pool of exons shared by the isoforms, with a few alternative ones
+            pool = []
+            for _ in range(self.exons + 2):
+                start = position + rng.randint(100, 5000)
+                end = start + rng.randint(50, 400)
+                pool.append((start, end))
+                position = end
+
+            transcripts = []
+            for _ in range(self.isoforms):
+                transcripts.append(sorted(rng.sample(pool, min(self.exons, len(pool)))))
+            yield chrom, strand, idx, transcripts
+
+    @staticmethod
+    def __cds__(exons, strand, coding):
+        u"""
+        :return: list of (start, end, phase) of CDS, from the middle of first exon to the middle of last exon
+        """
+        if not coding or len(exons) < 2:
+            return []
+
+        left = (exons[0][0] + exons[0][1]) // 2
+        right = (exons[-1][0] + exons[-1][1]) // 2
+        cds = [(max(s, left), min(e, right)) for s, e in exons if e >= left and s <= right]
+
+        phase, res = 0, []
+        for start, end in (cds if strand == "+" else cds[::-1]):
+            res.append((start, end, phase))
+            phase = (3 - (end - start + 1 - phase) % 3) % 3
+        return sorted(res)
+
+    def gtf(self):
+        u"""
+        :return: generator of ensembl gtf lines
+        """
+        yield "#!genome-build synthetic\n"
+        for chrom, strand, idx, transcripts in self.models():
+            gene_id = "ENSG%011d" % (idx + 1)
+            gene_name = "GENE%d" % (idx + 1)
+            gene = 'gene_id "%s"; gene_version "1"; gene_name "%s"; gene_source "ensembl"; ' \
+                   'gene_biotype "protein_coding";' % (gene_id, gene_name)
+            yield "%s\tensembl\tgene\t%d\t%d\t.\t%s\t.\t%s\n" % (
+                chrom, min(x[0][0] for x in transcripts), max(x[-1][1] for x in transcripts), strand, gene
+            )
+
+            for i, exons in enumerate(transcripts):
+                coding = i < len(transcripts) - 1 or len(transcripts) == 1
+                transcript_id = "ENST%011d" % (idx * self.isoforms + i + 1)
+                transcript = '%s transcript_id "%s"; transcript_version "1"; transcript_name "%s-%d"; ' \
+                             'transcript_biotype "%s"; tag "basic";' % (
+                                 gene[:gene.index(" gene_version")], transcript_id, gene_name, 201 + i,
+                                 "protein_coding" if coding else "retained_intron"
+                             )
+                yield "%s\tensembl\ttranscript\t%d\t%d\t.\t%s\t.\t%s\n" % (
+                    chrom, exons[0][0], exons[-1][1], strand, transcript
+                )
+
+                for j, (start, end) in enumerate(exons if strand == "+" else exons[::-1]):
+                    yield '%s\tensembl\texon\t%d\t%d\t.\t%s\t.\t%s exon_number "%d"; exon_id "ENSE%011d";\n' % (
+                        chrom, start, end, strand, transcript, j + 1, idx * 100 + j + 1
+                    )
+
+                cds = self.__cds__(exons, strand, coding)
+                for start, end, phase in (cds if strand == "+" else cds[::-1]):
+                    yield '%s\tensembl\tCDS\t%d\t%d\t.\t%s\t%d\t%s protein_id "ENSP%011d";\n' % (
+                        chrom, start, end, strand, phase, transcript, idx * self.isoforms + i + 1
+                    )
+
+                if cds:
+                    if strand == "+":
+                        codons = (cds[0][0], cds[0][0] + 2), (cds[-1][1] + 1, cds[-1][1] + 3)
+                    else:
+                        codons = (cds[-1][1] - 2, cds[-1][1]), (cds[0][0] - 3, cds[0][0] - 1)
+                    for label, (start, end) in zip(("start_codon", "stop_codon"), codons):
+                        yield "%s\tensembl\t%s\t%d\t%d\t.\t%s\t0\t%s\n" % (
+                            chrom, label, start, end, strand, transcript
+                        )
+
+    def gff3(self, dialect="ensembl"):
+        u"""
+        :param dialect: ensembl or ncbi
+        :return: generator of gff3 lines
+        """
+        ncbi = dialect == "ncbi"
+        yield "##gff-version 3\n"
+        for chrom, strand, idx, transcripts in self.models():
+            gene_name = "GENE%d" % (idx + 1)
+            if ncbi:
+                gene_id = "gene-%s" % gene_name
+                gene = "ID=%s;Dbxref=GeneID:%d,HGNC:HGNC:%d;Name=%s;gbkey=Gene;gene=%s;" \
+                       "gene_biotype=protein_coding" % (gene_id, idx + 1, idx + 1, gene_name, gene_name)
+            else:
+                gene_id = "gene:ENSG%011d" % (idx + 1)
+                gene = "ID=%s;Name=%s;biotype=protein_coding;gene_id=ENSG%011d;version=1" % (
+                    gene_id, gene_name, idx + 1
+                )
+
+            source = "BestRefSeq" if ncbi else "ensembl"
+            yield "%s\t%s\tgene\t%d\t%d\t.\t%s\t.\t%s\n" % (
+                chrom, source, min(x[0][0] for x in transcripts), max(x[-1][1] for x in transcripts), strand, gene
+            )
+
+            for i, exons in enumerate(transcripts):
+                coding = i < len(transcripts) - 1 or len(transcripts) == 1
+                number = idx * self.isoforms + i + 1
+                if ncbi:
+                    accession = "%s_%06d.1" % ("NM" if coding else "NR", number)
+                    transcript_id = "rna-%s" % accession
+                    transcript = "ID=%s;Parent=%s;Dbxref=GeneID:%d,GenBank:%s;Name=%s;gbkey=%s;gene=%s;" \
+                                 "product=synthetic protein %d%%2C transcript variant %d;transcript_id=%s" % (
+                                     transcript_id, gene_id, idx + 1, accession, accession,
+                                     "mRNA" if coding else "misc_RNA", gene_name, idx + 1, i + 1, accession
+                                 )
+                else:
+                    transcript_id = "transcript:ENST%011d" % number
+                    transcript = "ID=%s;Parent=%s;Name=%s-%d;biotype=%s;transcript_id=ENST%011d;version=1" % (
+                        transcript_id, gene_id, gene_name, 201 + i,
+                        "protein_coding" if coding else "retained_intron", number
+                    )
+
+                yield "%s\t%s\t%s\t%d\t%d\t.\t%s\t.\t%s\n" % (
+                    chrom, source, "mRNA" if coding else "transcript", exons[0][0], exons[-1][1], strand, transcript
+                )
+
+                for j, (start, end) in enumerate(exons if strand == "+" else exons[::-1]):
+                    if ncbi:
+                        exon = "ID=exon-%s-%d;Parent=%s;gbkey=mRNA;gene=%s" % (
+                            transcript_id[4:], j + 1, transcript_id, gene_name
+                        )
+                    else:
+                        exon = "Parent=%s;Name=ENSE%011d;exon_id=ENSE%011d;rank=%d" % (
+                            transcript_id, idx * 100 + j + 1, idx * 100 + j + 1, j + 1
+                        )
+                    yield "%s\t%s\texon\t%d\t%d\t.\t%s\t.\t%s\n" % (chrom, source, start, end, strand, exon)
+
+                cds = self.__cds__(exons, strand, coding)
+                for start, end, phase in (cds if strand == "+" else cds[::-1]):
+                    if ncbi:
+                        detail = "ID=cds-NP_%06d.1;Parent=%s;gbkey=CDS;gene=%s;protein_id=NP_%06d.1" % (
+                            number, transcript_id, gene_name, number
+                        )
+                    else:
+                        detail = "ID=CDS:ENSP%011d;Parent=%s;protein_id=ENSP%011d" % (number, transcript_id, number)
+                    yield "%s\t%s\tCDS\t%d\t%d\t.\t%s\t%d\t%s\n" % (chrom, source, start, end, strand, phase, detail)
+
+    def gmap(self, reads=10000):
+        u"""
+        gmap -A output of reads sampled from the transcripts, a few exons of every read
+        :param reads: number of reads
+        :return: generator of lines
+        """
+        transcripts = [
+            (chrom, strand, exons) for chrom, strand, _, isoforms in self.models() for exons in isoforms
+        ]
+        rng = random.Random(self.seed + 1)
+        for idx in range(reads):
+            chrom, strand, exons = transcripts[rng.randrange(len(transcripts))]
+            first = rng.randrange(len(exons))
+            blocks = exons[first:first + rng.randint(1, 4)]
+
+            query = 1
+            yield ">read%d synthetic\n" % (idx + 1)
+            yield "Paths (1):\n"
+            yield "  Path 1: query 1..%d => genome %s:%d-%d\n" % (
+                sum(e - s + 1 for s, e in blocks), chrom, blocks[0][0], blocks[-1][1]
+            )
+            yield "\n"
+            yield "Alignments:\n"
+            yield "  Alignment for path 1:\n"
+            yield "\n"
+            for start, end in (blocks if strand == "+" else blocks[::-1]):
+                yield "    %s%s:%d-%d  (%d-%d)   %d%%\n" % (
+                    strand, chrom, start, end, query, query + end - start, rng.choice((98, 99, 100))
+                )
+                query += end - start + 1
+            yield "\n"
+
+    def write(self, path, fmt="gtf", dialect="ensembl", reads=10000):
+        u"""
+        :param path: path to output file
+        :param fmt: gtf, gff3 or gmap
+        :param dialect: ensembl or ncbi, only for gff3
+        :param reads: number of reads, only for gmap
+        :return: path
+        """
+        if fmt == "gtf":
+            lines = self.gtf()
+        elif fmt == "gff3":
+            lines = self.gff3(dialect)
+        elif fmt == "gmap":
+            lines = self.gmap(reads)
+        else:
+            raise ValueError("unknown format %s" % fmt)
+
+        with open(path, "w+") as w:
+            w.writelines(lines)
+        return path
+
+
+def argument_parser():
+    u"""
+    argument_parser
+    """
+    parser = argparse.ArgumentParser(
+        description="Generate synthetic gtf, gff3 or gmap -A output"
+    )
+
+    parser.add_argument("-o", "--output", help="Path to output file", required=True)
+    parser.add_argument("-f", "--format", choices=["gtf", "gff3", "gmap"], default="gtf", help="Output format")
+    parser.add_argument("-d", "--dialect", choices=["ensembl", "ncbi"], default="ensembl", help="Style of gff3")
+    parser.add_argument("--genes", type=int, default=1000, help="Number of genes")
+    parser.add_argument("--isoforms", type=int, default=3, help="Number of transcripts per gene")
+    parser.add_argument("--exons", type=int, default=8, help="Number of exons per transcript")
+    parser.add_argument("--chromosomes", type=int, default=5, help="Number of chromosomes")
+    parser.add_argument("--reads", type=int, default=10000, help="Number of reads of gmap output")
+    parser.add_argument("--seed", type=int, default=42, help="Seed of the random generator")
+
+    if len(sys.argv[1:]) <= 0:
+        parser.print_help()
+        exit(0)
+
+    return parser.parse_args(sys.argv[1:])
+
+
+def main():
+    args = argument_parser()
+    SyntheticAnnotation(
+        genes=args.genes, isoforms=args.isoforms, exons=args.exons,
+        chromosomes=args.chromosomes, seed=args.seed
+    ).write(args.output, fmt=args.format, dialect=args.dialect, reads=args.reads)
+
+
+if __name__ == '__main__':
+    main()
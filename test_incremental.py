@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+u"""
+the patched outputs of --incremental are the same as a full conversion
+
+python -m pytest -q test_incremental.py
+"""
+import os
+
+from gtf2bed12 import Gtf2Bed12
+
+__author__ = "Zhang Yiming"
+__since__ = "2026.10.17"
+
+
+def child_first(first_exon=36572):
+    u"""
+    gff3 with the exons and CDS before their mRNA, and the mRNA before their gene
+    """
+    lines = ["##gff-version 3"]
+    for gene, start, count in (("GENE1", 17001, 2), ("GENE2", 50001, 1), ("GENE3", 90001, 2)):
+        for i, rna in enumerate(["%s.%d" % (gene, x + 1) for x in range(count)]):
+            begin = first_exon if gene == "GENE1" and i == 0 else start + 19571
+            exons = [(start, start + 175), (start + 3156, start + 3559 - i * 100), (begin, start + 19953)]
+            for j, (s, e) in enumerate(exons):
+                lines.append("1\tBestRefSeq\texon\t%d\t%d\t.\t-\t.\tID=exon-%s-%d;Parent=rna-%s" % (s, e, rna, j, rna))
+            for s, e in exons[1:]:
+                lines.append("1\tBestRefSeq\tCDS\t%d\t%d\t.\t-\t0\tID=cds-%s;Parent=rna-%s" % (s, e, rna, rna))
+            lines.append("1\tBestRefSeq\tmRNA\t%d\t%d\t.\t-\t.\tID=rna-%s;Parent=gene-%s" % (
+                start, start + 19953, rna, gene))
+        lines.append("1\tBestRefSeq\tgene\t%d\t%d\t.\t-\t.\tID=gene-%s;Name=%s" % (start, start + 19953, gene, gene))
+    return "\n".join(lines) + "\n"
+
+
+def convert(path, output, incremental):
+    Gtf2Bed12(str(path), str(output), incremental=incremental, progress=False).convert()
+    with open(str(output)) as r:
+        return r.read()
+
+
+def test_child_first_gff3(tmp_path):
+    gff = tmp_path / "child.gff3"
+    gff.write_text(child_first())
+    assert convert(gff, tmp_path / "patched.bed", True) == convert(gff, tmp_path / "full.bed", False)
+    # the manifest is removed if it falls back to a full conversion
+    assert os.path.exists(str(tmp_path / "patched.bed.manifest"))
+
+    # only GENE1 is changed, the others are copied from the first run
+    gff.write_text(child_first(first_exon=36600))
+    full = convert(gff, tmp_path / "full.bed", False)
+    assert convert(gff, tmp_path / "patched.bed", True) == full
+    assert os.path.exists(str(tmp_path / "patched.bed.manifest"))
+    assert full.count("rna-GENE1.1\t") == 1 and "0,3156,19599\n" in full